@@ -0,0 +1,170 @@
+"""
+Crawler throughput benchmark. Serves generated legal websites from a local HTTP server and crawls them either with
+WebSiteCrawlerScrapy.crawl_many (--target crawler) or end to end with SiteScraperDriver, including the writes of the
+pages and their metadata (--target driver). Reports pages/sec, the p50/p99 download latency of the pages, the peak
+RSS of the crawler processes and the CPU time per page, so that regressions can be caught offline.
+
+Every site is served on its own loopback address (127.0.0.2, ...), which Linux routes without configuration.
+
+Usage: python -m benchmarks.bench_crawler [--target crawler|driver] [--sites N] [--pages N] [--fanout N] ...
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+from typing import List
+
+from benchmarks.synthetic_site import DEFAULT_PORT, SyntheticSite, SyntheticSiteServer
+from drivers.crawler.utils.helper_methods import extract_domain
+from drivers.crawler.website_crawler_scrapy import PAGE_EVENT, WebSiteCrawlerScrapy
+
+
+class CrawlReport:
+    """
+    The measurements of a crawl.
+    """
+
+    def __init__(self):
+        self.pages = 0
+        self.errors = 0
+        self.latencies = []
+        self.start_time = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_mb = 0.0
+        self.usage_at_start = None
+
+    def start(self):
+        self.usage_at_start = get_cpu_seconds()
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        # The crawler processes are joined by now, so that their usage is included.
+        self.wall_seconds = time.perf_counter() - self.start_time
+        self.cpu_seconds = get_cpu_seconds() - self.usage_at_start
+        # ru_maxrss is in KB on Linux.
+        self.peak_rss_mb = max(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+                               resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) / 1024
+
+    def record(self, event: str, payload):
+        if event == PAGE_EVENT:
+            self.pages += 1
+            if payload.get('download_latency') is not None:
+                self.latencies.append(payload['download_latency'])
+        elif payload is not None:
+            self.errors += 1
+
+    def print(self):
+        latencies = sorted(self.latencies)
+        print(f'pages:            {self.pages}')
+        print(f'failed sites:     {self.errors}')
+        print(f'wall time:        {self.wall_seconds:.2f} s')
+        print(f'pages/sec:        {self.pages / self.wall_seconds:.1f}')
+        print(f'p50 latency:      {percentile(latencies, 50) * 1000:.1f} ms')
+        print(f'p99 latency:      {percentile(latencies, 99) * 1000:.1f} ms')
+        print(f'peak RSS:         {self.peak_rss_mb:.1f} MB')
+        print(f'CPU per page:     {self.cpu_seconds / max(1, self.pages) * 1000:.2f} ms')
+
+
+def get_cpu_seconds() -> float:
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def recording(crawl_many, report: CrawlReport):
+    # Records the events of crawl_many on their way to the caller.
+    def wrapper(*args, **kwargs):
+        for event, task_id, payload in crawl_many(*args, **kwargs):
+            report.record(event, payload)
+            yield event, task_id, payload
+    return wrapper
+
+
+def bench_crawler(urls: List[str], args, work_dir: str) -> CrawlReport:
+    tasks = [{
+        'start_urls': [url],
+        'allowed_domains': [extract_domain(url)],
+        'should_recurse': True,
+        'max_links': args.pages,
+        'download_pdfs': args.pdfs > 0,
+        'filter': '',
+        'pdf_dir': extract_domain(url)
+    } for url in urls]
+    report = CrawlReport()
+    crawl_many = recording(WebSiteCrawlerScrapy().crawl_many, report)
+    report.start()
+    for _ in crawl_many(tasks, num_processes=args.processes, spiders_per_process=args.spiders_per_process,
+                        files_store=os.path.join(work_dir, 'pdfs') if args.pdfs > 0 else None):
+        pass
+    report.stop()
+    return report
+
+
+def bench_driver(urls: List[str], args, work_dir: str) -> CrawlReport:
+    # SiteScraperDriver writes its temporary files to the working directory.
+    from drivers.runners.site_scraper_driver import SiteScraperDriver
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    csv_path = os.path.join(work_dir, 'site_scraper_input.csv')
+    with open(csv_path, 'w') as f:
+        f.write('url,jurisdiction,category\n')
+        f.writelines(f'{url},bench,site\n' for url in urls)
+    driver = SiteScraperDriver(csv_path, args.pages, True, args.pdfs > 0, os.path.join(work_dir, 'out'),
+                               args.spiders_per_process, -1, crawler_processes=args.processes,
+                               state_dir=os.path.join(work_dir, 'crawl_state'))
+    report = CrawlReport()
+    driver.scrapy_crawler.crawl_many = recording(driver.scrapy_crawler.crawl_many, report)
+    report.start()
+    try:
+        driver.run()
+    finally:
+        os.chdir(cwd)
+    report.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=('crawler', 'driver'), default='crawler')
+    parser.add_argument('--sites', type=int, default=4, help='The number of websites.')
+    parser.add_argument('--pages', type=int, default=200, help='The number of pages of each website.')
+    parser.add_argument('--fanout', type=int, default=10, help='The number of links from each page.')
+    parser.add_argument('--sections', type=int, default=40, help='The sections of each page (~1 KB each).')
+    parser.add_argument('--pdfs', type=int, default=0, help='The number of PDFs linked from each page.')
+    parser.add_argument('--pdf-size', type=int, default=100 * 1024, help='The size of each PDF in bytes.')
+    parser.add_argument('--slow-fraction', type=float, default=0.0, help='The fraction of slow pages.')
+    parser.add_argument('--slow-delay', type=float, default=0.5, help='The delay of the slow pages in seconds.')
+    parser.add_argument('--error-fraction', type=float, default=0.0, help='The fraction of failing pages.')
+    parser.add_argument('--processes', type=int, default=2, help='The number of crawler processes.')
+    parser.add_argument('--spiders-per-process', type=int, default=4, help='The spiders of each process.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    sites = [SyntheticSite(num_pages=args.pages, fanout=args.fanout, num_sections=args.sections,
+                           num_pdfs=args.pdfs, pdf_size=args.pdf_size, slow_fraction=args.slow_fraction,
+                           slow_delay=args.slow_delay, error_fraction=args.error_fraction, seed=i)
+             for i in range(args.sites)]
+    work_dir = tempfile.mkdtemp(prefix='crawler-bench-')
+    try:
+        with SyntheticSiteServer(sites, args.port) as server:
+            if args.target == 'crawler':
+                report = bench_crawler(server.urls, args, work_dir)
+            else:
+                report = bench_driver(server.urls, args, work_dir)
+        print(f'{args.target}: {args.sites} sites x {args.pages} pages, fan-out {args.fanout}, '
+              f'{args.sections} sections, {args.pdfs} PDFs per page')
+        report.print()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Micro-benchmark of the per-page extraction done by DecoverSpider.parse: the previous path (response.xpath for the
+body, BeautifulSoup for the text and the PDF links, response.xpath for the hyperlinks) against the single pass of
+extract_page. Both run on the same generated legal pages and must produce the same text.
+
+Usage: python -m benchmarks.bench_extraction [--pages N] [--repeat N]
+"""
+import argparse
+import time
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.legal_pages import generate_legal_page
+from drivers.crawler.utils.helper_methods import get_text_from_html, get_pdf_links
+from drivers.crawler.utils.html_extractor import extract_page
+
+# The number of sections of the generated pages, from a short notice to a long chapter of a code.
+PAGE_SIZES = (5, 40, 200)
+
+
+def previous_extraction(response: HtmlResponse):
+    text_html = response.xpath('//body').get()
+    text = get_text_from_html(text_html)
+    pdf_links = get_pdf_links(text_html, None)
+    links = [response.urljoin(link.extract()) for link in response.xpath('//a/@href')]
+    return text, links, pdf_links
+
+
+def single_pass_extraction(response: HtmlResponse):
+    return extract_page(response.text, response.url)
+
+
+def make_responses(num_pages: int, num_sections: int):
+    responses = []
+    for page_id in range(num_pages):
+        html = generate_legal_page(page_id, num_sections=num_sections)
+        # A new response per run, so that neither path benefits from the selector cached on it.
+        responses.append(lambda url=f'https://www.statutes.gov/title-{page_id}.html', body=html.encode():
+                         HtmlResponse(url=url, body=body, encoding='utf-8'))
+    return responses
+
+
+def time_extraction(extract, responses, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        pages = [make_response() for make_response in responses]
+        start = time.process_time()
+        for response in pages:
+            extract(response)
+        best = min(best, time.process_time() - start)
+    return best / len(responses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=20, help='The number of pages of each size.')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of runs, the best one is reported.')
+    args = parser.parse_args()
+
+    print(f'{"sections":>8} {"KB":>8} {"previous ms":>12} {"single ms":>10} {"speedup":>8}')
+    for num_sections in PAGE_SIZES:
+        responses = make_responses(args.pages, num_sections)
+        for make_response in responses:
+            response = make_response()
+            text, links, _ = previous_extraction(response)
+            page = single_pass_extraction(response)
+            assert page.text == text, f'The extracted text differs for {response.url}'
+            assert page.links == links, f'The extracted links differ for {response.url}'
+        size_kb = sum(len(make_response().body) for make_response in responses) / len(responses) / 1024
+        previous = time_extraction(previous_extraction, responses, args.repeat)
+        single = time_extraction(single_pass_extraction, responses, args.repeat)
+        print(f'{num_sections:>8} {size_kb:>8.1f} {previous * 1000:>12.2f} {single * 1000:>10.2f} '
+              f'{previous / single:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
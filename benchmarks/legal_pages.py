@@ -0,0 +1,58 @@
+# Generates representative legal web pages (statutes, case listings) for the benchmarks.
+import random
+
+STATUTE_WORDS = ('shall', 'person', 'court', 'section', 'pursuant', 'subsection', 'provided', 'that', 'any',
+                 'order', 'notwithstanding', 'the', 'of', 'and', 'act', 'commission', 'penalty', 'may', 'be',
+                 'liable', 'thereof', 'in', 'accordance', 'with', 'rules', 'made', 'under', 'this', 'chapter')
+
+
+def random_sentence(rng: random.Random, num_words: int = 25) -> str:
+    return ' '.join(rng.choice(STATUTE_WORDS) for _ in range(num_words)).capitalize() + '.'
+
+
+def generate_legal_page(page_id: int, num_sections: int = 40, num_links: int = 60, num_pdfs: int = 5,
+                        links_to=None, seed: int = 0, include_navigation: bool = True) -> str:
+    """
+    Generates the HTML of a statute-like page: a navigation bar, a table of contents, numbered sections with
+    nested sub-clauses, footnotes, a table, inline scripts and styles, comments and links to PDFs.
+    :param page_id: The id of the page, used in its title.
+    :param num_sections: The number of sections, which drives the size of the page.
+    :param num_links: The number of hyperlinks to other pages.
+    :param num_pdfs: The number of hyperlinks to PDFs.
+    :param links_to: The hrefs of the hyperlinks, generated if None.
+    :param seed: The seed of the generator.
+    :param include_navigation: Whether to include the navigation bar, which links outside of the generated pages.
+    :return: The HTML of the page.
+    """
+    rng = random.Random(seed * 100003 + page_id)
+    links_to = links_to if links_to is not None else [f'/statutes/title-{rng.randint(1, 50)}/section-{i}.html'
+                                                      for i in range(num_links)]
+    parts = ['<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">',
+             f'<title>Title {page_id} &mdash; Code of Laws</title>',
+             '<style>body { font-family: serif; } .nav a { margin: 0 4px; }</style>',
+             '<script>window.dataLayer = window.dataLayer || []; function gtag(){dataLayer.push(arguments);}</script>',
+             '</head><body>']
+    if include_navigation:
+        parts.append('<div class="nav"><a href="/">Home</a> | <a href="/statutes/">Statutes</a> | '
+                     '<a href="/cases/?page=1&amp;sort=date">Cases</a></div>')
+    parts += [f'<h1>Title {page_id}.  General Provisions</h1>',
+              '<!-- table of contents -->',
+              '<ul class="toc">']
+    for i, href in enumerate(links_to):
+        parts.append(f'<li><a href="{href}">&sect;&nbsp;{page_id}-{i}</a></li>')
+    parts.append('</ul>')
+    for i in range(num_sections):
+        parts.append(f'<div class="section"><h2 id="s{i}">Section {page_id}-{i}.   {random_sentence(rng, 6)}</h2>')
+        parts.append(f'<p>(a) {random_sentence(rng)} <em>{random_sentence(rng, 5)}</em><sup>[{i}]</sup></p>')
+        parts.append('<ol>' + ''.join(f'<li>({chr(97 + j)})  {random_sentence(rng, 15)}</li>' for j in range(4))
+                     + '</ol>')
+        if i % 10 == 0:
+            parts.append('<table><tr><th>Offence</th><th>Penalty</th></tr>' +
+                         ''.join(f'<tr><td>{random_sentence(rng, 4)}</td><td>${rng.randint(100, 9999)}</td></tr>'
+                                 for _ in range(5)) + '</table>')
+        parts.append('<script type="text/javascript">trackSection(' + str(i) + ');</script></div>\n')
+    for i in range(num_pdfs):
+        parts.append(f'<p><a href="/documents/act-{page_id}-{i}.pdf?download=1">Download Act {i} (PDF)</a></p>')
+    parts.append(f'<footer><p>&copy; 2023 Legislature. Last amended {rng.randint(1990, 2023)}.</p></footer>')
+    parts.append('</body></html>')
+    return '\n'.join(parts)
@@ -0,0 +1,147 @@
+# Serves generated legal websites from a local HTTP server, for the crawler benchmarks.
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Event, Process
+from typing import List
+
+from benchmarks.legal_pages import generate_legal_page
+
+PAGE_PATH_PATTERN = re.compile(r'^/p/(\d+)\.html$')
+PDF_PATH_PATTERN = re.compile(r'^/documents/act-(\d+)-(\d+)\.pdf$')
+# Every site is served on its own loopback address (127.0.0.2, 127.0.0.3, ...), so that each one is a separate
+# host with its own allowed domain, site name and download slot.
+FIRST_LOOPBACK_HOST = 2
+DEFAULT_PORT = 18765
+SERVER_START_TIMEOUT_SECONDS = 30
+
+
+class SyntheticSite:
+    """
+    A deterministic legal website: num_pages statute pages, each linking to the next @fanout pages of a tree that
+    covers the whole site, with optional PDFs, slow pages and failing pages.
+    """
+
+    def __init__(self, num_pages: int = 200, fanout: int = 10, num_sections: int = 40, num_pdfs: int = 0,
+                 pdf_size: int = 100 * 1024, slow_fraction: float = 0.0, slow_delay: float = 0.5,
+                 error_fraction: float = 0.0, seed: int = 0):
+        """
+        :param num_pages: The number of pages.
+        :param fanout: The number of links from each page to other pages.
+        :param num_sections: The number of sections of each page, which drives the page size (about 1 KB each).
+        :param num_pdfs: The number of PDFs linked from each page.
+        :param pdf_size: The size of each PDF in bytes.
+        :param slow_fraction: The fraction of the pages that are served after @slow_delay seconds.
+        :param slow_delay: The delay of the slow pages.
+        :param error_fraction: The fraction of the pages that fail with a 500.
+        :param seed: The seed of the generator.
+        """
+        self.num_pages = num_pages
+        self.fanout = fanout
+        self.num_sections = num_sections
+        self.num_pdfs = num_pdfs
+        self.pdf_size = pdf_size
+        self.slow_fraction = slow_fraction
+        self.slow_delay = slow_delay
+        self.error_fraction = error_fraction
+        self.seed = seed
+
+    def links(self, page_id: int) -> List[str]:
+        return [f'/p/{(page_id * self.fanout + i + 1) % self.num_pages}.html' for i in range(self.fanout)]
+
+    def is_slow(self, page_id: int) -> bool:
+        return random.Random(f'slow-{self.seed}-{page_id}').random() < self.slow_fraction
+
+    def is_error(self, page_id: int) -> bool:
+        # The home page never fails, so that the crawl can start.
+        return page_id != 0 and random.Random(f'error-{self.seed}-{page_id}').random() < self.error_fraction
+
+    @lru_cache(maxsize=4096)
+    def page(self, page_id: int) -> bytes:
+        return generate_legal_page(page_id, num_sections=self.num_sections, num_pdfs=self.num_pdfs,
+                                   links_to=self.links(page_id), seed=self.seed,
+                                   include_navigation=False).encode('utf-8')
+
+    @lru_cache(maxsize=1)
+    def pdf(self) -> bytes:
+        header = b'%PDF-1.4\n'
+        return header + b'0' * max(0, self.pdf_size - len(header))
+
+
+def make_request_handler(site: SyntheticSite):
+    class SyntheticSiteRequestHandler(BaseHTTPRequestHandler):
+        # Keep-alive, as real servers do.
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):  # noqa
+            path = self.path.split('?')[0]
+            if path == '/':
+                path = '/p/0.html'
+            page_match = PAGE_PATH_PATTERN.match(path)
+            pdf_match = PDF_PATH_PATTERN.match(path)
+            if page_match and int(page_match.group(1)) < site.num_pages:
+                page_id = int(page_match.group(1))
+                if site.is_slow(page_id):
+                    time.sleep(site.slow_delay)
+                if site.is_error(page_id):
+                    self.__respond(500, b'Internal Server Error', 'text/plain')
+                else:
+                    self.__respond(200, site.page(page_id), 'text/html; charset=utf-8')
+            elif pdf_match and int(pdf_match.group(2)) < site.num_pdfs:
+                self.__respond(200, site.pdf(), 'application/pdf')
+            else:
+                self.__respond(404, b'Not Found', 'text/plain')
+
+        def __respond(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # noqa
+            pass
+
+    return SyntheticSiteRequestHandler
+
+
+def serve_sites(sites: List[SyntheticSite], port: int, ready):
+    servers = []
+    for i, site in enumerate(sites):
+        server = ThreadingHTTPServer((f'127.0.0.{FIRST_LOOPBACK_HOST + i}', port), make_request_handler(site))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    ready.set()
+    threading.Event().wait()
+
+
+class SyntheticSiteServer:
+    """
+    Serves the sites from a separate process, so that the server does not count towards the CPU time and memory
+    of the crawl. Use it as a context manager.
+    """
+
+    def __init__(self, sites: List[SyntheticSite], port: int = DEFAULT_PORT):
+        self.sites = sites
+        self.port = port
+        self.process = None
+
+    @property
+    def urls(self) -> List[str]:
+        return [f'http://127.0.0.{FIRST_LOOPBACK_HOST + i}:{self.port}/' for i in range(len(self.sites))]
+
+    def __enter__(self):
+        ready = Event()
+        self.process = Process(target=serve_sites, args=(self.sites, self.port, ready), daemon=True)
+        self.process.start()
+        if not ready.wait(SERVER_START_TIMEOUT_SECONDS):
+            raise Exception('The synthetic site server did not start.')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.process.terminate()
+        self.process.join()
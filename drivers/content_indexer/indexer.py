@@ -1,13 +1,20 @@
 # Indexer reads data from a database and indexes it into the search engine.
 # To start with, we will assume that there is a single directory in S3 where all the PDFs are stored.
 # These PDFs will then be sent to our Search Index in Elastic.
+import logging
+import os
 from logging.config import dictConfig
+from typing import Iterator, Optional, Tuple
 
 from drivers.utilities.file import File
-from drivers.utilities.s3_client import S3Client
+from drivers.utilities.page_shards import INDEX_EXTENSION, is_shard, iter_shard, read_index
+from drivers.utilities.s3_client import S3Client, extract_bucket_and_key_from_s3_url, get_directory_prefix
 
 MAX_DOCUMENTS_TO_INDEX = 1
 
+# The documents are read from a local copy while they are not modified in S3.
+DEFAULT_CACHE_DIR = os.path.join('crawl_state', 'file_cache')
+
 dictConfig({
     'version': 1,
     'formatters': {'default': {
@@ -29,13 +36,13 @@ class Indexer:
     """
     Indexer reads data from a database and indexes it into the search engine.
     """
-    def __init__(self, src_dir: str, es_end_point: str):
+    def __init__(self, src_dir: str, es_end_point: str, cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
         self.num_docs_indexed = 0
         self.source_dir = src_dir
         # For now, we will hit the POST API on Decover Master.
         # @app.route('/api/v1/documents', methods=['POST'])
         self.es_end_point = es_end_point
-        self.file_reader = File()
+        self.file_reader = File(cache_dir=cache_dir)
         self.s3_client = S3Client()
         self.file_to_contents_map = {}
 
@@ -56,17 +63,36 @@ class Indexer:
         return self.file_to_contents_map
 
     def __read_documents(self):
-        # Read all the files from the source directory in S3.
-        files = self.s3_client.list_files(self.source_dir)
-        # Iterate over the files and index them.
-        for file in files:
-            file_path = f'{self.source_dir}/{file}'
-            contents = self.file_reader.read(file_path)
-            self.file_to_contents_map[file] = contents
-            self.num_docs_indexed += 1
-            if self.num_docs_indexed == MAX_DOCUMENTS_TO_INDEX:
-                break
+        # Read all the files from the source directory in S3. They are listed page by page as they are read,
+        # and the subdirectories (e.g. the categories and websites of a jurisdiction) are listed in parallel.
+        _, prefix = extract_bucket_and_key_from_s3_url(self.source_dir)
+        prefix = get_directory_prefix(prefix)
+        # Iterate over the files and index them. The pages packed into a shard are indexed one by one, and the
+        # sidecar index of a shard is read together with it.
+        for s3_object in self.s3_client.walk(self.source_dir):
+            file = s3_object.key[len(prefix):]
+            if file.endswith(INDEX_EXTENSION):
+                continue
+            if is_shard(file):
+                documents = self.__read_shard(s3_object.url, file)
+            else:
+                documents = iter([(file, self.file_reader.read(s3_object.url))])
+            for document, contents in documents:
+                self.file_to_contents_map[document] = contents
+                self.num_docs_indexed += 1
+                if self.num_docs_indexed == MAX_DOCUMENTS_TO_INDEX:
+                    return
 
+    def __read_shard(self, shard_url: str, file: str) -> Iterator[Tuple[str, str]]:
+        # Streams the pages of a shard. Each page is keyed by the URL of its record relative to the source
+        # directory (e.g. site/shards/part-1.jsonl.zst#0-512), which read_record() reads on its own.
+        locations = read_index(self.file_reader, shard_url)
+        for record in iter_shard(self.file_reader, shard_url):
+            location = locations.get(record['url'])
+            if location is None:
+                logging.warning(f'{record["url"]} is not in the index of {shard_url}, skipping it.')
+                continue
+            yield f'{file}#{location.offset}-{location.length}', record['content']
 
     def __index_to_elastic(self):
         pass
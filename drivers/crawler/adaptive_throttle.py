@@ -0,0 +1,92 @@
+import logging
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+# The response codes with which a host asks us to slow down.
+THROTTLE_HTTP_CODES = {429, 503}
+
+
+class AdaptiveThrottle:
+    """
+    A downloader middleware that adapts the concurrency and the delay of every download slot (i.e. host) to
+    how the host behaves, AIMD style:
+    * Every slot starts at ADAPTIVE_THROTTLE_START_CONCURRENCY concurrent requests.
+    * While the average latency stays under ADAPTIVE_THROTTLE_TARGET_LATENCY and the slot is saturated, its
+      concurrency grows by one, up to CONCURRENT_REQUESTS_PER_DOMAIN, and its delay is halved.
+    * When the average latency goes over the target, or a request fails, the concurrency shrinks by one.
+    * On a 429 or 503 the concurrency is halved and the delay doubled (or set to Retry-After), up to
+      ADAPTIVE_THROTTLE_MAX_DELAY.
+    Unlike AutoThrottle, which only adjusts the delay from latencies, this also reacts to error rates and
+    raises the concurrency of hosts that answer fast.
+    Refer: https://docs.scrapy.org/en/2.9/topics/autothrottle.html
+    """
+
+    # The weight of the latest latency in the moving average.
+    LATENCY_SMOOTHING = 0.3
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_THROTTLE_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.target_latency = settings.getfloat('ADAPTIVE_THROTTLE_TARGET_LATENCY', 1.0)
+        self.start_concurrency = settings.getint('ADAPTIVE_THROTTLE_START_CONCURRENCY', 2)
+        self.max_concurrency = settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        self.min_delay = settings.getfloat('DOWNLOAD_DELAY')
+        self.max_delay = settings.getfloat('ADAPTIVE_THROTTLE_MAX_DELAY', 60.0)
+        self.latencies = {}
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def request_reached_downloader(self, request, spider):
+        key, slot = self.__get_slot(request)
+        if slot is not None and key not in self.latencies:
+            self.latencies[key] = None
+            slot.concurrency = min(self.start_concurrency, self.max_concurrency)
+
+    def process_response(self, request, response, spider):
+        key, slot = self.__get_slot(request)
+        if slot is None:
+            return response
+        if response.status in THROTTLE_HTTP_CODES:
+            retry_after = response.headers.get('Retry-After')
+            self.__back_off(key, slot, retry_after.decode('latin-1') if retry_after else None)
+            return response
+        latency = request.meta.get('download_latency')
+        if latency is None:
+            return response
+        average = self.latencies.get(key)
+        average = latency if average is None else \
+            self.LATENCY_SMOOTHING * latency + (1 - self.LATENCY_SMOOTHING) * average
+        self.latencies[key] = average
+        if average > self.target_latency:
+            slot.concurrency = max(1, slot.concurrency - 1)
+        else:
+            slot.delay = max(self.min_delay, slot.delay / 2)
+            # Only grow the concurrency of hosts that actually use all of it.
+            if len(slot.active) >= slot.concurrency:
+                slot.concurrency = min(self.max_concurrency, slot.concurrency + 1)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key, slot = self.__get_slot(request)
+        if slot is not None:
+            slot.concurrency = max(1, slot.concurrency - 1)
+            self.crawler.stats.inc_value('adaptive_throttle/errors')
+
+    def __back_off(self, key, slot, retry_after):
+        slot.concurrency = max(1, slot.concurrency // 2)
+        delay = max(slot.delay * 2, self.min_delay, 1.0)
+        if retry_after is not None and retry_after.strip().isdigit():
+            delay = max(delay, float(retry_after))
+        slot.delay = min(self.max_delay, delay)
+        self.crawler.stats.inc_value('adaptive_throttle/backoffs')
+        logging.info(f'Backing off {key}: concurrency={slot.concurrency}, delay={slot.delay:.2f}s')
+
+    def __get_slot(self, request):
+        key = request.meta.get('download_slot')
+        return key, self.crawler.engine.downloader.slots.get(key)
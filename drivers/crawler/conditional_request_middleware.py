@@ -0,0 +1,39 @@
+from scrapy import signals
+
+from drivers.utilities.validator_store import ValidatorStore
+
+
+class ConditionalRequestMiddleware:
+    """
+    A downloader middleware that turns requests for already seen URLs into conditional requests, using the
+    validators that were stored for them in the spider's ValidatorStore. The stored validators are made
+    available to the spider in request.meta['validators'], so that it can handle a 304 response.
+    Refer: https://docs.scrapy.org/en/2.9/topics/downloader-middleware.html
+    """
+
+    def __init__(self):
+        self.validator_store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls()
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        if getattr(spider, 'validator_store_path', None):
+            self.validator_store = ValidatorStore(spider.validator_store_path)
+
+    def spider_closed(self, spider):
+        if self.validator_store is not None:
+            self.validator_store.close()
+
+    def process_request(self, request, spider):
+        if self.validator_store is None or 'validators' in request.meta:
+            return None
+        validators = self.validator_store.get(request.url)
+        request.meta['validators'] = validators
+        for name, value in self.validator_store.conditional_headers(request.url, validators).items():
+            request.headers.setdefault(name, value)
+        return None
@@ -0,0 +1,31 @@
+from scrapy import signals
+from scrapy.utils.httpobj import urlparse_cached
+
+from drivers.utilities.metrics import DOWNLOAD_LATENCY, DOWNLOADED_BYTES, PAGES_FETCHED, RESPONSES, \
+    get_status_class
+
+
+class CrawlMetrics:
+    """
+    An extension that counts the responses, bytes, per-host download latencies and pages of a spider in the
+    metrics of its crawler process, which ships them to the parent process (see crawler_process_main).
+    Refer: https://docs.scrapy.org/en/2.9/topics/extensions.html
+    """
+
+    def __init__(self, crawler):
+        crawler.signals.connect(self.response_received, signal=signals.response_received)
+        crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def response_received(self, response, request, spider):
+        RESPONSES.inc(status_class=get_status_class(response.status))
+        DOWNLOADED_BYTES.inc(len(response.body))
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            DOWNLOAD_LATENCY.observe(latency, host=urlparse_cached(request).hostname or '')
+
+    def item_scraped(self, item, response, spider):
+        PAGES_FETCHED.inc()
@@ -1,12 +1,42 @@
+import heapq
+import itertools
 import logging
+from collections import defaultdict
 
 import scrapy
+from scrapy import signals
+from scrapy.exceptions import CloseSpider, DontCloseSpider
+from twisted.internet import threads
 
-from drivers.crawler.utils.helper_methods import get_text_from_html, get_pdf_links, download_pdf
+from drivers.crawler.frontier import Frontier
+from drivers.crawler.pdf_pipeline import PDF_LINKS_FIELD
+from drivers.crawler.sitemaps import SitemapEntry, get_robots_txt_url, get_sitemap_body, \
+    get_sitemap_urls_from_robots, read_sitemap
+from drivers.crawler.url_filter import UrlFilter, TRAPS
+from drivers.crawler.utils.html_extractor import extract_page, is_pdf_link
+from drivers.utilities.metrics import PARSE_TIME
+from drivers.utilities.validator_store import ValidatorStore, get_validators
+
+# The crawler stats key prefix of the dropped links, e.g. decover/dropped/duplicate.
+DROPPED_STATS_PREFIX = 'decover/dropped/'
+DUPLICATE = 'duplicate'
+# The reason the spider is closed with once it crawled max_links pages.
+PAGE_BUDGET_REACHED = 'page_budget_reached'
+# robots.txt and the sitemaps are downloaded before any page.
+DISCOVERY_PRIORITY = 100
+# The priority of the sitemap URLs whose <lastmod> is later than their last download, and earlier.
+CHANGED_URL_PRIORITY = 2
+UNCHANGED_URL_PRIORITY = -1
+# The maximum number of sitemaps and of sitemap URLs read for a site.
+MAX_SITEMAPS = 100
+MAX_SITEMAP_URLS = 100000
+SITEMAP_URLS_STATS_KEY = 'decover/sitemap_urls'
 
 
 class DecoverSpider(scrapy.Spider):
     name = 'decover_spider'
+    # 304 Not Modified responses to conditional requests are handled by parse().
+    handle_httpstatus_list = [304]
 
     def __init__(self,
                  allowed_domains=None,
@@ -14,8 +44,14 @@ class DecoverSpider(scrapy.Spider):
                  should_recurse=True,
                  max_links=10,
                  download_pdfs=False,
-                 file_name='items.jsonl',
                  filter=None,
+                 item_queue=None,
+                 task_id=None,
+                 validator_store_path=None,
+                 frontier_dir=None,
+                 page_parser=None,
+                 pdf_dir='pdfs',
+                 use_sitemaps=True,
                  *args, **kwargs):
         super(DecoverSpider, self).__init__(*args, **kwargs)
         self.allowed_domains = allowed_domains
@@ -23,39 +59,263 @@ class DecoverSpider(scrapy.Spider):
         self.should_recurse = should_recurse
         self.max_links = max_links
         self.should_download_pdf = download_pdfs
-        self.file = file_name
+        # The directory of FILES_STORE the PdfPipeline stores the PDFs of this site in.
+        self.pdf_dir = pdf_dir
         self.filter = filter
+        # The queue through which ItemQueuePipeline streams the pages back to the driver.
+        self.item_queue = item_queue
+        self.task_id = task_id
+        # The ValidatorStore used by ConditionalRequestMiddleware. None disables conditional requests.
+        self.validator_store_path = validator_store_path
+        # The frontier of the site. When frontier_dir is set it is persisted there, so that an interrupted
+        # crawl resumes on the next run and URLs that were never crawled before go first.
+        self.frontier = Frontier(frontier_dir)
+        # Decides which links are followed: on the allowed domains, matching the filter and not a trap.
+        self.url_filter = UrlFilter(allowed_domains, filter)
+        # The PageParser that parses the pages off the reactor thread. None parses them inline.
+        self.page_parser = page_parser
+        # The requests that were scheduled and have not completed yet. They are counted against the page
+        # budget, so that no more requests are scheduled than pages can still be crawled.
+        self.in_flight = 0
+        # The pending requests of the frontier that were not scheduled yet, highest priority first.
+        self.backlog = []
+        self.backlog_order = itertools.count()
+        # Seed the frontier from robots.txt and the sitemaps of the site, if it is crawled recursively.
+        self.use_sitemaps = use_sitemaps
+        # The robots.txt and sitemap requests that have not completed yet. No page is scheduled until they
+        # did, so that the budget goes to the pages the sitemaps put first.
+        self.discovering = 0
+        self.sitemaps_requested = 0
+        self.sitemap_urls_added = 0
+        # Used to compare the <lastmod> of the sitemap URLs with their last download.
+        self.validator_store = ValidatorStore(validator_store_path) if validator_store_path else None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(DecoverSpider, cls).from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
+
+    def start_requests(self):
+        pending = self.frontier.pending()
+        if len(pending) > 0:
+            # Resume the interrupted crawl with the page budget it had left.
+            logging.info(f'Resuming the crawl of {self.start_urls} with {len(pending)} pending requests.')
+            self.max_links = int(self.frontier.get_state('max_links', self.max_links))
+        else:
+            pending = self.frontier.add(self.start_urls)
+            if self.should_recurse and self.use_sitemaps:
+                for robots_txt_url in sorted({get_robots_txt_url(url) for url in self.start_urls}):
+                    yield self.__discovery_request(robots_txt_url, self.parse_robots_txt)
+        self.__push(pending)
+        yield from self.__schedule()
+
+    def closed(self, reason):
+        dropped = {key[len(DROPPED_STATS_PREFIX):]: value for key, value in self.crawler.stats.get_stats().items()
+                   if key.startswith(DROPPED_STATS_PREFIX)}
+        logging.info(f'Finished crawling {self.start_urls}: dropped {dropped.get(DUPLICATE, 0)} duplicate and '
+                     f'{sum(dropped.get(trap, 0) for trap in TRAPS)} trap links ({dropped}).')
+        # A crawl that ran out of requests or page budget is done, the next run starts a new one.
+        if reason in ('finished', PAGE_BUDGET_REACHED):
+            self.frontier.reset()
+        self.frontier.close()
+        if self.validator_store is not None:
+            self.validator_store.close()
+
+    def request_dropped(self, request, spider):
+        # A request dropped by the scheduler never reaches parse() or the errback.
+        if spider is not self:
+            return
+        if 'frontier_url' in request.meta:
+            self.__complete(request.meta['frontier_url'])
+        elif request.meta.get('discovery'):
+            self.discovering -= 1
+        for next_request in self.__schedule():
+            self.crawler.engine.crawl(next_request)
+
+    def spider_idle(self, spider):
+        # Nothing is in progress, so no discovery request can still complete: crawl the backlog.
+        if spider is not self:
+            return
+        self.discovering = 0
+        requests = list(self.__schedule())
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        if len(requests) > 0:
+            raise DontCloseSpider
+
+    def parse_robots_txt(self, response):
+        robots_txt = response.text if isinstance(response, scrapy.http.TextResponse) else \
+            response.body.decode('utf-8', errors='ignore')
+        for request in self.__sitemap_requests(get_sitemap_urls_from_robots(robots_txt, response.url)):
+            yield request
+        self.discovering -= 1
+        yield from self.__schedule()
 
-    @property
-    def file_name(self):
-        return self.file
+    async def parse_sitemap(self, response):
+        body = get_sitemap_body(response)
+        entries, is_index = [], False
+        if body is None:
+            logging.warning(f'{response.url} is not a sitemap.')
+        else:
+            try:
+                # Large sitemaps are read off the reactor thread, as the pages are.
+                is_index, entries = await threads.deferToThread(self.__read_sitemap, body, response.url)
+            except Exception as exc:
+                logging.warning(f'Failed to read the sitemap {response.url}: {exc}')
+        if is_index:
+            for request in self.__sitemap_requests(entry.url for entry in entries):
+                yield request
+        else:
+            self.__seed(entries)
+        self.discovering -= 1
+        for request in self.__schedule():
+            yield request
 
-    def parse(self, response):  # noqa
+    async def parse(self, response):  # noqa
+        self.in_flight -= 1
         # Bail out if the page limit is reached.
         if self.max_links <= 0:
+            self.frontier.done(response.meta['frontier_url'], crawled=False)
             return
 
         logging.debug(f"Processing {response.url}")
-        # Step I: Extract the text from the webpage
-        text_html = response.xpath('//body').get()
+        self.max_links -= 1
+        self.frontier.set_state('max_links', self.max_links)
+        self.frontier.done(response.meta['frontier_url'])
+        if response.status == 304:
+            # The page did not change since the last run: skip the extraction and keep following the
+            # links that were stored with its validators.
+            yield {'url': response.url, 'content': None, 'not_modified': True,
+                   'download_latency': response.meta.get('download_latency')}
+            links = (response.meta.get('validators') or {}).get('links', [])
+            for request in self.__follow(links):
+                yield request
+            self.__check_budget()
+            return
 
-        # Step II: Create a dictionary to store the results for this page.
-        #          It will be a key-value pair of {url: text}.
-        text = get_text_from_html(text_html)
+        # Step I: Parse the webpage once, extracting its text, hyperlinks and PDF links together. The reactor
+        # keeps downloading the other pages while it is parsed.
+        if self.page_parser is not None:
+            page = await self.page_parser.parse(response.text, response.url, self.filter)
+        else:
+            with PARSE_TIME.time():
+                page = extract_page(response.text, response.url, self.filter)
+
+        # Step II: Follow all the hyperlinks in the same domain including pdfs as well, unless the PDFs are
+        # harvested by the PdfPipeline.
+        links = []
+        for url in page.links:
+            if self.should_download_pdf and is_pdf_link(url):
+                continue
+            reason = self.url_filter.check(url)
+            if reason is None:
+                links.append(url)
+            else:
+                self.crawler.stats.inc_value(DROPPED_STATS_PREFIX + reason)
+        for request in self.__follow(links):
+            yield request
+        # Step III: Create an item for the page. The validators and links are stored by the driver once the page
+        # is written, the PDFs are downloaded by the PdfPipeline.
+        item = {'url': response.url, 'content': page.text, 'not_modified': False,
+                'validators': get_validators(response.headers), 'links': links,
+                'download_latency': response.meta.get('download_latency')}
         if self.should_download_pdf:
-            pdf_links = get_pdf_links(text_html, self.filter)
-            for pdf_link in pdf_links:
-                download_pdf(pdf_link['href'])
-        result = {response.url: text}
-        self.max_links -= 1
+            item[PDF_LINKS_FIELD] = page.pdf_links
+        yield item
+        self.__check_budget()
 
-        # Step III: Follow all the hyperlinks in the same domain including pdfs as well.
+    def __follow(self, links):
         if self.should_recurse and self.max_links > 0:
-            for link in response.xpath('//a/@href'):
-                url = response.urljoin(link.extract())
-                # Check if the domain is allowed.
-                if any(domain in url for domain in self.allowed_domains):
-                    # Check if the filter is a prefix of the url.
-                    if self.filter in url:
-                        yield scrapy.Request(url, callback=self.parse)
-        yield result
+            added = self.frontier.add(links)
+            # The links that were already seen in this crawl, including other spellings of the same URL.
+            self.crawler.stats.inc_value(DROPPED_STATS_PREFIX + DUPLICATE, len(links) - len(added))
+            self.__push(added)
+        # The completed request freed a slot of the budget, even if this page had no new links.
+        yield from self.__schedule()
+
+    def __read_sitemap(self, body, url):
+        is_index, entries = read_sitemap(body, url)
+        if is_index:
+            return is_index, entries
+        return is_index, [(entry, self.__get_sitemap_priority(entry)) for entry in entries]
+
+    def __get_sitemap_priority(self, entry: SitemapEntry):
+        # Without a <lastmod> or an earlier download, the frontier decides.
+        if entry.last_modified is None or self.validator_store is None:
+            return None
+        validators = self.validator_store.get(entry.url)
+        if validators is None or validators['fetched_at'] is None:
+            return None
+        return CHANGED_URL_PRIORITY if entry.last_modified > validators['fetched_at'] else UNCHANGED_URL_PRIORITY
+
+    def __seed(self, entries):
+        urls_by_priority = defaultdict(list)
+        for entry, priority in entries[:max(0, MAX_SITEMAP_URLS - self.sitemap_urls_added)]:
+            reason = self.url_filter.check(entry.url)
+            if reason is None:
+                urls_by_priority[priority].append(entry.url)
+            else:
+                self.crawler.stats.inc_value(DROPPED_STATS_PREFIX + reason)
+        for priority, urls in urls_by_priority.items():
+            added = self.frontier.add(urls, priority)
+            self.sitemap_urls_added += len(added)
+            self.crawler.stats.inc_value(SITEMAP_URLS_STATS_KEY, len(added))
+            self.__push(added)
+
+    def __sitemap_requests(self, sitemap_urls):
+        for sitemap_url in sitemap_urls:
+            # Sitemaps on other hosts would be dropped by the OffsiteMiddleware.
+            if self.sitemaps_requested >= MAX_SITEMAPS or not self.url_filter.is_allowed_host(sitemap_url):
+                continue
+            self.sitemaps_requested += 1
+            yield self.__discovery_request(sitemap_url, self.parse_sitemap)
+
+    def __discovery_request(self, url, callback):
+        self.discovering += 1
+        return scrapy.Request(url, callback=callback, errback=self.__on_discovery_error, priority=DISCOVERY_PRIORITY,
+                              dont_filter=True, meta={'discovery': True})
+
+    def __on_discovery_error(self, failure):
+        request = failure.request
+        logging.debug(f'Failed to download {request.url}: {failure.value}')
+        if request.callback == self.parse_robots_txt:
+            # Without robots.txt, try the default sitemap.
+            yield from self.__sitemap_requests(get_sitemap_urls_from_robots('', request.url))
+        self.discovering -= 1
+        yield from self.__schedule()
+
+    def __push(self, pending):
+        for url, priority in pending:
+            heapq.heappush(self.backlog, (-priority, next(self.backlog_order), url))
+
+    def __schedule(self):
+        # Only schedule the requests the remaining page budget can still pay for. The others stay in the
+        # backlog, in case a scheduled request fails, and in the frontier, in case the crawl is interrupted.
+        if self.discovering > 0:
+            return
+        while len(self.backlog) > 0 and self.in_flight < self.max_links:
+            priority, _, url = heapq.heappop(self.backlog)
+            self.in_flight += 1
+            yield self.__request(url, -priority)
+
+    def __check_budget(self):
+        # Close the spider as soon as the budget is spent, rather than waiting for the backlog to drain.
+        if self.max_links <= 0:
+            raise CloseSpider(PAGE_BUDGET_REACHED)
+
+    def __complete(self, url):
+        self.in_flight -= 1
+        self.frontier.done(url, crawled=False)
+
+    def __request(self, url, priority):
+        # The URL is kept in the meta, as it was added to the frontier, so that it can be removed from the
+        # pending requests even if the request was redirected.
+        return scrapy.Request(url, callback=self.parse, errback=self.__on_error, priority=priority,
+                              dont_filter=True, meta={'frontier_url': url})
+
+    def __on_error(self, failure):
+        self.__complete(failure.request.meta['frontier_url'])
+        # Spend the freed slot of the budget on the next request of the backlog.
+        yield from self.__schedule()
@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import sqlite3
+from typing import List, Optional, Tuple
+
+from drivers.crawler.utils.helper_methods import get_canonical_url
+
+# The number of URLs a Bloom filter is sized for, and the false positive rate at that size. The filters have
+# a fixed size (about 1.8 MB with these values), so memory and disk use stay bounded for any site.
+BLOOM_CAPACITY = 1_000_000
+BLOOM_ERROR_RATE = 0.001
+
+# The files of a frontier directory: the URLs crawled in any run, the URLs seen in the current crawl and the
+# pending requests (and state) of the current crawl.
+HISTORY_FILE_NAME = 'history.bloom'
+SEEN_FILE_NAME = 'seen.bloom'
+PENDING_FILE_NAME = 'pending.db'
+
+# The priority of requests for URLs that were never crawled in any run.
+NEW_URL_PRIORITY = 1
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter of strings, optionally backed by a memory-mapped file so that it survives
+    process restarts. A key that was added is always reported as present; a key that was not added is
+    wrongly reported as present with a probability of about @error_rate while the filter holds fewer than
+    @capacity keys.
+    """
+
+    def __init__(self, path: Optional[str] = None, capacity: int = BLOOM_CAPACITY,
+                 error_rate: float = BLOOM_ERROR_RATE):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        num_bytes = (self.num_bits + 7) // 8
+        self.file = None
+        if path is None:
+            self.bits = bytearray(num_bytes)
+            return
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size != num_bytes:
+            if size > 0:
+                logging.warning(f'Resetting Bloom filter {path} as it was created with a different size.')
+                self.file.truncate(0)
+            self.file.truncate(num_bytes)
+        self.bits = mmap.mmap(self.file.fileno(), num_bytes)
+
+    def __positions(self, key: str):
+        # Double hashing: the k bit positions are derived from the two halves of a single MD5 digest.
+        digest = hashlib.md5(key.encode()).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.__positions(key))
+
+    def add(self, key: str) -> bool:
+        """
+        Adds the key to the filter.
+        :param key: The key to add.
+        :return: True if the key was not present before.
+        """
+        added = False
+        for position in self.__positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        return added
+
+    def clear(self) -> None:
+        self.bits[:] = bytes(len(self.bits))
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.bits.flush()
+            self.bits.close()
+            self.file.close()
+            self.file = None
+
+
+class Frontier:
+    """
+    The crawl frontier of a site. It holds the requests that were discovered but not crawled yet, a Bloom
+    filter of the URLs seen in the current crawl and a Bloom filter of the URLs crawled in any earlier crawl.
+    When backed by a directory every change is written to disk as it happens, so a crawl that is interrupted,
+    even by a killed process, resumes where it left off on the next run. Without a directory it lives in
+    memory and only de-duplicates the links of a single crawl.
+    """
+
+    def __init__(self, frontier_dir: Optional[str] = None):
+        self.frontier_dir = frontier_dir
+        if frontier_dir is None:
+            self.seen = BloomFilter()
+            self.history = None
+            db_path = ':memory:'
+        else:
+            os.makedirs(frontier_dir, exist_ok=True)
+            self.seen = BloomFilter(os.path.join(frontier_dir, SEEN_FILE_NAME))
+            self.history = BloomFilter(os.path.join(frontier_dir, HISTORY_FILE_NAME))
+            db_path = os.path.join(frontier_dir, PENDING_FILE_NAME)
+        self.connection = sqlite3.connect(db_path, timeout=30)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS pending (url TEXT PRIMARY KEY, priority INTEGER)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)')
+
+    def add(self, urls: List[str], priority: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Adds the URLs that were not seen in the current crawl to the pending requests.
+        :param urls: The URLs to add.
+        :param priority: The priority of the URLs. If None, URLs that were never crawled in any run have a
+                         higher priority.
+        :return: The (url, priority) of every added URL.
+        """
+        added = []
+        for url in urls:
+            canonical_url = get_canonical_url(url)
+            if not self.seen.add(canonical_url):
+                continue
+            if priority is not None:
+                added.append((url, priority))
+                continue
+            is_new = self.history is not None and canonical_url not in self.history
+            added.append((url, NEW_URL_PRIORITY if is_new else 0))
+        if len(added) > 0:
+            with self.connection:
+                self.connection.executemany('INSERT OR REPLACE INTO pending VALUES (?, ?)', added)
+        return added
+
+    def pending(self) -> List[Tuple[str, int]]:
+        """
+        Returns the (url, priority) of the requests that were not crawled yet, highest priority first.
+        """
+        return self.connection.execute('SELECT url, priority FROM pending ORDER BY priority DESC').fetchall()
+
+    def done(self, url: str, crawled: bool = True) -> None:
+        """
+        Removes the URL from the pending requests.
+        :param url: The URL as it was added.
+        :param crawled: Whether the URL was crawled, in which case it is remembered for later runs.
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM pending WHERE url = ?', (url,))
+        if crawled and self.history is not None:
+            self.history.add(get_canonical_url(url))
+
+    def get_state(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.connection.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key: str, value) -> None:
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO state VALUES (?, ?)', (key, str(value)))
+
+    def reset(self) -> None:
+        """
+        Forgets the pending requests, the state and the seen URLs of a finished crawl, so that the next run
+        starts a new crawl. The history of crawled URLs is kept.
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM pending')
+            self.connection.execute('DELETE FROM state')
+        self.seen.clear()
+
+    def close(self) -> None:
+        self.connection.close()
+        self.seen.close()
+        if self.history is not None:
+            self.history.close()
@@ -0,0 +1,30 @@
+from itemadapter import ItemAdapter
+from twisted.internet import reactor, threads
+from twisted.python.threadpool import ThreadPool
+
+from drivers.crawler.website_crawler_scrapy import PAGE_EVENT
+
+
+class ItemQueuePipeline:
+    """
+    A pipeline that streams the scraped items back to the parent process over the spider's item queue.
+    The queue is bounded, so a slow consumer blocks the pipeline, which in turn makes Scrapy stop
+    scheduling new downloads for the spider (backpressure) without blocking the reactor thread.
+    Refer: https://docs.scrapy.org/en/2.9/topics/item-pipeline.html
+    """
+    def __init__(self):
+        self.thread_pool = None
+
+    def open_spider(self, spider):
+        # A dedicated thread keeps blocked puts from starving the reactor's shared thread pool (DNS etc.).
+        self.thread_pool = ThreadPool(minthreads=1, maxthreads=1, name=f'item-queue-{spider.task_id}')
+        self.thread_pool.start()
+
+    def close_spider(self, spider):
+        self.thread_pool.stop()
+
+    def process_item(self, item, spider):
+        message = (PAGE_EVENT, spider.task_id, ItemAdapter(item).asdict())
+        deferred = threads.deferToThreadPool(reactor, self.thread_pool, spider.item_queue.put, message)
+        deferred.addCallback(lambda _: item)
+        return deferred
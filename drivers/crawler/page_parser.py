@@ -0,0 +1,69 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from twisted.internet import defer, threads
+from twisted.python.threadpool import ThreadPool
+
+from drivers.crawler.utils.html_extractor import ExtractedPage, extract_page
+from drivers.utilities.metrics import PARSE_TIME
+
+# Parse the pages in a pool of threads of the crawler process. lxml releases the GIL while it parses, and the
+# reactor keeps getting the GIL while the tree is walked, so downloads go on while the pages are parsed.
+THREAD_MODE = 'thread'
+# Parse the pages in a pool of worker processes, for CPU parallelism beyond the GIL when the pages are large.
+PROCESS_MODE = 'process'
+
+
+class PageParser:
+    """
+    Runs extract_page off the reactor thread of a crawler process, so that parsing a large page does not stall
+    the network I/O of every in-flight request of the process. It is shared by all the spiders of the process.
+    """
+
+    def __init__(self, workers: int = 2, mode: str = THREAD_MODE):
+        """
+        :param workers: The number of pages parsed at once.
+        :param mode: THREAD_MODE or PROCESS_MODE.
+        """
+        if mode not in (THREAD_MODE, PROCESS_MODE):
+            raise ValueError(f'Unknown page parser mode: {mode}')
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.thread_pool = None
+        self.process_pool = None
+
+    def start(self):
+        # A dedicated thread pool, so that parsing never starves the reactor's shared one (DNS etc.).
+        self.thread_pool = ThreadPool(minthreads=1, maxthreads=self.workers, name='page-parser')
+        self.thread_pool.start()
+        if self.mode == PROCESS_MODE:
+            # The crawler process runs threads, which makes forking it unsafe, hence the forkserver.
+            self.process_pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                    mp_context=multiprocessing.get_context('forkserver'))
+
+    def stop(self):
+        if self.thread_pool is not None:
+            self.thread_pool.stop()
+            self.thread_pool = None
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
+            self.process_pool = None
+
+    def parse(self, html: str, base_url: str, pdf_filter: Optional[str] = None) -> defer.Deferred:
+        """
+        Parses the page in the pool.
+        :param html: The HTML of the page.
+        :param base_url: The URL of the page.
+        :param pdf_filter: The filter of the PDF links.
+        :return: A Deferred that fires with the ExtractedPage, on the reactor thread.
+        """
+        from twisted.internet import reactor
+        return threads.deferToThreadPool(reactor, self.thread_pool, self.__parse, html, base_url, pdf_filter)
+
+    def __parse(self, html: str, base_url: str, pdf_filter: Optional[str]) -> ExtractedPage:
+        with PARSE_TIME.time():
+            if self.process_pool is None:
+                return extract_page(html, base_url, pdf_filter)
+            # The pool thread only waits for the worker process, which bounds the pages in flight to the workers.
+            return self.process_pool.submit(extract_page, html, base_url, pdf_filter).result()
@@ -0,0 +1,72 @@
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.http.request import NO_CALLBACK
+from scrapy.pipelines.files import FilesPipeline
+from scrapy.settings import Settings
+from twisted.internet import defer
+
+from drivers.crawler.utils.helper_methods import extract_file_name_from_url, get_canonical_url
+
+# The item field of the PDF links to download, and the one the stored PDFs are reported in.
+PDF_LINKS_FIELD = 'pdf_links'
+PDFS_FIELD = 'pdfs'
+# The default maximum number of PDFs a spider downloads at once.
+DEFAULT_PDF_MAX_CONCURRENT_DOWNLOADS = 4
+# The default maximum size of a PDF, larger ones are not downloaded.
+DEFAULT_PDF_MAX_SIZE = 100 * 1024 * 1024
+
+
+class PdfPipeline(FilesPipeline):
+    """
+    Downloads the PDFs linked from the pages through Scrapy's asynchronous downloader and stores them in
+    FILES_STORE (a local directory or an s3:// URI) under the spider's pdf_dir, named after the hash of their
+    canonical URL. Each PDF is downloaded once per crawl, and not again while the stored copy is younger than
+    FILES_EXPIRES days. At most PDF_MAX_CONCURRENT_DOWNLOADS PDFs of a spider are downloaded at once, so
+    that PDFs do not crowd out the pages.
+    The page item is passed on with the stored PDFs in its 'pdfs' field, as {url, path, checksum, status}.
+    Refer: https://docs.scrapy.org/en/2.9/topics/media-pipeline.html
+    """
+    FILES_URLS_FIELD = PDF_LINKS_FIELD
+    FILES_RESULT_FIELD = PDFS_FIELD
+
+    def __init__(self, store_uri, download_func=None, settings=None):
+        if isinstance(settings, dict) or settings is None:
+            settings = Settings(settings)
+        super(PdfPipeline, self).__init__(store_uri, download_func=download_func, settings=settings)
+        self.semaphore = defer.DeferredSemaphore(
+            settings.getint('PDF_MAX_CONCURRENT_DOWNLOADS', DEFAULT_PDF_MAX_CONCURRENT_DOWNLOADS))
+        self.max_size = settings.getint('PDF_MAX_SIZE', DEFAULT_PDF_MAX_SIZE)
+        # The canonical URLs of the PDFs requested in this crawl, so that every PDF is reported once.
+        self.seen = set()
+
+    def get_media_requests(self, item, info):
+        requests = []
+        for url in ItemAdapter(item).get(self.files_urls_field) or []:
+            canonical_url = get_canonical_url(url)
+            if canonical_url in self.seen:
+                continue
+            self.seen.add(canonical_url)
+            requests.append(Request(url, callback=NO_CALLBACK, priority=-1,
+                                    meta={'download_maxsize': self.max_size}))
+        return requests
+
+    def media_to_download(self, request, info, *, item=None):
+        # Only PDFs that are not stored yet wait for a download slot.
+        def acquire(result):
+            if result is not None:
+                return result
+            return self.semaphore.acquire().addCallback(lambda _: None)
+        return super(PdfPipeline, self).media_to_download(request, info, item=item).addCallback(acquire)
+
+    def media_downloaded(self, response, request, info, *, item=None):
+        try:
+            return super(PdfPipeline, self).media_downloaded(response, request, info, item=item)
+        finally:
+            self.semaphore.release()
+
+    def media_failed(self, failure, request, info):
+        self.semaphore.release()
+        return super(PdfPipeline, self).media_failed(failure, request, info)
+
+    def file_path(self, request, response=None, info=None, *, item=None):
+        return f'{info.spider.pdf_dir}/{extract_file_name_from_url(request.url, extension=".pdf")}'
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+from scrapy.http import XmlResponse
+from scrapy.utils.gz import gunzip, gzip_magic_number
+from scrapy.utils.sitemap import Sitemap, sitemap_urls_from_robots
+
+ROBOTS_TXT_PATH = '/robots.txt'
+# The sitemap that is tried when robots.txt does not list any.
+DEFAULT_SITEMAP_PATH = '/sitemap.xml'
+SITEMAP_INDEX_TYPE = 'sitemapindex'
+
+
+class SitemapEntry(NamedTuple):
+    # The URL of the page, or of the sitemap for an entry of a sitemap index.
+    url: str
+    # The <lastmod> as a UNIX timestamp, None if it is missing or invalid.
+    last_modified: Optional[float]
+
+
+def get_robots_txt_url(url: str) -> str:
+    parsed_url = urlparse(url)
+    return f'{parsed_url.scheme}://{parsed_url.netloc}{ROBOTS_TXT_PATH}'
+
+
+def get_sitemap_urls_from_robots(robots_txt: str, robots_txt_url: str) -> List[str]:
+    """
+    Returns the sitemaps listed in robots.txt, or the default sitemap of the host if it lists none.
+    """
+    sitemap_urls = list(sitemap_urls_from_robots(robots_txt, base_url=robots_txt_url))
+    if len(sitemap_urls) == 0:
+        sitemap_urls.append(robots_txt_url[:-len(ROBOTS_TXT_PATH)] + DEFAULT_SITEMAP_PATH)
+    return sitemap_urls
+
+
+def get_sitemap_body(response) -> Optional[bytes]:
+    """
+    Returns the XML of a sitemap response, decompressing gzip sitemaps, or None if it is not a sitemap.
+    Refer: scrapy.spiders.SitemapSpider._get_sitemap_body
+    """
+    if isinstance(response, XmlResponse):
+        return response.body
+    if gzip_magic_number(response):
+        return gunzip(response.body)
+    # A .xml.gz that is not gzipped was served with Content-Encoding: gzip and already decompressed.
+    if response.url.endswith('.xml') or response.url.endswith('.xml.gz'):
+        return response.body
+    return None
+
+
+def parse_last_modified(lastmod: Optional[str]) -> Optional[float]:
+    """
+    Parses a <lastmod> in the W3C datetime format (e.g. 2023-05-01 or 2023-05-01T10:00:00Z).
+    :return: The UNIX timestamp, None if it cannot be parsed. Dates without a time zone are taken as UTC.
+    """
+    if not lastmod:
+        return None
+    try:
+        last_modified = datetime.fromisoformat(lastmod.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.timestamp()
+
+
+def read_sitemap(body: bytes, base_url: str) -> Tuple[bool, List[SitemapEntry]]:
+    """
+    Reads a sitemap or a sitemap index.
+    :param body: The XML of the sitemap.
+    :param base_url: The URL of the sitemap, to resolve the (invalid but common) relative URLs.
+    :return: Whether it is a sitemap index, and its entries.
+    """
+    sitemap = Sitemap(body)
+    entries = [SitemapEntry(urljoin(base_url, entry['loc']), parse_last_modified(entry.get('lastmod')))
+               for entry in sitemap]
+    return sitemap.type == SITEMAP_INDEX_TYPE, entries
@@ -0,0 +1,89 @@
+import re
+from collections import defaultdict
+from typing import List, Optional
+from urllib.parse import urlparse
+
+from drivers.crawler.utils.helper_methods import get_canonical_url
+
+# The reasons a link is dropped, also used in the crawler stats keys.
+OFFSITE = 'offsite'
+FILTERED = 'filtered'
+TRAP_DEPTH = 'trap_depth'
+TRAP_REPEATED_SEGMENT = 'trap_repeated_segment'
+TRAP_QUERY_PARAMETERS = 'trap_query_parameters'
+TRAP_QUERY_VARIANTS = 'trap_query_variants'
+TRAPS = (TRAP_DEPTH, TRAP_REPEATED_SEGMENT, TRAP_QUERY_PARAMETERS, TRAP_QUERY_VARIANTS)
+# Links with more path segments than this are dropped (e.g. relative links resolving ever deeper).
+MAX_PATH_DEPTH = 15
+# Links in which a path segment repeats more than this are dropped (e.g. /title-1/title-1/title-1/...).
+MAX_SEGMENT_REPEATS = 2
+# Links with more query parameters than this are dropped (e.g. faceted search combinations).
+MAX_QUERY_PARAMETERS = 8
+# At most this many distinct queries are followed per path (e.g. calendars and endless pagination).
+MAX_QUERY_VARIANTS_PER_PATH = 100
+
+
+class UrlFilter:
+    """
+    Decides which of the links of a page are worth a request of the page budget. It matches the host against
+    the allowed domains and their subdomains with a precompiled pattern, applies the filter of the crawl and
+    drops the links that look like crawler traps.
+    """
+
+    def __init__(self, allowed_domains: Optional[List[str]] = None, url_filter: Optional[str] = None,
+                 max_path_depth: int = MAX_PATH_DEPTH, max_segment_repeats: int = MAX_SEGMENT_REPEATS,
+                 max_query_parameters: int = MAX_QUERY_PARAMETERS,
+                 max_query_variants_per_path: int = MAX_QUERY_VARIANTS_PER_PATH):
+        """
+        :param allowed_domains: The domains whose hosts and subdomains are followed. None or empty allows all.
+        :param url_filter: If set, only the links that contain it are followed.
+        :param max_path_depth: The maximum number of path segments.
+        :param max_segment_repeats: The maximum number of occurrences of a path segment.
+        :param max_query_parameters: The maximum number of query parameters.
+        :param max_query_variants_per_path: The maximum number of distinct queries per path.
+        """
+        domains = [domain.strip().lower().lstrip('.') for domain in allowed_domains or [] if domain.strip()]
+        self.host_pattern = None
+        if len(domains) > 0:
+            self.host_pattern = re.compile(r'(?:.+\.)?(?:' + '|'.join(re.escape(domain) for domain in domains)
+                                           + r')')
+        self.url_filter = url_filter
+        self.max_path_depth = max_path_depth
+        self.max_segment_repeats = max_segment_repeats
+        self.max_query_parameters = max_query_parameters
+        self.max_query_variants_per_path = max_query_variants_per_path
+        # The distinct queries followed per path.
+        self.query_variants = defaultdict(set)
+
+    def is_allowed_host(self, url: str) -> bool:
+        return self.__is_allowed_host(urlparse(url).hostname)
+
+    def __is_allowed_host(self, hostname: Optional[str]) -> bool:
+        return self.host_pattern is None or self.host_pattern.fullmatch((hostname or '').lower()) is not None
+
+    def check(self, url: str) -> Optional[str]:
+        """
+        Checks the link.
+        :param url: The absolute URL of the link.
+        :return: None if the link should be followed, otherwise the reason to drop it.
+        """
+        parsed_url = urlparse(get_canonical_url(url))
+        if not self.__is_allowed_host(parsed_url.hostname):
+            return OFFSITE
+        if self.url_filter and self.url_filter not in url:
+            return FILTERED
+        segments = [segment for segment in parsed_url.path.split('/') if segment]
+        if len(segments) > self.max_path_depth:
+            return TRAP_DEPTH
+        if len(segments) > self.max_segment_repeats and \
+                max(segments.count(segment) for segment in set(segments)) > self.max_segment_repeats:
+            return TRAP_REPEATED_SEGMENT
+        if parsed_url.query:
+            if parsed_url.query.count('&') >= self.max_query_parameters:
+                return TRAP_QUERY_PARAMETERS
+            variants = self.query_variants[parsed_url.path]
+            if parsed_url.query not in variants:
+                if len(variants) >= self.max_query_variants_per_path:
+                    return TRAP_QUERY_VARIANTS
+                variants.add(parsed_url.query)
+        return None
@@ -1,16 +1,19 @@
 import hashlib
-import logging
-import os
 import re
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 
-import requests
 from bs4 import BeautifulSoup
 from tldextract import extract
 from typing import List, Dict, TextIO
 import csv
 
-download_dir = "/Users/ravidecover/Desktop/decoverlaws/usa/laws"
+# The query parameters that are dropped from canonical URLs, besides the utm_* ones.
+IGNORED_QUERY_PARAMETERS = {'gclid', 'fbclid', 'msclkid', 'dclid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'yclid',
+                            'igshid', 'ref_src', 'jsessionid', 'phpsessid', 'aspsessionid', 'sessionid',
+                            'session_id', 'sessid', 'cfid', 'cftoken'}
+# Session IDs that servers append to the path, e.g. /statutes/title-1;jsessionid=0A1B2C.
+SESSION_ID_PATH_PARAMETER_PATTERN = re.compile(r';(?:jsessionid|phpsessid|sessionid|sid)=[^/;]*', re.IGNORECASE)
+REPEATED_SLASHES_PATTERN = re.compile(r'/{2,}')
 
 
 def get_text_from_html(html_content):
@@ -45,39 +48,6 @@ def get_pdf_links(html_content, filter):
     return pdf_links
 
 
-def clean_pdf_link(pdf_link: str) -> str:
-    """
-    Cleans the pdf_link by performing a series of transformations on it.
-    :param pdf_link: The pdf_link to clean.
-    :return: The cleaned pdf_link.
-    """
-    # Clean the pdf_link by removing the query string.
-    pdf_link = pdf_link.split('?')[0]
-    # Clean the pdf_link by removing the leading // if any.
-    pdf_link = pdf_link[2:] if pdf_link.startswith('//') else pdf_link
-    # Clean the pdf_link by adding https:// if it doesn't start with http:// or https://
-    pdf_link = f"https://{pdf_link}" if not pdf_link.startswith(
-        'http') else pdf_link
-    return
-
-
-def download_pdf(pdf_link):
-    # Clean the pdf_link
-    pdf_link = clean_pdf_link(pdf_link)
-    downloaded_pdfs = []
-    pdf_path = os.path.join(download_dir, os.path.basename(pdf_link))
-    with requests.get(pdf_link, stream=True) as response:
-        if response.status_code == 200:
-            with open(pdf_path, "wb") as file:
-                for chunk in response.iter_content(chunk_size=1024):
-                    file.write(chunk)
-            downloaded_pdfs.append(pdf_path)
-        else:
-            logging.error(f"Failed to download {pdf_link}")
-
-    return downloaded_pdfs
-
-
 def normalize_string(input_string: str) -> str:
     # Remove punctuation
     normalized_string = re.sub(r'[^\w\s-]', '', input_string)
@@ -91,32 +61,60 @@ def normalize_string(input_string: str) -> str:
     return re.sub(r'(\b\w)-(\w\b)', r'\1\2', normalized_string)
 
 
-# Take the last part of the URL and guess the closest file name.
-# Keep it normalized, subject to the following rules:
-# 1. Remove punctuation
-# 2. Convert to lowercase
-# 3. Capitalize the first letter of each word
-# 4. Remove multiple spaces
-# 5. Retain hyphens between consecutive words
-def extract_file_name_from_url(url: str) -> str:
-    # Remove the protocol and domain name from the URL.
-    url = url.replace('https://', '').replace('http://', '')
-    # Remove the trailing slash.
-    url = url.rstrip('/')
-    # Split the URL by slashes.
-    url_parts = url.split('/')
-    # Take the last part of the URL.
-    file_name = url_parts[-1]
+def get_canonical_url(url: str) -> str:
+    """
+    Returns the canonical form of the URL, so that different spellings of the same page map to the same key.
+    The scheme and host are lower-cased, the default port, the fragment, the trailing slash, repeated slashes,
+    session IDs and tracking parameters are removed, and the remaining query parameters are sorted.
+    :param url: The URL to canonicalize.
+    :return: The canonical URL.
+    """
+    parsed_url = urlparse(url.strip())
+    scheme = parsed_url.scheme.lower()
+    netloc = parsed_url.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    path = SESSION_ID_PATH_PARAMETER_PATTERN.sub('', parsed_url.path)
+    path = REPEATED_SLASHES_PATTERN.sub('/', path).rstrip('/') or '/'
+    params = SESSION_ID_PATH_PARAMETER_PATTERN.sub('', ';' + parsed_url.params)[1:] if parsed_url.params else ''
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parsed_url.query, keep_blank_values=True)
+                             if not is_ignored_query_parameter(key)))
+    return urlunparse((scheme, netloc, path, params, query, ''))
+
+
+def is_ignored_query_parameter(key: str) -> bool:
+    # Tracking and session parameters do not change the page that is served.
+    key = key.lower()
+    return key in IGNORED_QUERY_PARAMETERS or key.startswith('utm_')
+
+
+# Derive the file name from the full canonical URL (without the protocol), so that pages with the same
+# last path segment (e.g. /a/index.html and /b/index.html) do not collide.
+def extract_file_name_from_url(url: str, extension: str = '.txt') -> str:
+    # Canonicalize the URL and remove the protocol.
+    url = get_canonical_url(url).replace('https://', '', 1).replace('http://', '', 1)
     # Take MD5 hash of the URL
-    return hashlib.md5(file_name.encode()).hexdigest() + '.txt'
+    return hashlib.md5(url.encode()).hexdigest() + extension
+
+
+def get_content_hash(contents) -> str:
+    """
+    Returns the MD5 hash of the contents, as stored in ParsedObject.hash.
+    :param contents: The contents as str or bytes.
+    :return: The hex digest.
+    """
+    if isinstance(contents, str):
+        contents = contents.encode()
+    return hashlib.md5(contents).hexdigest()
 
 
 def extract_domain(url):
     _, domain, suffix = extract(url)
     if domain and suffix:
         return domain + '.' + suffix
+    # IP addresses and single-label hosts (e.g. localhost) have no public suffix.
     parsed_url = urlparse(url)
-    return parsed_url.path.split('/')[0]
+    return parsed_url.hostname or parsed_url.path.split('/')[0]
 
 
 def unify_csv_format(file: TextIO, data_to_write: List[Dict[str, str]]):
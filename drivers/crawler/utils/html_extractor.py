@@ -0,0 +1,92 @@
+from typing import List, NamedTuple, Optional, Union
+from urllib.parse import urljoin
+
+from lxml import etree
+
+# The elements whose text is not part of the page text, as in get_text_from_html. The script and style elements
+# are removed by it, and BeautifulSoup (since 4.10) keeps the strings of a template as TemplateStrings, which
+# get_text() leaves out.
+SKIPPED_TAGS = {'script', 'style', 'template'}
+
+
+class ExtractedPage(NamedTuple):
+    """
+    Everything DecoverSpider needs from a page, extracted from a single parse of it.
+    """
+    # The text of the body, normalized as by get_text_from_html.
+    text: str
+    # The absolute URLs of every hyperlink, in document order.
+    links: List[str]
+    # The absolute URLs of the hyperlinks to PDFs that match the filter.
+    pdf_links: List[str]
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes the whitespace of the text exactly as get_text_from_html does.
+    """
+    # break into lines and remove leading and trailing space on each
+    lines = (line.strip() for line in text.splitlines())
+    # break multi-headlines into a line each
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    # drop blank lines
+    return ' '.join(chunk for chunk in chunks if chunk)
+
+
+def is_pdf_link(href: str) -> bool:
+    # Remove ? and everything after it before matching.
+    return href.split('?')[0].endswith('.pdf')
+
+
+def extract_page(html: Union[str, bytes], base_url: str, pdf_filter: Optional[str] = None) -> ExtractedPage:
+    """
+    Parses the page once with lxml's C parser and walks the tree once, collecting the text of the body
+    (without script, style and template elements), the hyperlinks and the PDF links together. It replaces
+    the separate response.xpath('//body'), get_text_from_html, get_pdf_links and response.xpath('//a/@href')
+    passes, and produces the same text as get_text_from_html.
+    :param html: The HTML of the page. Pass the decoded text (response.text) so that the encoding detected by
+    Scrapy is used; bytes are parsed in the encoding they declare.
+    :param base_url: The URL of the page, to resolve relative links. A <base href> overrides it.
+    :param pdf_filter: If set, only the PDF links whose href contains it are returned.
+    :return: The ExtractedPage.
+    """
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+        parser = etree.HTMLParser(encoding='utf-8', huge_tree=True)
+    else:
+        parser = etree.HTMLParser(huge_tree=True)
+    root = etree.fromstring(html, parser) if html.strip() else None
+    if root is None:
+        return ExtractedPage('', [], [])
+
+    head = root.find('head')
+    base = head.find('base') if head is not None else None
+    if base is not None and base.get('href'):
+        base_url = urljoin(base_url, base.get('href').strip())
+
+    body = root.find('body')
+    parts, links, pdf_links = [], [], []
+    # An explicit stack instead of recursion, as documents can be nested deeper than the recursion limit.
+    # Tails are pushed before the children, so that they are emitted after the whole subtree.
+    stack = [body if body is not None else root]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        if item is not body and item.tail:
+            stack.append(item.tail)
+        tag = item.tag
+        # Comments and processing instructions have a non-string tag and no text of their own.
+        if not isinstance(tag, str) or tag in SKIPPED_TAGS:
+            continue
+        if tag == 'a':
+            href = item.get('href')
+            if href is not None:
+                links.append(urljoin(base_url, href.strip()))
+                if is_pdf_link(href) and (not pdf_filter or pdf_filter in href):
+                    pdf_links.append(links[-1])
+        if item.text:
+            parts.append(item.text)
+        stack.extend(reversed(item))
+    return ExtractedPage(normalize_text(''.join(parts)), links, pdf_links)
@@ -1,14 +1,19 @@
-import json
-import os
-import random
-import string
+import logging
+import queue
 from logging.config import dictConfig
 from multiprocessing import Process, Queue
+from typing import Iterator, List, Optional, Tuple, Union
 
 import scrapy.crawler as crawler
-from twisted.internet import reactor
+from twisted.internet import defer, threads
+from twisted.internet.task import LoopingCall
+from twisted.python import failure
+from twisted.python.threadpool import ThreadPool
 
 from drivers.crawler.decover_spider import DecoverSpider
+from drivers.crawler.page_parser import PageParser, THREAD_MODE
+from drivers.crawler.pdf_pipeline import DEFAULT_PDF_MAX_CONCURRENT_DOWNLOADS, PDF_LINKS_FIELD, PDFS_FIELD
+from drivers.utilities import metrics
 
 dictConfig({
     'version': 1,
@@ -26,59 +31,153 @@ dictConfig({
     }
 })
 
+# The kinds of messages sent over the item queue. Each message is a tuple of (event, task_id, payload).
+# A page event carries the scraped item, a done event carries the error of the crawl (or None) and a metrics
+# event carries what a crawler process counted since its last one (see MetricsRegistry.take), with no task_id.
+PAGE_EVENT = 'page'
+DONE_EVENT = 'done'
+METRICS_EVENT = 'metrics'
+# How often (in seconds) the crawler processes ship their metrics to the parent.
+METRICS_INTERVAL_SECONDS = 5
+# How often (in seconds) the parent checks that its crawler processes are still alive.
+PROCESS_POLL_INTERVAL_SECONDS = 5
+# The maximum number of pages buffered between the crawler processes and the consumer. When the
+# buffer is full the spiders stop downloading until the consumer catches up.
+ITEM_QUEUE_MAX_SIZE = 1000
+# The default caps on the number of concurrent requests of a spider and to a single host.
+DEFAULT_MAX_CONCURRENT_REQUESTS = 16
+DEFAULT_MAX_CONCURRENT_REQUESTS_PER_HOST = 8
+# The number of pages each crawler process parses at once off its reactor thread, and how (see PageParser).
+DEFAULT_PAGE_PARSER_WORKERS = 2
+DEFAULT_PAGE_PARSER_MODE = THREAD_MODE
 
-def f(q, start_urls, allowed_domains, should_recurse, max_links, download_pdfs, file_name, filter):
-    """
 
-    :param file_name:
-    :param download_pdfs:
-    :param max_links:
-    :param q:
-    :param start_urls:
-    :param allowed_domains:
-    :param should_recurse:
-    :return:
+def get_crawler_settings(max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+                         max_concurrent_requests_per_host: int = DEFAULT_MAX_CONCURRENT_REQUESTS_PER_HOST,
+                         files_store: Optional[str] = None) -> dict:
     """
-    try:
-        runner = crawler.CrawlerRunner(
-            settings={
-                'ITEM_PIPELINES': {
-                    'drivers.crawler.json_writer_pipeline.JsonWriterPipeline': 1,
-                },
-                'LOG_LEVEL': 'INFO',
-                'USER_AGENT': 'Mozilla/5.0 (iPad; CPU OS 12_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
-                              'Mobile/15E148',
-                'REFERRER_POLICY': 'origin'
-            }
-        )
-        deferred = runner.crawl(DecoverSpider,
-                                start_urls=start_urls,
-                                allowed_domains=allowed_domains,
-                                should_recurse=should_recurse,
-                                max_links=max_links,
-                                download_pdfs=download_pdfs,
-                                file_name=file_name,
-                                filter=filter)
-        deferred.addBoth(lambda _: reactor.stop())
-        reactor.run(0)
-        q.put(None)
-    except Exception as e:
-        q.put(e)
+    Returns the Scrapy settings shared by every spider of a crawler process.
+    :param max_concurrent_requests: The maximum number of concurrent requests of a spider.
+    :param max_concurrent_requests_per_host: The maximum number of concurrent requests to a single host. The
+                                             AdaptiveThrottle ramps each host up to it while the host keeps up.
+    :param files_store: The local directory or s3:// URI the PdfPipeline stores the PDFs in. None disables
+                        the PDF downloads.
+    :return: The settings dictionary.
+    """
+    return {
+        'ITEM_PIPELINES': {
+            'drivers.crawler.pdf_pipeline.PdfPipeline': 200,
+            'drivers.crawler.item_queue_pipeline.ItemQueuePipeline': 300,
+        },
+        'FILES_STORE': files_store,
+        'FILES_URLS_FIELD': PDF_LINKS_FIELD,
+        'FILES_RESULT_FIELD': PDFS_FIELD,
+        'MEDIA_ALLOW_REDIRECTS': True,
+        'PDF_MAX_CONCURRENT_DOWNLOADS': DEFAULT_PDF_MAX_CONCURRENT_DOWNLOADS,
+        'EXTENSIONS': {
+            'drivers.crawler.crawl_metrics.CrawlMetrics': 500,
+        },
+        'DOWNLOADER_MIDDLEWARES': {
+            'drivers.crawler.conditional_request_middleware.ConditionalRequestMiddleware': 560,
+            'drivers.crawler.adaptive_throttle.AdaptiveThrottle': 990,
+        },
+        'CONCURRENT_REQUESTS': max_concurrent_requests,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': max_concurrent_requests_per_host,
+        'ADAPTIVE_THROTTLE_ENABLED': True,
+        'ADAPTIVE_THROTTLE_START_CONCURRENCY': 2,
+        'ADAPTIVE_THROTTLE_TARGET_LATENCY': 1.0,
+        'ADAPTIVE_THROTTLE_MAX_DELAY': 60.0,
+        'PAGE_PARSER_WORKERS': DEFAULT_PAGE_PARSER_WORKERS,
+        'PAGE_PARSER_MODE': DEFAULT_PAGE_PARSER_MODE,
+        'LOG_LEVEL': 'INFO',
+        'USER_AGENT': 'Mozilla/5.0 (iPad; CPU OS 12_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+                      'Mobile/15E148',
+        'REFERRER_POLICY': 'origin',
+        # Every spider would otherwise open its own telnet console port.
+        'TELNETCONSOLE_ENABLED': False
+    }
 
 
-def get_random_file_name(prefix='items', suffix='jsonl', length=10):
+def crawler_process_main(task_queue, result_queue, max_concurrent_spiders, settings):
     """
-    This method is used to generate a random file name.
-    :param length:
-    :param prefix:
-    :param suffix:
+    Entry point of a long-lived crawler process. A single CrawlerRunner (and reactor) hosts up to
+    @max_concurrent_spiders DecoverSpider instances at a time, pulling new sites from @task_queue
+    until it receives None.
+    :param task_queue: The queue the sites to crawl are read from.
+    :param result_queue: The queue to which the page and done events of every site are streamed.
+    :param max_concurrent_spiders: The maximum number of spiders running at once in this process.
+    :param settings: The Scrapy settings of the spiders.
     :return:
     """
-    random_number = random.randint(1, 100000)
-    random_string = ''.join(random.choice(
-        string.ascii_letters + string.digits) for _ in range(length))
-    file_name = f'{prefix}_{random_number}_{random_string}.{suffix}'
-    return file_name
+    # The reactor is imported here, inside the child, so that crawler processes never share a reactor
+    # (and its epoll instance) inherited from the parent through fork.
+    from twisted.internet import reactor
+
+    # Only count what this process does, not what it inherited from its parent through fork.
+    metrics.REGISTRY.reset()
+    runner = crawler.CrawlerRunner(settings=settings)
+    # The spiders of this process share one parser pool, which keeps parsing off the reactor thread.
+    page_parser = PageParser(settings.get('PAGE_PARSER_WORKERS', DEFAULT_PAGE_PARSER_WORKERS),
+                             settings.get('PAGE_PARSER_MODE', DEFAULT_PAGE_PARSER_MODE))
+    page_parser.start()
+    semaphore = defer.DeferredSemaphore(max_concurrent_spiders)
+    # The metrics and done events are put on a dedicated thread, like the pages in ItemQueuePipeline: the puts
+    # block on a full queue, and must neither block the reactor thread nor starve its shared thread pool (DNS
+    # etc.). A single thread also keeps the events in order.
+    event_pool = ThreadPool(minthreads=1, maxthreads=1, name='crawler-events')
+    event_pool.start()
+
+    def put_events(events):
+        for event in events:
+            result_queue.put(event)
+
+    def report_metrics():
+        values = metrics.REGISTRY.take()
+        if len(values) == 0:
+            return None
+        return threads.deferToThreadPool(reactor, event_pool, put_events, [(METRICS_EVENT, None, values)])
+
+    def report_done(result, task_id):
+        error = None
+        if isinstance(result, failure.Failure):
+            logging.error(f'Crawl {task_id} failed: {result.value}')
+            error = repr(result.value)
+        # The metrics go first, so that the parent has counted the site by the time it is done.
+        return threads.deferToThreadPool(reactor, event_pool, put_events,
+                                         [(METRICS_EVENT, None, metrics.REGISTRY.take()),
+                                          (DONE_EVENT, task_id, error)])
+
+    def run_task(task):
+        deferred = runner.crawl(DecoverSpider, item_queue=result_queue, page_parser=page_parser, **task)
+        deferred.addBoth(report_done, task['task_id'])
+        deferred.addBoth(lambda _: semaphore.release())
+
+    @defer.inlineCallbacks
+    def feed():
+        try:
+            while True:
+                # Only pull a new site once a spider slot is free, so that the other processes
+                # of the pool can pick it up in the meantime.
+                yield semaphore.acquire()
+                task = yield threads.deferToThread(task_queue.get)
+                if task is None:
+                    semaphore.release()
+                    break
+                run_task(task)
+            yield runner.join()
+        finally:
+            reactor.stop()
+
+    reactor.callWhenRunning(feed)
+    metrics_loop = LoopingCall(report_metrics)
+    metrics_loop.start(METRICS_INTERVAL_SECONDS, now=False)
+    try:
+        reactor.run(0)
+    finally:
+        metrics_loop.stop()
+        page_parser.stop()
+        # Waits for the pending events to be put.
+        event_pool.stop()
 
 
 class WebSiteCrawlerScrapy:
@@ -91,35 +190,90 @@ class WebSiteCrawlerScrapy:
 
     # The wrapper to make it run more times.
     def crawl(self, start_urls, allowed_domains, should_recurse, max_links, download_pdfs, filter) -> dict:
-        # Preprocess the inputs. start_urls should begin with https
-        for i in range(len(start_urls)):
-            if not start_urls[i].startswith('https'):
-                start_urls[i] = 'https://' + start_urls[i]
-        feed_export_file_name = get_random_file_name()
-        q = Queue()
-        p = Process(target=f, args=(q, start_urls,
-                                    allowed_domains, should_recurse, max_links, download_pdfs, feed_export_file_name, filter))
-        p.start()
-        result = q.get()
-        p.join()
-
-        # Read the results from the JSON file.
+        task = {
+            'start_urls': start_urls,
+            'allowed_domains': allowed_domains,
+            'should_recurse': should_recurse,
+            'max_links': max_links,
+            'download_pdfs': download_pdfs,
+            'filter': filter
+        }
         results = {}
+        for event, _, payload in self.crawl_many([task], num_processes=1, spiders_per_process=1):
+            if event == PAGE_EVENT:
+                results[payload['url']] = payload['content']
+            elif payload is not None:
+                raise Exception(payload)
+        return results
 
-        # Step III: Go through and read the results from the JSON file.
-        with open(feed_export_file_name, 'r') as file:
-            for line in file:
-                item = json.loads(line)
-                for url, content in item.items():
-                    results[url] = content
+    def crawl_many(self, tasks: List[dict], num_processes: int, spiders_per_process: int,
+                   max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+                   max_concurrent_requests_per_host: int = DEFAULT_MAX_CONCURRENT_REQUESTS_PER_HOST,
+                   files_store: Optional[str] = None) -> Iterator[Tuple[str, int, Optional[Union[dict, str]]]]:
+        """
+        Crawls many websites using a pool of long-lived crawler processes, each of which runs several
+        spiders concurrently. Pages are streamed back as soon as they are scraped, and every website ends
+        with exactly one done event, including websites whose crawler process died part-way.
+        :param tasks: The DecoverSpider arguments of each website (start_urls, allowed_domains,
+                      should_recurse, max_links, download_pdfs, filter, validator_store_path,
+                      frontier_dir, pdf_dir).
+        :param num_processes: The number of crawler processes.
+        :param spiders_per_process: The number of spiders each crawler process runs at once.
+        :param max_concurrent_requests: The maximum number of concurrent requests of each spider.
+        :param max_concurrent_requests_per_host: The maximum number of concurrent requests to a single host.
+        :param files_store: The local directory or s3:// URI the PDFs of the tasks with download_pdfs are
+                            stored in, each under the pdf_dir of its task.
+        :return: An iterator of (event, index of the task, payload). The payload of a PAGE_EVENT is a
+                 DecoverSpider item and the payload of a DONE_EVENT is the error or None. The metrics of the
+                 crawler processes are merged into the metrics of this process rather than yielded.
+        """
+        if len(tasks) == 0:
+            return
+        task_queue, result_queue = Queue(), Queue(maxsize=ITEM_QUEUE_MAX_SIZE)
+        for task_id, task in enumerate(tasks):
+            task = dict(task, task_id=task_id)
+            # Preprocess the inputs. start_urls should have a scheme, https by default.
+            task['start_urls'] = [url if url.startswith('http://') or url.startswith('https://')
+                                  else 'https://' + url for url in task['start_urls']]
+            task_queue.put(task)
 
-        # Step IV: Clean up (Delete the JSON file).
-        if os.path.exists(feed_export_file_name):
-            os.remove(feed_export_file_name)
+        num_processes = max(1, min(num_processes, len(tasks)))
+        settings = get_crawler_settings(max_concurrent_requests, max_concurrent_requests_per_host, files_store)
+        processes = []
+        for _ in range(num_processes):
+            task_queue.put(None)
+            p = Process(target=crawler_process_main, args=(task_queue, result_queue, spiders_per_process, settings))
+            p.start()
+            processes.append(p)
 
-        if result is not None:
-            raise result
-        return results
+        pending = set(range(len(tasks)))
+        metrics.PENDING_SITES.set(len(pending))
+        try:
+            while pending:
+                try:
+                    event, task_id, payload = result_queue.get(timeout=PROCESS_POLL_INTERVAL_SECONDS)
+                    metrics.ITEM_QUEUE_DEPTH.set(result_queue.qsize())
+                except queue.Empty:
+                    if any(p.is_alive() for p in processes):
+                        continue
+                    # Every crawler process died without finishing the remaining websites.
+                    for task_id in sorted(pending):
+                        yield DONE_EVENT, task_id, 'Crawler process exited unexpectedly.'
+                    return
+                if event == METRICS_EVENT:
+                    metrics.REGISTRY.merge(payload)
+                    continue
+                if event == DONE_EVENT:
+                    pending.discard(task_id)
+                    metrics.PENDING_SITES.set(len(pending))
+                yield event, task_id, payload
+        finally:
+            metrics.PENDING_SITES.set(0)
+            metrics.ITEM_QUEUE_DEPTH.set(0)
+            for p in processes:
+                p.join(timeout=PROCESS_POLL_INTERVAL_SECONDS)
+                if p.is_alive():
+                    p.terminate()
 
 
 if __name__ == "__main__":
@@ -127,7 +281,7 @@ if __name__ == "__main__":
     site = "https://law.justia.com/cases/federal/appellate-courts/ca7/"
     domain = "law.justia.com"
     filter = "federal/appellate-courts/ca7"
-    crawler = WebSiteCrawlerScrapy()
-    results = crawler.crawl([site], [domain], True, 25, False, filter)
+    web_crawler = WebSiteCrawlerScrapy()
+    results = web_crawler.crawl([site], [domain], True, 25, False, filter)
     # Print the set of urls that were crawled.
     print(results.keys())
@@ -1,25 +1,83 @@
 import csv
+import hashlib
 import os
 import re
 import logging
 import requests
-from typing import List
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, List, Optional
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
 
 from drivers.common.law_elem import LawElem
+from drivers.common.parsed_object import ParsedObject
 from drivers.crawler.utils.helper_methods import get_target_file_path, unify_csv_format, normalize_string
-from drivers.utilities.bing_client import BingClient
+from drivers.utilities.bing_client import BingClient, DEFAULT_REQUESTS_PER_SECOND
+from drivers.utilities.content_index import ContentIndex
 from drivers.utilities.file import File
+from drivers.utilities.file_cache import DEFAULT_MAX_BYTES
+from drivers.utilities.metrics import LAWS, PENDING_LAWS
+from drivers.utilities.rate_limiter import HostLimiter
+from drivers.utilities.search_cache import DEFAULT_NEGATIVE_TTL_SECONDS, DEFAULT_TTL_SECONDS, SearchCache
+from drivers.utilities.validator_store import ValidatorStore, get_validators
 
 METADATA_FILE_NAME = 'metadata.csv'
 
+VALIDATOR_STORE_FILE_NAME = 'validators.db'
+
+CONTENT_INDEX_FILE_NAME = 'content_index.db'
+
+SEARCH_CACHE_FILE_NAME = 'bing_cache.db'
+
+FILE_CACHE_DIR_NAME = 'file_cache'
+
+# The default number of laws searched for at once. The calls to Bing are rate limited on top of it.
+DEFAULT_SEARCH_CONCURRENCY = 8
+
+# The default number of PDFs of laws downloaded at once, and from a single host.
+DEFAULT_DOWNLOAD_CONCURRENCY = 8
+DEFAULT_MAX_DOWNLOADS_PER_HOST = 2
+# The (connect, read) timeouts of the downloads in seconds. The read timeout applies to every chunk, not to the
+# whole PDF.
+DOWNLOAD_TIMEOUT_SECONDS = (10, 60)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 class BingDriver:
-    def __init__(self, csv_path: str, base_dir: str, max_laws: int):
+    def __init__(self, csv_path: str, base_dir: str, max_laws: int, state_dir: str = 'crawl_state',
+                 search_concurrency: int = DEFAULT_SEARCH_CONCURRENCY,
+                 bing_requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 bing_cache_ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 bing_cache_negative_ttl_seconds: float = DEFAULT_NEGATIVE_TTL_SECONDS,
+                 download_concurrency: int = DEFAULT_DOWNLOAD_CONCURRENCY,
+                 max_downloads_per_host: int = DEFAULT_MAX_DOWNLOADS_PER_HOST,
+                 file_cache_max_bytes: int = DEFAULT_MAX_BYTES):
         self.csv_path = csv_path
-        self.bing_client = BingClient()
+        # The laws are searched for concurrently, within the rate limit of the Bing tier. The results are
+        # reused between runs until they expire.
+        self.search_concurrency = max(1, search_concurrency)
+        self.search_cache = SearchCache(os.path.join(state_dir, SEARCH_CACHE_FILE_NAME),
+                                        ttl_seconds=bing_cache_ttl_seconds,
+                                        negative_ttl_seconds=bing_cache_negative_ttl_seconds)
+        self.bing_client = BingClient(requests_per_second=bing_requests_per_second,
+                                      max_connections=self.search_concurrency, cache=self.search_cache)
         self.target_base_dir = base_dir
         self.max_laws = max_laws
-        self.file = File()
+        # The input CSV is read from the local cache while it is not modified.
+        self.file = File(cache_dir=os.path.join(state_dir, FILE_CACHE_DIR_NAME), cache_max_bytes=file_cache_max_bytes)
+        # The PDFs are downloaded concurrently over a shared pool of connections, a few at a time per host.
+        self.download_concurrency = max(1, download_concurrency)
+        self.host_limiter = HostLimiter(max_downloads_per_host)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.download_concurrency, pool_maxsize=self.download_concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Remembers the validators of every downloaded law, so that unchanged PDFs are skipped on a 304.
+        self.validator_store = ValidatorStore(os.path.join(state_dir, VALIDATOR_STORE_FILE_NAME))
+        # Remembers the hash and location of every downloaded law.
+        self.content_index = ContentIndex(os.path.join(state_dir, CONTENT_INDEX_FILE_NAME))
 
     def ping(self) -> str:
         logging.info('Pinging BingDriver...')
@@ -76,26 +134,77 @@ class BingDriver:
             os.rmdir(tmp_dir)
 
     def __download_laws(self, output_laws: List[LawElem]) -> int:
-        # Download the PDFs
-        count = 0
-        for law in output_laws:
-            # Download the PDF using requests
-            try:
-                response = requests.get(law.url, verify=False)
-                jurisdiction = law.jurisdiction
-                category = law.category
-                file_name = law.file_name
-                # if the directory doesn't exist create it and do not bail out
-                target_file_path = get_target_file_path(
-                    self.target_base_dir, file_name, jurisdiction, category)
-                self.file.write(response.content, target_file_path)
-                logging.info(
-                    f'Downloaded {file_name} to {target_file_path}')
-                count += 1
-            except Exception as e:
-                logging.error(f'Failed to download {law.url}.')
-                logging.error(e)
-        return count
+        # Download the PDFs concurrently. Return the number of laws that were downloaded.
+        PENDING_LAWS.set(len(output_laws), stage='download')
+        with ThreadPoolExecutor(max_workers=self.download_concurrency) as executor:
+            downloaded = list(executor.map(self.__download_law, output_laws))
+        PENDING_LAWS.set(0, stage='download')
+        return sum(downloaded)
+
+    def __download_law(self, law: LawElem) -> bool:
+        # Download the PDF using requests. Ask for it conditionally if it was downloaded before.
+        # The PDF is streamed in chunks into an anonymous temporary file and hashed on the way, so that a large
+        # PDF is never held in memory. (Before Python 3.11 a SpooledTemporaryFile has no seekable(), which
+        # File.write needs.)
+        try:
+            # A 304 can only be answered with the stored PDF of the law. Without one, the validators are forgotten
+            # and the PDF is downloaded again.
+            parsed_object = self.content_index.get(law.url)
+            if parsed_object is None:
+                self.validator_store.put(law.url)
+                headers = {}
+            else:
+                headers = self.validator_store.conditional_headers(law.url)
+            with tempfile.TemporaryFile() as body:
+                with self.host_limiter.limit(urlparse(law.url).hostname or ''), \
+                        self.session.get(law.url, headers=headers, verify=False, stream=True,
+                                         timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+                    if response.status_code == 304:
+                        # Point the law to the file its unchanged PDF is already stored in.
+                        law.file_name = os.path.basename(parsed_object.file_url)
+                        logging.info(f'Skipping {law.url} as it was not modified.')
+                        LAWS.inc(outcome='not_modified')
+                        return False
+                    response.raise_for_status()
+                    content_hash = hashlib.md5()
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        body.write(chunk)
+                        content_hash.update(chunk)
+                    validators = get_validators(response.headers)
+                body.seek(0)
+                self.__store_law(law, body, content_hash.hexdigest())
+            self.validator_store.put(law.url, **validators)
+            return True
+        except Exception as e:
+            LAWS.inc(outcome='failed')
+            logging.error(f'Failed to download {law.url}.')
+            logging.error(e)
+            return False
+        finally:
+            PENDING_LAWS.dec(stage='download')
+
+    def __store_law(self, law: LawElem, body: IO[bytes], content_hash: str):
+        jurisdiction = law.jurisdiction
+        category = law.category
+        # if the directory doesn't exist create it and do not bail out
+        target_file_path = get_target_file_path(
+            self.target_base_dir, law.file_name, jurisdiction, category)
+        # Store identical PDFs only once per directory.
+        file_url = self.content_index.find_file(os.path.dirname(target_file_path), content_hash)
+        if file_url is None:
+            file_url = target_file_path
+            self.file.write(body, target_file_path)
+            logging.info(
+                f'Downloaded {law.file_name} to {target_file_path}')
+            LAWS.inc(outcome='downloaded')
+        else:
+            law.file_name = os.path.basename(file_url)
+            logging.info(f'Skipping upload of {law.url} as its contents are stored in {file_url}')
+            LAWS.inc(outcome='duplicate')
+        self.content_index.put(ParsedObject(file_url=file_url, jurisdiction=jurisdiction,
+                                            source_url=law.url, category=category,
+                                            subcategory=law.sub_category, hash=content_hash,
+                                            title=law.title))
 
     def __validate_csv_path(self):
         # Check if the CSV file is defined and exists.
@@ -141,34 +250,51 @@ class BingDriver:
         return laws
 
     def __search_laws(self, laws: List[LawElem]) -> List[LawElem]:
-        # Use BingClient to search for the law. Return a list of laws with additional information
-        output_laws = []
-        for law in laws:
-            query = f'{law.law_name} filetype:pdf'
-            try:
-                results = self.bing_client.search(query, law.jurisdiction)
-            except Exception as e:
-                logging.error(f'Failed to search for {query}.')
-                logging.error(e)
-                continue
-            # Read the first result and extract the title and url and update the JSON
-            if len(results) > 0:
-                # Get the first result that ends with .pdf from the list of results.
-                pdf_result = next(
-                    (x for x in results if x.url.endswith('.pdf')), None)
-                if pdf_result is None:
-                    continue
-                first_result = pdf_result
-                law_name = law.law_name.replace(' ', '_')
-                tmp_file_name = re.sub(
-                    r'[^A-Za-z0-9_.]', '', f'{law_name}.pdf')
-                jurisdiction, category = law.jurisdiction, law.category
-                target_file_path = get_target_file_path(
-                    self.target_base_dir, tmp_file_name, jurisdiction, category)
-                if self.file.exists(target_file_path):
-                    continue
-                law.title = normalize_string(first_result.name)
-                law.url = first_result.url
-                law.file_name = tmp_file_name
-                output_laws.append(law)
-        return output_laws
+        # Use BingClient to search for the laws concurrently. Return the laws that were found, in their
+        # input order, with additional information.
+        PENDING_LAWS.set(len(laws), stage='search')
+        # List the directories of the laws once, rather than checking every law in S3.
+        self.file.index_directories({get_target_file_path(self.target_base_dir, '', law.jurisdiction, law.category)
+                                     for law in laws})
+        with ThreadPoolExecutor(max_workers=self.search_concurrency) as executor:
+            results = list(executor.map(self.__search_law, laws))
+        PENDING_LAWS.set(0, stage='search')
+        return [law for law in results if law is not None]
+
+    def __search_law(self, law: LawElem) -> Optional[LawElem]:
+        try:
+            return self.__find_law(law)
+        finally:
+            PENDING_LAWS.dec(stage='search')
+
+    def __find_law(self, law: LawElem) -> Optional[LawElem]:
+        query = f'{law.law_name} filetype:pdf'
+        try:
+            results = self.bing_client.search(query, law.jurisdiction)
+        except Exception as e:
+            logging.error(f'Failed to search for {query}.')
+            logging.error(e)
+            return None
+        # Read the first result and extract the title and url and update the JSON
+        if len(results) == 0:
+            return None
+        # Get the first result that ends with .pdf from the list of results.
+        pdf_result = next(
+            (x for x in results if x.url.endswith('.pdf')), None)
+        if pdf_result is None:
+            return None
+        first_result = pdf_result
+        law_name = law.law_name.replace(' ', '_')
+        tmp_file_name = re.sub(
+            r'[^A-Za-z0-9_.]', '', f'{law_name}.pdf')
+        jurisdiction, category = law.jurisdiction, law.category
+        target_file_path = get_target_file_path(
+            self.target_base_dir, tmp_file_name, jurisdiction, category)
+        # A law that was downloaded before is asked for conditionally, so that a PDF that changed is downloaded
+        # again. Without validators, it is only downloaded if it is not stored yet.
+        if self.validator_store.get(first_result.url) is None and self.file.exists(target_file_path):
+            return None
+        law.title = normalize_string(first_result.name)
+        law.url = first_result.url
+        law.file_name = tmp_file_name
+        return law
@@ -2,8 +2,15 @@ import concurrent
 import logging
 from typing import Tuple
 
-from drivers.runners.bing_driver import BingDriver
-from drivers.runners.site_scraper_driver import SiteScraperDriver
+from drivers.runners.bing_driver import BingDriver, DEFAULT_DOWNLOAD_CONCURRENCY, DEFAULT_MAX_DOWNLOADS_PER_HOST, \
+    DEFAULT_SEARCH_CONCURRENCY
+from drivers.runners.site_scraper_driver import SiteScraperDriver, DEFAULT_PAGE_WRITE_BATCH_SIZE, \
+    OUTPUT_FORMAT_FILES
+from drivers.utilities.bing_client import DEFAULT_REQUESTS_PER_SECOND
+from drivers.utilities.file import DEFAULT_MAX_CONCURRENT_WRITES
+from drivers.utilities.file_cache import DEFAULT_MAX_BYTES
+from drivers.utilities.page_shards import DEFAULT_SHARD_TARGET_BYTES
+from drivers.utilities.search_cache import DEFAULT_NEGATIVE_TTL_SECONDS, DEFAULT_TTL_SECONDS
 
 
 class RootDriver:
@@ -12,6 +19,22 @@ class RootDriver:
 
     @base_dir: The base directory where all the files will be stored.
     @max_pages_per_domain: The maximum number of pages to crawl per domain.
+    @site_scraper_parallelism: The number of websites crawled concurrently inside each crawler process.
+    @crawler_processes: The number of long-lived crawler processes used by the site scraper.
+    @state_dir: The local directory where the crawl state (e.g. HTTP validators) is kept between runs.
+    @max_concurrent_requests: The maximum number of concurrent requests of each crawled website.
+    @max_concurrent_requests_per_host: The maximum number of concurrent requests to a single host.
+    @bing_search_concurrency: The number of laws searched for on Bing at once.
+    @bing_requests_per_second: The rate limit of the calls to Bing, i.e. the TPS of the Bing tier.
+    @bing_cache_ttl_seconds: The time the results of a Bing search are reused for.
+    @bing_cache_negative_ttl_seconds: The time a Bing search without results is reused for.
+    @law_download_concurrency: The number of PDFs of laws downloaded at once.
+    @max_law_downloads_per_host: The number of PDFs of laws downloaded at once from a single host.
+    @max_concurrent_page_writes: The number of crawled pages uploaded at once.
+    @page_write_batch_size: The number of crawled pages uploaded together.
+    @file_cache_max_bytes: The maximum size of the local copies of the files read from S3 and HTTP.
+    @site_output_format: How the crawled pages are stored, files (one per page) or shards.
+    @shard_target_bytes: The size of the shards of crawled pages.
     """
 
     def __init__(self,
@@ -21,10 +44,30 @@ class RootDriver:
                  max_pages_per_domain: int = 10,
                  max_laws: int = -1,
                  max_websites: int = -1,
-                 site_scraper_parallelism: int = 10):
+                 site_scraper_parallelism: int = 10,
+                 crawler_processes: int = 1,
+                 state_dir: str = 'crawl_state',
+                 max_concurrent_requests: int = 16,
+                 max_concurrent_requests_per_host: int = 8,
+                 bing_search_concurrency: int = DEFAULT_SEARCH_CONCURRENCY,
+                 bing_requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 bing_cache_ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 bing_cache_negative_ttl_seconds: float = DEFAULT_NEGATIVE_TTL_SECONDS,
+                 law_download_concurrency: int = DEFAULT_DOWNLOAD_CONCURRENCY,
+                 max_law_downloads_per_host: int = DEFAULT_MAX_DOWNLOADS_PER_HOST,
+                 max_concurrent_page_writes: int = DEFAULT_MAX_CONCURRENT_WRITES,
+                 page_write_batch_size: int = DEFAULT_PAGE_WRITE_BATCH_SIZE,
+                 file_cache_max_bytes: int = DEFAULT_MAX_BYTES,
+                 site_output_format: str = OUTPUT_FORMAT_FILES,
+                 shard_target_bytes: int = DEFAULT_SHARD_TARGET_BYTES):
         self.site_scraper_parallelism = site_scraper_parallelism
         self.bing_driver = BingDriver(
-            csv_path=laws_metadata_file_path, base_dir=base_dir, max_laws=max_laws)
+            csv_path=laws_metadata_file_path, base_dir=base_dir, max_laws=max_laws, state_dir=state_dir,
+            search_concurrency=bing_search_concurrency, bing_requests_per_second=bing_requests_per_second,
+            bing_cache_ttl_seconds=bing_cache_ttl_seconds,
+            bing_cache_negative_ttl_seconds=bing_cache_negative_ttl_seconds,
+            download_concurrency=law_download_concurrency, max_downloads_per_host=max_law_downloads_per_host,
+            file_cache_max_bytes=file_cache_max_bytes)
         self.site_scraper_driver = SiteScraperDriver(
             csv_path=site_scraper_metadata_file_path,
             max_pages_per_domain=max_pages_per_domain,
@@ -32,7 +75,16 @@ class RootDriver:
             should_download_pdf=False,
             base_dir=base_dir,
             max_parallelism=site_scraper_parallelism,
-            max_websites=max_websites)
+            max_websites=max_websites,
+            crawler_processes=crawler_processes,
+            state_dir=state_dir,
+            max_concurrent_requests=max_concurrent_requests,
+            max_concurrent_requests_per_host=max_concurrent_requests_per_host,
+            max_concurrent_page_writes=max_concurrent_page_writes,
+            page_write_batch_size=page_write_batch_size,
+            file_cache_max_bytes=file_cache_max_bytes,
+            output_format=site_output_format,
+            shard_target_bytes=shard_target_bytes)
 
     def run(self) -> Tuple[int, int, int, int]:
         """
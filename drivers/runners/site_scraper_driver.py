@@ -1,20 +1,56 @@
 # Use WebSiteCrawlerScrapy to crawl the website.
 # Assume that the input is a list of URLs that are read from a CSV file.
-import concurrent
 import csv
+import io
 import logging
 import os
 
 from drivers.common.input_elem import InputElem
-from drivers.crawler.utils.helper_methods import extract_domain, extract_file_name_from_url, unify_csv_format
-from drivers.crawler.website_crawler_scrapy import WebSiteCrawlerScrapy
-from drivers.utilities.file import File
-from typing import List, Tuple
+from drivers.common.parsed_object import ParsedObject
+from drivers.crawler.utils.helper_methods import extract_domain, get_canonical_url, get_content_hash, \
+    unify_csv_format
+from drivers.crawler.website_crawler_scrapy import WebSiteCrawlerScrapy, PAGE_EVENT, \
+    DEFAULT_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT_REQUESTS_PER_HOST
+from drivers.utilities.content_index import ContentIndex
+from drivers.utilities.file import File, DEFAULT_MAX_CONCURRENT_WRITES
+from drivers.utilities.file_cache import DEFAULT_MAX_BYTES
+from drivers.utilities.metrics import SITE_PAGES
+from drivers.utilities.page_shards import ShardWriter, DEFAULT_SHARD_TARGET_BYTES, parse_record_url
+from drivers.utilities.validator_store import ValidatorStore
+from typing import List, NamedTuple, Optional, Tuple
 
 RUN_PARALLEL = True
 
 METADATA_FILE_NAME = 'metadata.csv'
 
+VALIDATOR_STORE_FILE_NAME = 'validators.db'
+
+CONTENT_INDEX_FILE_NAME = 'content_index.db'
+
+FRONTIER_DIR_NAME = 'frontier'
+
+FILE_CACHE_DIR_NAME = 'file_cache'
+
+SHARD_DIR_NAME = 'shards'
+
+# The ways the pages of a website are stored: a .txt file per page, or packed into compressed shards.
+OUTPUT_FORMAT_FILES = 'files'
+OUTPUT_FORMAT_SHARDS = 'shards'
+
+PDF_DIR_NAME = 'pdfs'
+
+# The number of new pages whose files are uploaded together. Smaller batches are uploaded when a website is done.
+DEFAULT_PAGE_WRITE_BATCH_SIZE = 100
+
+
+class PageWrite(NamedTuple):
+    # A new page whose file (or shard) is waiting to be uploaded with the rest of its batch.
+    task_id: int
+    in_element: InputElem
+    page: dict
+    file_url: Optional[str]
+    content_hash: str
+
 
 class SiteScraperDriver:
     def __init__(self, csv_path: str,
@@ -23,17 +59,53 @@ class SiteScraperDriver:
                  should_download_pdf: bool,
                  base_dir: str,
                  max_parallelism: int,
-                 max_websites: int):
-        self.file = File()
+                 max_websites: int,
+                 crawler_processes: int = 1,
+                 state_dir: str = 'crawl_state',
+                 max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+                 max_concurrent_requests_per_host: int = DEFAULT_MAX_CONCURRENT_REQUESTS_PER_HOST,
+                 max_concurrent_page_writes: int = DEFAULT_MAX_CONCURRENT_WRITES,
+                 page_write_batch_size: int = DEFAULT_PAGE_WRITE_BATCH_SIZE,
+                 file_cache_max_bytes: int = DEFAULT_MAX_BYTES,
+                 output_format: str = OUTPUT_FORMAT_FILES,
+                 shard_target_bytes: int = DEFAULT_SHARD_TARGET_BYTES):
+        if output_format not in (OUTPUT_FORMAT_FILES, OUTPUT_FORMAT_SHARDS):
+            raise Exception(f'Unknown output format {output_format}.')
+        # The input CSV is read from the local cache while it is not modified.
+        self.file = File(cache_dir=os.path.join(state_dir, FILE_CACHE_DIR_NAME), cache_max_bytes=file_cache_max_bytes)
         self.scrapy_crawler = WebSiteCrawlerScrapy()
         self.csv_path = csv_path
         self.max_pages_per_domain = max_pages_per_domain
         self.should_recurse = should_recurse
         self.should_download_pdf = should_download_pdf
         self.target_base_dir = base_dir
+        # The number of spiders that each crawler process runs concurrently.
         self.max_parallelism = max_parallelism
+        # The number of long-lived crawler processes that the websites are spread across.
+        self.crawler_processes = crawler_processes
+        # The caps on the number of concurrent requests of each website and to each host.
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_concurrent_requests_per_host = max_concurrent_requests_per_host
+        # The new pages are uploaded in batches of @page_write_batch_size, @max_concurrent_page_writes at once.
+        self.max_concurrent_page_writes = max_concurrent_page_writes
+        self.page_write_batch_size = max(1, page_write_batch_size)
+        # With the shards output format, the pages of every website are packed into shards of
+        # @shard_target_bytes in its shards directory. The pages of a shard are recorded once it is uploaded.
+        self.output_format = output_format
+        self.shard_target_bytes = shard_target_bytes
+        self.shard_writers = {}
+        self.shard_pages = {}
+        # The locations of the contents in the current shard of every website, keyed by their hash.
+        self.shard_locations = {}
         self.is_s3_file = base_dir.startswith('s3://')
         self.max_websites = max_websites
+        # Remembers the validators of every written page, so that unchanged pages are skipped on a 304.
+        self.validator_store_path = os.path.join(state_dir, VALIDATOR_STORE_FILE_NAME)
+        self.validator_store = ValidatorStore(self.validator_store_path)
+        # Remembers the hash and location of every written page.
+        self.content_index = ContentIndex(os.path.join(state_dir, CONTENT_INDEX_FILE_NAME))
+        # Every website keeps its crawl frontier here, so that interrupted crawls resume on the next run.
+        self.frontier_base_dir = os.path.join(state_dir, FRONTIER_DIR_NAME)
 
     def ping(self) -> str:
         logging.info('Pinging SiteScraperDriver...')
@@ -51,27 +123,47 @@ class SiteScraperDriver:
         # Find length of in_elements it is a list
         num_websites_crawled = in_elements.__len__()
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_parallelism) as executor: # noqa
-            # map the crawling function to each url, returns immediately with future objects
-            future_to_url = {executor.submit(
-                self.__crawl_website, in_element): in_element for in_element in in_elements}
-
-            for future in concurrent.futures.as_completed(future_to_url): # noqa
-                in_element = future_to_url[future]
+        # Every website becomes a spider in one of the long-lived crawler processes. Pages are written
+        # in batches as they are streamed back, only their metadata rows are kept until the website is done.
+        tasks = [self.__get_crawl_task(in_element) for in_element in in_elements]
+        metadata_rows = [[] for _ in in_elements]
+        pdf_rows = [[] for _ in in_elements]
+        page_writes = []
+        crawl_events = self.scrapy_crawler.crawl_many(
+            tasks,
+            num_processes=self.crawler_processes,
+            spiders_per_process=self.max_parallelism,
+            max_concurrent_requests=self.max_concurrent_requests,
+            max_concurrent_requests_per_host=self.max_concurrent_requests_per_host,
+            files_store=self.target_base_dir if self.should_download_pdf else None)
+        for event, task_id, payload in crawl_events:
+            in_element = in_elements[task_id]
+            if event == PAGE_EVENT:
                 try:
-                    url_content_map = future.result()  # get the result (or exception) of the future
+                    row = self.__add_page(task_id, in_element, payload, page_writes)
+                    if row is not None:
+                        metadata_rows[task_id].append(row)
+                    pdf_rows[task_id].extend(self.__get_pdf_rows(in_element, payload))
                 except Exception as exc:
-                    logging.error(
-                        f'An error occurred while crawling {in_element.site_name}: {exc}')
-                else:
-                    self.__write_content_metadata_to_files(
-                        in_element, url_content_map)
-                    logging.info(
-                        f'Finished crawling {in_element.site_name} with {len(url_content_map)} pages.')
-                    num_pages_crawled += len(url_content_map)
-
-        # Wait for all the futures to complete.
-        concurrent.futures.wait(future_to_url) # noqa
+                    SITE_PAGES.inc(outcome='failed')
+                    logging.error(f'Failed to write {payload["url"]}: {exc}')
+                if len(page_writes) >= self.page_write_batch_size:
+                    self.__write_pages(page_writes, metadata_rows)
+                continue
+            if payload is not None:
+                logging.error(
+                    f'An error occurred while crawling {in_element.site_name}: {payload}')
+            # Upload the pending pages (of every website), so that the metadata of this one is complete.
+            self.__write_pages(page_writes, metadata_rows)
+            self.__close_shard(task_id, metadata_rows)
+            # Persist whatever was crawled, even if the crawl died part-way.
+            rows, pdfs = metadata_rows[task_id], pdf_rows[task_id]
+            metadata_rows[task_id], pdf_rows[task_id] = [], []
+            if len(rows) + len(pdfs) > 0:
+                self.__write_metadata(in_element, rows + pdfs)
+            logging.info(
+                f'Finished crawling {in_element.site_name} with {len(rows)} pages and {len(pdfs)} PDFs.')
+            num_pages_crawled += len(rows)
 
         return num_pages_crawled, num_websites_crawled
 
@@ -117,45 +209,218 @@ class SiteScraperDriver:
 
         return in_elements
 
-    def __crawl_website(self, in_element: InputElem) -> dict:
-        return self.scrapy_crawler.crawl([in_element.url],
-                                         [in_element.allowed_domains],
-                                         self.should_recurse,
-                                         self.max_pages_per_domain,
-                                         self.should_download_pdf,
-                                         "")
-
-    # Does the following:-
-    # 1. Writes the content of the downloaded pages to separate .txt files.
-    # 2. Writes a csv file with the metadata of the downloaded laws.
-    #    Note: CSV Format is: url, file_name, jurisdiction, category
+    def __get_crawl_task(self, in_element: InputElem) -> dict:
+        return {
+            'start_urls': [in_element.url],
+            'allowed_domains': [in_element.allowed_domains],
+            'should_recurse': self.should_recurse,
+            'max_links': self.max_pages_per_domain,
+            'download_pdfs': self.should_download_pdf,
+            'filter': "",
+            'validator_store_path': self.validator_store_path,
+            'frontier_dir': os.path.join(self.frontier_base_dir, in_element.jurisdiction, in_element.category,
+                                         in_element.site_name),
+            # The PDFs are stored by the crawler itself, next to the pages of the website.
+            'pdf_dir': f'{in_element.jurisdiction}/{in_element.category}/{in_element.site_name}/{PDF_DIR_NAME}'
+        }
+
+    def __get_target_directory(self, in_element: InputElem) -> str:
+        return f'{self.target_base_dir}/{in_element.jurisdiction}/{in_element.category}/{in_element.site_name}'
+
+    # Handles a downloaded page. Its content goes to a content-addressed .txt file named after the MD5 hash of
+    # the content (or to a shard of the website), so identical pages of a website are stored once and pages
+    # whose content did not change are not written again. A page whose content has to be written is added to
+    # @page_writes, to be uploaded with the rest of its batch by __write_pages.
     #
-    # @url_content_map: A dictionary with the URL as the key and the content of the page as the value.
-    # @return: None
-    def __write_content_metadata_to_files(self, in_element: InputElem, url_content_map: dict) -> None:
-        jurisdiction = in_element.jurisdiction
-        category = in_element.category
-        site_name = in_element.site_name
-
-        target_directory = f'{self.target_base_dir}/{jurisdiction}/{category}/{site_name}'
-
-        data_to_write = []
-        for url, content in url_content_map.items():
-            file_name = extract_file_name_from_url(url)
-            self.file.write(content, f'{target_directory}/{file_name}')
-            data_to_write.append({
-                "title": site_name,
-                "jurisdiction": jurisdiction,
-                "category": category,
-                "url": url,
-                "file_name": file_name
-            })
+    # @page: The item scraped by DecoverSpider.
+    # @page_writes: The pages waiting to be uploaded.
+    # @return: The metadata row of the page, or None if it is waiting to be uploaded or nothing is known about
+    #          a page that was not modified.
+    def __add_page(self, task_id: int, in_element: InputElem, page: dict,
+                   page_writes: List[PageWrite]) -> Optional[dict]:
+        url = page['url']
+        source_url = get_canonical_url(url)
+        if page['not_modified']:
+            parsed_object = self.content_index.get(source_url)
+            if parsed_object is None:
+                # Forget the validators, so that the page is downloaded again on the next run.
+                logging.warning(f'No stored content for {url}, it will be downloaded on the next run.')
+                self.validator_store.put(url)
+                SITE_PAGES.inc(outcome='not_stored')
+                return None
+            SITE_PAGES.inc(outcome='not_modified')
+            return self.__get_page_row(in_element, url, parsed_object.file_url)
+        target_directory = self.__get_target_directory(in_element)
+        if self.output_format == OUTPUT_FORMAT_SHARDS:
+            target_directory = f'{target_directory}/{SHARD_DIR_NAME}'
+        content_hash = get_content_hash(page['content'])
+        file_url = self.content_index.find_file(target_directory, content_hash)
+        if file_url is None:
+            # The location of a page in a shard is only known once it is appended to it.
+            page_writes.append(PageWrite(task_id=task_id, in_element=in_element, page=page,
+                                         file_url=f'{target_directory}/{content_hash}.txt'
+                                         if self.output_format == OUTPUT_FORMAT_FILES else None,
+                                         content_hash=content_hash))
+            return None
+        SITE_PAGES.inc(outcome='duplicate')
+        return self.__record_page(in_element, page, file_url, content_hash)
 
+    # Uploads the files of the pending pages concurrently, and records the pages whose file was written.
+    # The pages that failed are logged and left out, so that they are downloaded again on the next run.
+    #
+    # @page_writes: The pages waiting to be uploaded. The list is emptied.
+    # @metadata_rows: The metadata rows of every website, that the rows of the written pages are added to.
+    def __write_pages(self, page_writes: List[PageWrite], metadata_rows: List[List[dict]]) -> None:
+        if len(page_writes) == 0:
+            return
+        batch = list(page_writes)
+        page_writes.clear()
+        if self.output_format == OUTPUT_FORMAT_SHARDS:
+            self.__write_pages_to_shards(batch, metadata_rows)
+            return
+        failed = self.file.write_many(((page_write.file_url, page_write.page['content']) for page_write in batch),
+                                      max_concurrent_writes=self.max_concurrent_page_writes)
+        for page_write in batch:
+            if page_write.file_url in failed:
+                SITE_PAGES.inc(outcome='failed')
+                logging.error(f'Failed to write {page_write.page["url"]}: {failed[page_write.file_url]}')
+                continue
+            self.__record_written_page(page_write, metadata_rows)
+        if len(failed) > 0:
+            logging.error(f'Failed to write {len(failed)} of the {len(batch)} pages of the batch.')
+
+    # Appends the pending pages to the current shards of their websites, and uploads the shards that are full.
+    def __write_pages_to_shards(self, batch: List[PageWrite], metadata_rows: List[List[dict]]) -> None:
+        for page_write in batch:
+            task_id = page_write.task_id
+            writer = self.shard_writers.get(task_id)
+            if writer is None:
+                shard_directory = f'{self.__get_target_directory(page_write.in_element)}/{SHARD_DIR_NAME}'
+                writer = self.shard_writers[task_id] = ShardWriter(self.file, shard_directory,
+                                                                   self.shard_target_bytes)
+                self.shard_pages[task_id] = []
+                self.shard_locations[task_id] = {}
+            # Identical contents are appended to the shard once.
+            record_url = self.shard_locations[task_id].get(page_write.content_hash)
+            if record_url is None:
+                location = writer.add({'url': page_write.page['url'], 'hash': page_write.content_hash,
+                                       'content': page_write.page['content']})
+                record_url = self.shard_locations[task_id][page_write.content_hash] = location.to_url()
+            # The content is in the shard, only the rest of the page is kept until the shard is uploaded.
+            page = {key: value for key, value in page_write.page.items() if key != 'content'}
+            self.shard_pages[task_id].append(page_write._replace(page=page, file_url=record_url))
+            if writer.is_full():
+                self.__flush_shard(task_id, metadata_rows)
+
+    # Uploads the current shard of a website, and records its pages.
+    def __flush_shard(self, task_id: int, metadata_rows: List[List[dict]]) -> None:
+        writer = self.shard_writers.get(task_id)
+        if writer is None:
+            return
+        pending, self.shard_pages[task_id] = self.shard_pages[task_id], []
+        self.shard_locations[task_id] = {}
+        try:
+            writer.flush()
+        except Exception as exc:
+            SITE_PAGES.inc(len(pending), outcome='failed')
+            logging.error(f'Failed to write a shard of {len(pending)} pages to {writer.directory}: {exc}')
+            return
+        for page_write in pending:
+            self.__record_written_page(page_write, metadata_rows)
+
+    # Uploads the last shard of a website that is done.
+    def __close_shard(self, task_id: int, metadata_rows: List[List[dict]]) -> None:
+        self.__flush_shard(task_id, metadata_rows)
+        self.shard_writers.pop(task_id, None)
+        self.shard_pages.pop(task_id, None)
+        self.shard_locations.pop(task_id, None)
+
+    def __record_written_page(self, page_write: PageWrite, metadata_rows: List[List[dict]]) -> None:
+        SITE_PAGES.inc(outcome='written')
+        try:
+            metadata_rows[page_write.task_id].append(self.__record_page(
+                page_write.in_element, page_write.page, page_write.file_url, page_write.content_hash))
+        except Exception as exc:
+            logging.error(f'Failed to record {page_write.page["url"]}: {exc}')
+
+    # Remembers the location of the content of a page and its validators. The file of the earlier content of
+    # the page is deleted if no other page is stored in it.
+    #
+    # @return: The metadata row of the page.
+    def __record_page(self, in_element: InputElem, page: dict, file_url: str, content_hash: str) -> dict:
+        url = page['url']
+        source_url = get_canonical_url(url)
+        previous_object = self.content_index.get(source_url)
+        parsed_object = ParsedObject(file_url=file_url, jurisdiction=in_element.jurisdiction,
+                                     source_url=source_url, category=in_element.category,
+                                     hash=content_hash, title=in_element.site_name)
+        self.content_index.put(parsed_object)
+        self.validator_store.put(url, links=page['links'], **page['validators'])
+        if previous_object is not None and previous_object.file_url != file_url:
+            self.__delete_unreferenced_file(previous_object.file_url)
+        return self.__get_page_row(in_element, url, file_url)
+
+    # Deletes a content file that no page is stored in anymore. A record in a shard is left in it, since a
+    # shard is never rewritten.
+    def __delete_unreferenced_file(self, file_url: str) -> None:
+        if parse_record_url(file_url) is not None or self.content_index.count_sources(file_url) > 0:
+            return
+        try:
+            self.file.delete(file_url)
+        except Exception as exc:
+            logging.warning(f'Failed to delete {file_url}, which is not referenced anymore: {exc}')
+
+    def __get_page_row(self, in_element: InputElem, url: str, file_url: str) -> dict:
+        # The file name is relative to the directory of the website, e.g. <hash>.txt or
+        # shards/<shard>.jsonl.zst#<offset>-<length> for a page in a shard.
+        target_directory = self.__get_target_directory(in_element)
+        return {
+            "title": in_element.site_name,
+            "jurisdiction": in_element.jurisdiction,
+            "category": in_element.category,
+            "url": url,
+            "file_name": file_url[len(target_directory) + 1:] if file_url.startswith(f'{target_directory}/')
+            else os.path.basename(file_url)
+        }
+
+    # Returns the metadata rows of the PDFs that the crawler downloaded from a page.
+    def __get_pdf_rows(self, in_element: InputElem, page: dict) -> List[dict]:
+        return [{
+            "title": in_element.site_name,
+            "jurisdiction": in_element.jurisdiction,
+            "category": in_element.category,
+            "url": pdf['url'],
+            "file_name": os.path.basename(pdf['path'])
+        } for pdf in page.get('pdfs', [])]
+
+    # Writes a csv file with the metadata of the downloaded pages. The rows of the pages (and PDFs) stored in
+    # earlier runs are kept, since a run only crawls part of a website, and the rows of this run replace the
+    # earlier rows of the same URLs.
+    # Note: CSV Format is: url, file_name, jurisdiction, category
+    #
+    # @data_to_write: The metadata rows of the pages.
+    # @return: None
+    def __write_metadata(self, in_element: InputElem, data_to_write: List[dict]) -> None:
+        target_file_path = f'{self.__get_target_directory(in_element)}/{METADATA_FILE_NAME}'
+        try:
+            rows = {row['url']: row for row in self.__read_metadata(target_file_path)}
+        except Exception as exc:
+            # Keep the existing metadata rather than replace it with the rows of this run only.
+            logging.error(f'Failed to read {target_file_path}, it is not updated: {exc}')
+            return
+        rows.update((row['url'], row) for row in data_to_write)
         with open(METADATA_FILE_NAME, 'w') as f:
-            unify_csv_format(f, data_to_write)
+            unify_csv_format(f, list(rows.values()))
 
         # Put the metadata file in S3
-        target_file_path = f'{target_directory}/{METADATA_FILE_NAME}'
         self.file.write_file(f, target_file_path)
         logging.info(f'Uploading metadata file to {target_file_path}')
         os.remove(METADATA_FILE_NAME)
+
+    # Reads the rows of an existing metadata file.
+    #
+    # @return: The rows, none if the file does not exist.
+    def __read_metadata(self, file_path: str) -> List[dict]:
+        if not self.file.exists(file_path):
+            return []
+        return list(csv.DictReader(io.StringIO(self.file.read(file_path))))
@@ -5,12 +5,32 @@ import json
 # -*- coding: utf-8 -*-
 import logging
 import os
+import random
+import time
+from typing import List, Optional
 
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 
+from drivers.utilities.metrics import BING_CACHE_LOOKUPS, BING_LATENCY, BING_REQUESTS
+from drivers.utilities.rate_limiter import TokenBucket
+from drivers.utilities.search_cache import SearchCache
 from drivers.utilities.web_page_info import WebPageInfo
 
+# The default rate limit of the calls to the API, the one of the free tier. Set it to the TPS of the tier of the key.
+# Refer: https://www.microsoft.com/en-us/bing/apis/pricing
+DEFAULT_REQUESTS_PER_SECOND = 3
+# The default number of connections kept open to the API, i.e. of calls made at once.
+DEFAULT_MAX_CONNECTIONS = 8
+# The calls that fail with these status codes, or without a response, are retried.
+RETRY_HTTP_CODES = {429, 500, 502, 503, 504}
+DEFAULT_MAX_RETRIES = 5
+# The backoff before the nth retry is a random time up to min(BACKOFF_MAX, BACKOFF_BASE * 2 ** n) seconds.
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30
+REQUEST_TIMEOUT_SECONDS = 30
+
 
 # ''' This sample makes a call to the Bing Web Search API with a query and returns relevant web search.
 # Documentation: https://docs.microsoft.com/en-us/bing/search-apis/bing-web-search/overview '''
@@ -24,7 +44,8 @@ def remove_html_tags(text: str) -> str:
 
 def extract_news_info(data: str) -> list:
     webpages = []
-    for item in data['value']:
+    # Bing leaves the value out when there are no results.
+    for item in data.get('value', []):
         url = item['url']
         name = remove_html_tags(item['name'])
         snippet = item['description']
@@ -34,7 +55,8 @@ def extract_news_info(data: str) -> list:
 
 def extract_webpage_info(data: str) -> list:
     webpages = []
-    for page in data["webPages"]["value"]:
+    # Bing leaves webPages out when there are no results.
+    for page in data.get('webPages', {}).get('value', []):
         name = page["name"]
         url = page["url"]
         snippet = page["snippet"]
@@ -42,15 +64,44 @@ def extract_webpage_info(data: str) -> list:
     return webpages
 
 
+def get_backoff(attempt: int, response: requests.Response = None) -> float:
+    """
+    Returns the time to wait before retrying a call: the Retry-After of a throttled response if it has one,
+    otherwise a random time up to an exponentially growing cap (full jitter), so that the threads that were
+    throttled together do not retry together.
+    """
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after is not None and retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAX_SECONDS)
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
 class BingClient:
     """
     This class is used to search for a query using Bing Search API.
     """
 
-    def __init__(self):
+    def __init__(self, requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS, max_retries: int = DEFAULT_MAX_RETRIES,
+                 cache: Optional[SearchCache] = None):
+        """
+        :param requests_per_second: The maximum rate of the calls to the API, to match the tier of the key.
+        :param max_connections: The number of connections kept open to the API. It is safe to search from as
+                                many threads at once.
+        :param max_retries: The number of times a call is retried on a 429, a 5xx or a connection error.
+        :param cache: The cache the results are reused from, if any.
+        """
+        self.cache = cache
         self.subscription_key = os.environ.get('BING_SEARCH_V7_SUBSCRIPTION_KEY')
         self.search_url = "https://api.bing.microsoft.com/v7.0/search"
         self.news_search_url = "https://api.bing.microsoft.com/v7.0/news/search"
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.max_retries = max_retries
+        # The session reuses the connections to the API across the calls of every thread.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_connections), pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
     def news_search(self, search_term: str, source_country: str) -> list:
         webpages = []
@@ -60,13 +111,15 @@ class BingClient:
             # Construct a request.
             mkt = 'en-US' if source_country == 'United States' else 'en-IN'
             headers = {"Ocp-Apim-Subscription-Key": self.subscription_key}
+            cached = self.__get_cached('news', search_term, mkt)
+            if cached is not None:
+                return cached
             params = {"q": search_term, "textDecorations": True, "textFormat": "HTML", "mkt": mkt}
-            response = requests.get(self.news_search_url, headers=headers, params=params)
-            response.raise_for_status()
+            response = self.__get('news', self.news_search_url, headers, params)
             search_results = response.json()
 
             # Print the response in a pretty way.
-            return extract_news_info(search_results)
+            return self.__put_cached('news', search_term, mkt, extract_news_info(search_results))
 
         except Exception as ex:
             logging.error(f'Exception occurred while calling Bing Search API: {ex}')
@@ -80,14 +133,63 @@ class BingClient:
             # Construct a request.
             mkt = 'en-US' if source_country == 'United States' else 'en-IN'
             headers = {"Ocp-Apim-Subscription-Key": self.subscription_key}
+            cached = self.__get_cached('web', search_term, mkt)
+            if cached is not None:
+                return cached
             params = {"q": search_term, "textDecorations": True, "textFormat": "HTML", "mkt": mkt}
-            response = requests.get(self.search_url, headers=headers, params=params)
-            response.raise_for_status()
+            response = self.__get('web', self.search_url, headers, params)
             search_results = response.json()
 
             # Print the response in a pretty way.
-            return extract_webpage_info(search_results)
+            return self.__put_cached('web', search_term, mkt, extract_webpage_info(search_results))
 
         except Exception as ex:
             logging.error(f'Exception occurred while calling Bing Search API: {ex}')
-            raise ex
\ No newline at end of file
+            raise ex
+
+    def __get_cached(self, endpoint: str, search_term: str, mkt: str) -> Optional[List[WebPageInfo]]:
+        if self.cache is None:
+            return None
+        results = self.cache.get(endpoint, search_term, mkt)
+        BING_CACHE_LOOKUPS.inc(result='miss' if results is None else 'hit')
+        if results is None:
+            return None
+        return [WebPageInfo(result['name'], result['url'], result['snippet']) for result in results]
+
+    def __put_cached(self, endpoint: str, search_term: str, mkt: str,
+                     webpages: List[WebPageInfo]) -> List[WebPageInfo]:
+        if self.cache is not None:
+            self.cache.put(endpoint, search_term, mkt,
+                           [{'name': page.name, 'url': page.url, 'snippet': page.snippet} for page in webpages])
+        return webpages
+
+    def __get(self, endpoint: str, url: str, headers: dict, params: dict) -> requests.Response:
+        # Calls the API within the rate limit, retrying throttled and failed calls with a jittered exponential
+        # backoff, and counts the calls and their latency per endpoint.
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            response, error = None, None
+            try:
+                with BING_LATENCY.time(endpoint=endpoint):
+                    response = self.session.get(url, headers=headers, params=params,
+                                                timeout=REQUEST_TIMEOUT_SECONDS)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = exc
+            if (error is not None or response.status_code in RETRY_HTTP_CODES) and attempt < self.max_retries:
+                BING_REQUESTS.inc(endpoint=endpoint, outcome='retried')
+                delay = get_backoff(attempt, response)
+                logging.warning(f'Bing Search API call failed ({error or response.status_code}), '
+                                f'retrying in {delay:.1f}s.')
+                time.sleep(delay)
+                attempt += 1
+                continue
+            try:
+                if error is not None:
+                    raise error
+                response.raise_for_status()
+            except Exception:
+                BING_REQUESTS.inc(endpoint=endpoint, outcome='error')
+                raise
+            BING_REQUESTS.inc(endpoint=endpoint, outcome='ok')
+            return response
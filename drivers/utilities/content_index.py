@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional
+
+from drivers.common.parsed_object import ParsedObject
+
+
+class ContentIndex:
+    """
+    This class is a content-addressed index of everything that was written to storage. Each entry is a
+    ParsedObject keyed by its source (the canonical URL of a page or the URL of a law), recording the
+    file it is stored in and the MD5 hash of its contents. It is used to skip writes whose contents are
+    unchanged and to store identical contents only once per directory.
+    It is backed by SQLite and is safe to use from several threads and processes.
+    """
+
+    def __init__(self, db_path: str):
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS objects ('
+                                    'source_url TEXT PRIMARY KEY, file_url TEXT, directory TEXT, hash TEXT, '
+                                    'jurisdiction TEXT, category TEXT, title TEXT, date TEXT)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS objects_by_hash ON objects (directory, hash)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS objects_by_file ON objects (file_url)')
+
+    def get(self, source_url: str) -> Optional[ParsedObject]:
+        """
+        Returns the object that was last written for the source.
+        :param source_url: The canonical URL of the page or the URL of the law.
+        :return: The ParsedObject or None if the source was never written.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT file_url, hash, jurisdiction, category, title, date FROM objects WHERE source_url = ?',
+                (source_url,)).fetchone()
+        if row is None:
+            return None
+        file_url, content_hash, jurisdiction, category, title, date = row
+        return ParsedObject(file_url=file_url, jurisdiction=jurisdiction, source_url=source_url,
+                            category=category, date=datetime.fromisoformat(date) if date else None,
+                            hash=content_hash, title=title)
+
+    def find_file(self, directory: str, content_hash: str) -> Optional[str]:
+        """
+        Returns a file in the directory that already stores contents with the hash.
+        :param directory: The directory the file is stored in.
+        :param content_hash: The MD5 hash of the contents.
+        :return: The location of the file or None.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT file_url FROM objects WHERE directory = ? AND hash = ? LIMIT 1',
+                (directory, content_hash)).fetchone()
+        return row[0] if row else None
+
+    def count_sources(self, file_url: str) -> int:
+        """
+        Returns the number of sources whose contents are stored in the file.
+        :param file_url: The location of the file.
+        """
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM objects WHERE file_url = ?',
+                                           (file_url,)).fetchone()[0]
+
+    def put(self, parsed_object: ParsedObject) -> None:
+        """
+        Records that the contents of parsed_object.source_url are stored in parsed_object.file_url.
+        """
+        date = parsed_object.date or datetime.utcnow()
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (parsed_object.source_url, parsed_object.file_url, os.path.dirname(parsed_object.file_url),
+                 parsed_object.hash, parsed_object.jurisdiction, parsed_object.category, parsed_object.title,
+                 date.isoformat()))
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
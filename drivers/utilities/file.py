@@ -1,26 +1,39 @@
 # Fixes error "Alternative syntax for unions requires Python 3.10 or newer"
 from __future__ import annotations
 
+import io
 import logging
 import os
+import random
 import re
-import tempfile
+import shutil
+import time
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
 from logging.config import dictConfig
 
 import pytesseract
 import requests
-from PIL import Image
-from pdf2image import convert_from_path
+from pdf2image import convert_from_bytes
 from pdfminer.converter import TextConverter
 from pdfminer.pdfinterp import PDFPageInterpreter
 from pdfminer.pdfinterp import PDFResourceManager
 from pdfminer.pdfpage import PDFPage
 from docx import Document
-from typing import IO
+from typing import IO, Dict, Iterable, Iterator, Optional, Tuple
 
+from drivers.utilities.file_cache import FileCache, DEFAULT_MAX_BYTES
+from drivers.utilities.key_index import KeyIndex
+from drivers.utilities.metrics import FILE_CACHE_LOOKUPS, FILE_WRITES, FILE_WRITTEN_BYTES
 from drivers.utilities.s3_client import S3Client
+from drivers.utilities.validator_store import get_validators
+
+# The number of files written at once by write_many, and the number of times a failed write is retried,
+# waiting a random time of up to WRITE_BACKOFF_SECONDS * 2^attempt (full jitter) in between.
+DEFAULT_MAX_CONCURRENT_WRITES = 16
+DEFAULT_WRITE_RETRIES = 3
+WRITE_BACKOFF_SECONDS = 0.5
 
 dictConfig({
     'version': 1,
@@ -39,57 +52,89 @@ dictConfig({
 })
 
 
-def read_pdf_with_ocr(file_path):
+def read_pdf_with_ocr(in_file: IO[bytes]) -> str:
     """
-    This method reads the contents of a PDF using OCR.
-    :param file_path: The path to the PDF file.
+    This method reads the contents of a PDF using OCR. The pages are rendered and recognized in memory, so
+    that concurrent reads do not share any temporary files.
+    :param in_file: The PDF as a binary file object.
     :return: The contents of the file.
     """
-    logging.info(f"Reading PDF with OCR: {file_path}")
-    # Step I: Convert PDF to JPG.
-    pdf_pages = convert_from_path(file_path, 500)
-
-    # Step II: Create tempdir if it does not exist
-    tempdir = os.path.join(os.path.dirname(file_path), 'temp')
-    if not os.path.exists(tempdir):
-        os.mkdir(tempdir)
+    logging.info(f"Reading PDF with OCR: {getattr(in_file, 'name', 'stream')}")
+    # Step I: Convert PDF to images.
+    in_file.seek(0)
+    pdf_pages = convert_from_bytes(in_file.read(), 500)
 
-    # Step III: List of image files.
-    image_file_list = []
+    # Step II: Recognize the text of each page.
     result = ''
-
-    # Step IV: Convert PDF to JPG
-    for page_enumeration, page in enumerate(pdf_pages, start=1):
-        # Create a file name to store the image
-        filename = f"{tempdir}/page_{page_enumeration:03}.jpg"
-
-        # Declaring filename for each page of PDF as JPG
-        # For each page, filename will be:
-        # PDF page 1 -> page_001.jpg
-        # PDF page 2 -> page_002.jpg
-        # PDF page 3 -> page_003.jpg
-        # PDF page n -> page_00n.jpg
-        # ....
-
-        # Save the image of the page in system
-        page.save(filename, "JPEG")
-        image_file_list.append(filename)
-        text = str((pytesseract.image_to_string(Image.open(filename))))
+    for page in pdf_pages:
+        text = str((pytesseract.image_to_string(page)))
 
         # Replace \n with space
         text = text.replace('-\n', '')
         result += text
 
-        # Delete the temp file.
-        if os.path.exists(filename):
-            os.remove(filename)
+    # Step III: Return the result
+    return result
 
-    # Step V: Delete the temp directory.
-    if os.path.exists(tempdir):
-        os.rmdir(tempdir)
 
-    # Step VI: Return the result
-    return result
+def read_pdf(in_file: IO[bytes]) -> str:
+    """
+    This method extracts the text of a PDF, with OCR if it has no text layer.
+    :param in_file: The PDF as a binary file object.
+    :return: The contents of the file.
+    """
+    resource_manager = PDFResourceManager()
+    string_io = StringIO()
+    converter = TextConverter(resource_manager, string_io)
+    page_interpreter = PDFPageInterpreter(resource_manager, converter)
+    for page in PDFPage.get_pages(in_file):
+        page_interpreter.process_page(page)
+    file_contents = string_io.getvalue()
+    converter.close()
+    string_io.close()
+    contents_normalized = re.sub('[^a-zA-Z0-9. ]+', '', file_contents)
+    if len(contents_normalized) > 0:
+        return contents_normalized
+    return read_pdf_with_ocr(in_file)
+
+
+def read_file_object(in_file: IO[bytes], file_name: str) -> str:
+    """
+    This method reads the contents of a file object, by the extension of its file name.
+    :param in_file: The file as a binary file object.
+    :param file_name: The name of the file.
+    :return: The contents of the file.
+    """
+    if file_name.endswith('.pdf'):  # Check if the input_file_name is a PDF
+        return read_pdf(in_file)
+
+    # Check if the input_file_name is a docx
+    if file_name.endswith('.docx'):
+        doc = Document(in_file)
+        fullText = []
+        for paragraph in doc.paragraphs:
+            fullText.append(paragraph.text)
+        return '\n'.join(fullText)
+
+    # If the input_file_name is not a PDF, it is assumed to be a regular UTF-8 text input_file_name
+    return io.TextIOWrapper(in_file, encoding='utf-8').read()
+
+
+def get_position(in_file: IO[bytes]) -> Optional[int]:
+    """
+    :param in_file: A binary file object.
+    :return: The current position of the file object, or None if it cannot seek. (A file object may not have
+             seekable() at all, e.g. a SpooledTemporaryFile before Python 3.11.)
+    """
+    try:
+        if not in_file.seekable():
+            return None
+    except AttributeError:
+        pass
+    try:
+        return in_file.tell()
+    except (AttributeError, OSError):
+        return None
 
 
 def read_local_file(file_path):
@@ -103,37 +148,8 @@ def read_local_file(file_path):
         raise FileNotFoundError(f"File {file_path} does not exist.")
 
     logging.info(f"Reading local file: {file_path}")
-    if file_path.endswith('.pdf'):  # Check if the input_file_name is a PDF
-        with open(os.path.join(file_path), 'rb') as f:  # Open the PDF and extract its contents
-            resource_manager = PDFResourceManager()
-            string_io = StringIO()
-            converter = TextConverter(resource_manager, string_io)
-            page_interpreter = PDFPageInterpreter(resource_manager, converter)
-            for page in PDFPage.get_pages(f):
-                page_interpreter.process_page(page)
-        file_contents = string_io.getvalue()
-        converter.close()
-        string_io.close()
-        contents_normalized = re.sub('[^a-zA-Z0-9. ]+', '', file_contents)
-        if len(contents_normalized) > 0:
-            return contents_normalized
-        else:
-            file_contents = read_pdf_with_ocr(file_path)
-        return file_contents
-
-    # Check if the input_file_name is a docx
-    if file_path.endswith('.docx'):
-        doc = Document(file_path)
-        fullText = []
-        for paragraph in doc.paragraphs:
-            fullText.append(paragraph.text)
-        return '\n'.join(fullText)
-    else:
-        # If the input_file_name is not a PDF, it is assumed to be a regular text input_file_name
-        # Open the input_file_name and read its contents
-        with open(os.path.join(file_path), 'r') as f:
-            file_contents = f.read()
-    return file_contents
+    with open(file_path, 'rb') as f:
+        return read_file_object(f, file_path)
 
 
 def read_local_file_with_ocr(file_path):
@@ -166,27 +182,70 @@ class File:
     5. Reading a docx file from the local file system. (DONE)
     """
 
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None, cache_max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param cache_dir: The local directory where the files read from S3 and HTTP are cached between reads,
+                          None to always download them.
+        :param cache_max_bytes: The maximum size of the cached files.
+        """
         # The S3 client is used to read files from S3.
         self.s3_client = S3Client()
-        self.contents = ''
+        # Answers the existence checks of S3 files without calling S3.
+        self.key_index = KeyIndex(self.s3_client)
+        # Keeps copies of the remote files, revalidated with a conditional request on every read.
+        self.file_cache = FileCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
 
     def read(self, file_path: str) -> str:
         """
-        This method reads the contents of a file and returns it.
+        This method reads the contents of a file and returns it. It keeps no state, so that it is safe to
+        read from several threads at once.
         :param file_path: The path of the file.
         :return: The contents of the file.
         """
         # Step I: Check if the file is on S3.
         logging.info(f"Reading file: {file_path}")
         if file_path.startswith('s3://'):
-            self.__read_file_from_s3(file_path)
+            return self.__read_file_from_s3(file_path)
         elif file_path.startswith('http') or file_path.startswith('https'):
-            response = requests.get(file_path)
-            self.contents = response.text
+            return self.__read_url(file_path)
         else:
-            self.contents = read_local_file(file_path)
-        return self.contents
+            return read_local_file(file_path)
+
+    def open(self, file_path: str) -> IO[bytes]:
+        """
+        This method opens a file for reading its bytes, e.g. to stream a large file.
+        :param file_path: The path of the file, on S3 or local.
+        :return: A binary file object, which the caller closes.
+        """
+        if file_path.startswith('s3://'):
+            return self.__open_s3_file(urllib.parse.unquote(file_path))  # noqa
+        return open(file_path, 'rb')
+
+    def read_range(self, file_path: str, offset: int, length: int) -> bytes:
+        """
+        This method reads a range of the bytes of a file, without reading the rest of it.
+        :param file_path: The path of the file, on S3 or local.
+        :param offset: The offset of the first byte.
+        :param length: The number of bytes.
+        :return: The bytes.
+        """
+        if file_path.startswith('s3://'):
+            return self.s3_client.read_range(file_path, offset, length)
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def list_directory(self, directory: str) -> Iterator[str]:
+        """
+        This method lists the names of the files directly in a directory.
+        :param directory: The path of the directory, on S3 or local.
+        :return: An iterator of the file names.
+        """
+        if directory.startswith('s3://'):
+            return self.s3_client.list_directory(directory)
+        if not os.path.isdir(directory):
+            return iter([])
+        return (name for name in os.listdir(directory) if os.path.isfile(os.path.join(directory, name)))
 
     def exists(self, file_location) -> bool:
         """
@@ -194,9 +253,9 @@ class File:
         :param file_location: The location of the file.
         :return: True if the file exists, False otherwise.
         """
-        # Step I: Check if the file is on S3.
+        # Step I: Check if the file is on S3, as of the listing of its directory.
         if file_location.startswith('s3://'):
-            return self.s3_client.exists(file_location)
+            return self.key_index.exists(file_location)
 
         # Step II: Check if the file is a URL.
         elif file_location.startswith('http') or file_location.startswith('https'):
@@ -207,6 +266,14 @@ class File:
         else:
             return os.path.exists(file_location)
 
+    def index_directories(self, directories: Iterable[str]) -> None:
+        """
+        This method lists the S3 directories up front, so that the existence of their files is known without
+        calling S3 again. Local directories are ignored.
+        :param directories: The locations of the directories.
+        """
+        self.key_index.load(directory for directory in directories if directory.startswith('s3://'))
+
     def delete(self, file_path: str) -> None:
         """
         This method deletes a file.
@@ -214,60 +281,146 @@ class File:
         """
         logging.info(f"Deleting file: {file_path}")
         if file_path.startswith('s3://'):
-            raise Exception("Deleting files from S3 is not supported.")
+            self.s3_client.delete_file(file_path)
+            self.key_index.remove(file_path)
         else:
             if os.path.exists(file_path):
                 os.remove(file_path)
 
     def write_file(self, in_file: IO[any], target_file_path: str) -> None:
-        # Use write() method to write the contents to the target file.
-        self.write(self.read(in_file.name), target_file_path)
+        # Copy the bytes of the (local) file to the target file, without parsing or re-encoding them.
+        with open(in_file.name, 'rb') as f:
+            self.write(f, target_file_path)
 
-    def write(self, contents: str | bytes, file_path: str) -> None:
+    def write(self, contents: str | bytes | IO[bytes], file_path: str) -> None:
         """
-        This method writes the contents to a file.
-        :param contents: The content to write.
+        This method writes the contents to a file. Nothing is written to a temporary file: S3 uploads are made
+        from memory, or streamed from the file object in chunks (in parts when they are large).
+        :param contents: The content to write, or a binary file object to read it from (from its current
+                         position).
         :param file_path: The path of the file.
         """
-        logging.info(
-            f"Number of characters to write: {len(contents)} to file: {file_path}")
+        if isinstance(contents, str):
+            contents = contents.encode('utf-8')
+        if isinstance(contents, bytes):
+            logging.info(f"Number of bytes to write: {len(contents)} to file: {file_path}")
+            size = len(contents)
+            in_file = io.BytesIO(contents)
+        else:
+            logging.info(f"Writing a stream to file: {file_path}")
+            in_file = contents
+            size = None
+            start = get_position(in_file)
+            if start is not None:
+                size = in_file.seek(0, os.SEEK_END) - start
+                in_file.seek(start)
+        storage = 's3' if file_path.startswith('s3://') else 'local'
+        FILE_WRITES.inc(storage=storage)
+        if size is not None:
+            FILE_WRITTEN_BYTES.inc(size, storage=storage)
         if file_path.startswith('s3://'):
-            tmp_file = tempfile.mkstemp()[1]
-            # Check if the contents are bytes.
-            if isinstance(contents, bytes):
-                # Write the contents to a temp file and upload it to S3.
-                with open(tmp_file, 'wb') as f:
-                    f.write(contents)
-            else:
-                # Write the contents to a temp file and upload it to S3.
-                with open(tmp_file, 'w') as f:
-                    f.write(contents)
-            self.s3_client.upload_file(tmp_file, file_path)
+            self.s3_client.upload_fileobj(in_file, file_path)
+            self.key_index.add(file_path)
         else:
             # Check if the directory exists. If not create it.
             directory = os.path.dirname(file_path)
-            if not os.path.exists(directory):
-                os.makedirs(directory)
-            if isinstance(contents, bytes):
-                with open(file_path, 'wb') as f:
-                    f.write(contents)
-            else:
-                with open(file_path, 'w') as f:
-                    f.write(contents)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            with open(file_path, 'wb') as f:
+                shutil.copyfileobj(in_file, f)
+
+    def write_many(self, files: Iterable[Tuple[str, str | bytes | IO[bytes]]],
+                   max_concurrent_writes: int = DEFAULT_MAX_CONCURRENT_WRITES,
+                   retries: int = DEFAULT_WRITE_RETRIES) -> Dict[str, Exception]:
+        """
+        This method writes a batch of files at once, through a bounded pool of threads that share the
+        connections of the S3 client. Each failed write is retried with a backoff, and a failure does not stop
+        the rest of the batch.
+        :param files: The (file path, contents) pairs to write, as accepted by write(). A path that appears
+                      more than once is written once, with its last contents.
+        :param max_concurrent_writes: The maximum number of files written at once.
+        :param retries: The number of times a failed write is retried.
+        :return: The exceptions of the files that could not be written, keyed by their path.
+        """
+        files = dict(files)
+        if len(files) == 0:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrent_writes, len(files)))) as executor:
+            errors = executor.map(lambda item: self.__write_with_retries(item[1], item[0], retries),
+                                  files.items())
+            failed = {file_path: error for file_path, error in zip(files, errors) if error is not None}
+        logging.info(f"Wrote {len(files) - len(failed)} of {len(files)} files, {len(failed)} failed.")
+        return failed
+
+    def __write_with_retries(self, contents: str | bytes | IO[bytes], file_path: str,
+                             retries: int) -> Exception | None:
+        # Writes the file, retrying on failure. Returns the last error if every attempt failed.
+        start = None if isinstance(contents, (str, bytes)) else get_position(contents)
+        for attempt in range(retries + 1):
+            try:
+                self.write(contents, file_path)
+                return None
+            except Exception as exc:
+                if attempt == retries or (start is None and not isinstance(contents, (str, bytes))):
+                    logging.error(f"Failed to write {file_path} after {attempt + 1} attempts: {exc}")
+                    return exc
+                logging.warning(f"Failed to write {file_path}, retrying: {exc}")
+                time.sleep(random.uniform(0, WRITE_BACKOFF_SECONDS * 2 ** attempt))
+                if start is not None:
+                    contents.seek(start)
 
     def __read_file_from_s3(self, file_path: str) -> str:
         """
-        This method reads the contents of a file from S3.
+        This method reads the contents of a file from S3, streamed into a buffer of its own.
         :param file_path:
         :return:
         """
         logging.info(f"Reading file from S3: {file_path}")
         # Get the bucket name and file name.
         file_path_decoded = urllib.parse.unquote(file_path)  # noqa
-        # Read the file from S3.
-        tmp_file = self.s3_client.get_file(file_path_decoded)
-        self.contents = read_local_file(tmp_file)
-        # Delete the temp file.
-        if os.path.exists(tmp_file):
-            os.remove(tmp_file)
-        return self.contents
+        # Read the file from S3, or from the cache if it was not modified.
+        with self.__open_s3_file(file_path_decoded) as in_file:
+            return read_file_object(in_file, file_path_decoded)
+
+    def __open_s3_file(self, file_path: str) -> IO[bytes]:
+        if self.file_cache is None:
+            return self.s3_client.open_file(file_path)
+        cached_file = self.file_cache.get(file_path)
+        result = self.s3_client.open_file_if_modified(file_path, cached_file.etag if cached_file else None)
+        if result is None:
+            in_file = self.file_cache.open(file_path, cached_file)
+            if in_file is not None:
+                FILE_CACHE_LOOKUPS.inc(result='hit')
+                return in_file
+            # The copy was evicted in the meantime.
+            result = self.s3_client.open_file_if_modified(file_path)
+        FILE_CACHE_LOOKUPS.inc(result='miss')
+        in_file, etag = result
+        self.file_cache.put(file_path, in_file, etag=etag, last_modified=None)
+        in_file.seek(0)
+        return in_file
+
+    def __read_url(self, url: str) -> str:
+        # Reads the text of a URL. The text is cached (as UTF-8) and revalidated with the HTTP validators.
+        cached_file = self.file_cache.get(url) if self.file_cache is not None else None
+        headers = {}
+        if cached_file is not None and cached_file.etag is not None:
+            headers['If-None-Match'] = cached_file.etag
+        if cached_file is not None and cached_file.last_modified is not None:
+            headers['If-Modified-Since'] = cached_file.last_modified
+        response = requests.get(url, headers=headers)
+        if response.status_code == 304 and cached_file is not None:
+            in_file = self.file_cache.open(url, cached_file)
+            if in_file is not None:
+                FILE_CACHE_LOOKUPS.inc(result='hit')
+                with in_file:
+                    return in_file.read().decode('utf-8')
+            # The copy was evicted in the meantime.
+            response = requests.get(url)
+        if self.file_cache is not None:
+            FILE_CACHE_LOOKUPS.inc(result='miss')
+            if response.ok:
+                validators = get_validators(response.headers)
+                self.file_cache.put(url, io.BytesIO(response.text.encode('utf-8')),
+                                    etag=validators['etag'], last_modified=validators['last_modified'])
+        return response.text
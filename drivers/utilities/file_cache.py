@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import IO, NamedTuple, Optional
+
+# The default maximum size of the cached files. The least recently used ones are evicted beyond it.
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+INDEX_FILE_NAME = 'index.db'
+
+
+class CachedFile(NamedTuple):
+    """
+    The validators of a cached copy, to revalidate it with a conditional request.
+    """
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class FileCache:
+    """
+    This class keeps local copies of remote files (S3 objects and HTTP resources) between reads and runs,
+    keyed by their URL and ETag (or Last-Modified), so that a file that did not change is read from the disk
+    instead of being downloaded again. The caller revalidates a copy with the validators returned by get()
+    before opening it. The least recently used copies are evicted once they take more than @max_bytes.
+    The index is kept in SQLite and the copies next to it in @cache_dir. It is safe to use from several
+    threads and processes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(cache_dir, INDEX_FILE_NAME), timeout=30,
+                                          check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS files ('
+                                    'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, file_name TEXT, '
+                                    'size INTEGER, accessed_at REAL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS files_by_access ON files (accessed_at)')
+
+    def get(self, url: str) -> Optional[CachedFile]:
+        """
+        :param url: The URL of the remote file.
+        :return: The validators of the cached copy of the file, or None if it is not cached.
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT etag, last_modified FROM files WHERE url = ?', (url,)).fetchone()
+        return CachedFile(*row) if row is not None else None
+
+    def open(self, url: str, cached_file: CachedFile) -> Optional[IO[bytes]]:
+        """
+        Opens the cached copy of a file, e.g. after the remote file was found not modified.
+        :param url: The URL of the remote file.
+        :param cached_file: The validators of the copy, as returned by get().
+        :return: A binary file object that the caller closes, or None if the copy was replaced or evicted since.
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT file_name FROM files WHERE url = ? AND etag IS ? AND last_modified IS ?',
+                (url, cached_file.etag, cached_file.last_modified)).fetchone()
+            if row is None:
+                return None
+            try:
+                in_file = open(os.path.join(self.cache_dir, row[0]), 'rb')
+            except FileNotFoundError:
+                self.connection.execute('DELETE FROM files WHERE url = ?', (url,))
+                return None
+            self.connection.execute('UPDATE files SET accessed_at = ? WHERE url = ?', (time.time(), url))
+        return in_file
+
+    def put(self, url: str, in_file: IO[bytes], etag: Optional[str], last_modified: Optional[str]) -> None:
+        """
+        Caches a copy of a file, replacing the previous one, and evicts the least recently used copies if the
+        cache is full. Nothing is cached without validators, since the copy could never be revalidated.
+        :param url: The URL of the remote file.
+        :param in_file: The contents of the file, read from its current position.
+        :param etag: The ETag of the file.
+        :param last_modified: The Last-Modified date of the file.
+        """
+        if etag is None and last_modified is None:
+            return
+        # The copies are named after the URL and the validators, so that a copy never changes once written.
+        file_name = hashlib.sha256(f'{url}\n{etag}\n{last_modified}'.encode('utf-8')).hexdigest()
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as out_file:
+            shutil.copyfileobj(in_file, out_file)
+            size = out_file.tell()
+        if size > self.max_bytes:
+            os.remove(temp_path)
+            return
+        os.replace(temp_path, os.path.join(self.cache_dir, file_name))
+        with self.lock, self.connection:
+            row = self.connection.execute('SELECT file_name FROM files WHERE url = ?', (url,)).fetchone()
+            if row is not None and row[0] != file_name:
+                self.__remove(row[0])
+            self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                                    (url, etag, last_modified, file_name, size, time.time()))
+            self.__evict()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def __evict(self):
+        # Removes the least recently used copies until the cache fits in max_bytes. Called with the lock held.
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM files').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute('SELECT url, file_name, size FROM files ORDER BY accessed_at').fetchall()
+        for url, file_name, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.connection.execute('DELETE FROM files WHERE url = ?', (url,))
+            self.__remove(file_name)
+            total -= size
+
+    def __remove(self, file_name: str):
+        try:
+            os.remove(os.path.join(self.cache_dir, file_name))
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            logging.warning(f'Failed to remove {file_name} from the file cache: {exc}')
@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+from drivers.utilities.s3_client import S3Client
+
+# The number of directories listed at once by load().
+LISTING_CONCURRENCY = 8
+
+
+class KeyIndex:
+    """
+    An in-memory manifest of the files in S3 directories, so that the existence of a file is answered without
+    calling S3. Each directory is listed once (with a paginated listing) the first time a file in it is looked
+    up, or up front with load(), and the files written through File are added as they are written. The
+    existence of the files of a directory whose listing failed is checked with S3 instead.
+    It is safe to use from several threads.
+    """
+
+    def __init__(self, s3_client: S3Client):
+        self.s3_client = s3_client
+        self.lock = threading.Lock()
+        # The s3:// URLs of the files of every listed directory, keyed by the s3:// URL of the directory.
+        self.directories = {}
+        # The locks that make concurrent lookups in a directory wait for a single listing of it.
+        self.listing_locks = {}
+        # The directories whose listing failed, which are not indexed.
+        self.unindexed_directories = set()
+
+    def load(self, directories: Iterable[str]) -> None:
+        """
+        Lists the directories that are not listed yet. A directory whose listing fails is not indexed.
+        :param directories: The s3:// URLs of the directories.
+        """
+        directories = {directory.rstrip('/') for directory in directories}
+        with ThreadPoolExecutor(max_workers=LISTING_CONCURRENCY) as executor:
+            list(executor.map(self.__get_files, directories))
+
+    def exists(self, s3_url: str) -> bool:
+        """
+        :param s3_url: The s3:// URL of the file.
+        :return: Whether the file exists, as of the listing of its directory and the writes since.
+        """
+        files = self.__get_files(os.path.dirname(s3_url))
+        if files is None:
+            return self.s3_client.exists(s3_url)
+        with self.lock:
+            return s3_url in files
+
+    def add(self, s3_url: str) -> None:
+        """
+        Records that the file was written. Nothing is recorded for a directory that is not listed yet,
+        since its listing will include the file.
+        """
+        with self.lock:
+            files = self.directories.get(os.path.dirname(s3_url))
+            if files is not None:
+                files.add(s3_url)
+
+    def remove(self, s3_url: str) -> None:
+        """
+        Records that the file was deleted.
+        """
+        with self.lock:
+            files = self.directories.get(os.path.dirname(s3_url))
+            if files is not None:
+                files.discard(s3_url)
+
+    def __get_files(self, directory: str) -> Optional[set]:
+        # Returns the files of the directory, listing it if needed, or None if its listing failed.
+        with self.lock:
+            if directory in self.unindexed_directories:
+                return None
+            files = self.directories.get(directory)
+            if files is not None:
+                return files
+            listing_lock = self.listing_locks.setdefault(directory, threading.Lock())
+        with listing_lock:
+            with self.lock:
+                if directory in self.unindexed_directories:
+                    return None
+                files = self.directories.get(directory)
+            if files is None:
+                try:
+                    files = {f'{directory}/{name}' for name in self.s3_client.list_directory(directory)}
+                except Exception as exc:
+                    logging.error(f'Failed to list {directory}, its files will be looked up in S3: {exc}')
+                    with self.lock:
+                        self.unindexed_directories.add(directory)
+                    return None
+                with self.lock:
+                    self.directories[directory] = files
+        return files
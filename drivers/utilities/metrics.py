@@ -0,0 +1,265 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# The content type of the Prometheus text exposition format.
+# Refer: https://prometheus.io/docs/instrumenting/exposition_formats/
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# The upper bounds (in seconds) of the buckets of the latency histograms.
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if len(names) == 0:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class Metric:
+    """
+    A metric with optional labels, whose value is kept per combination of label values. Safe to use from
+    several threads.
+    """
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        """
+        :param name: The name of the metric, e.g. crawler_pages_total.
+        :param documentation: The help text of the metric.
+        :param labelnames: The names of its labels.
+        :param registry: The registry it is exposed by, the default registry if None.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def reset(self):
+        # The lock is replaced rather than acquired: a forked child may inherit it held by another thread.
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def take(self) -> Dict[Tuple[str, ...], object]:
+        """
+        Returns the values accumulated since the last take, and starts over from zero.
+        """
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def add(self, key: Tuple[str, ...], value):
+        """
+        Adds values returned by take() (e.g. in another process) to this metric.
+        """
+        raise NotImplementedError
+
+    def samples(self) -> List[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        raise NotImplementedError
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames) or any(name not in labels for name in self.labelnames):
+            raise ValueError(f'{self.name} expects the labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, e.g. the number of pages fetched.
+    """
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        key = self._key(labels)
+        with self.lock:
+            return self.values.get(key, 0.0)
+
+    def add(self, key: Tuple[str, ...], value: float):
+        self.inc(value, **dict(zip(self.labelnames, key)))
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, self.labelnames, key, value) for key, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, e.g. the depth of a queue. Gauges are not shipped between processes.
+    """
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = float(value)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def take(self):
+        return {}
+
+    def add(self, key, value):
+        pass
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, self.labelnames, key, value) for key, value in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values (e.g. latencies) over fixed buckets, with their sum and count.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        super(Histogram, self).__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        self.add(self._key(labels), ([1 if value <= bound else 0 for bound in self.buckets], value))
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the time the block takes, in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def add(self, key: Tuple[str, ...], value: Tuple[List[int], float]):
+        # The value is the cumulative counts of the buckets and the sum of the observations.
+        counts, total = value
+        with self.lock:
+            current = self.values.get(key)
+            if current is None:
+                self.values[key] = (list(counts), total)
+            else:
+                self.values[key] = ([a + b for a, b in zip(current[0], counts)], current[1] + total)
+
+    def samples(self):
+        labelnames = self.labelnames + ('le',)
+        samples = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f'{self.name}_bucket', labelnames, key + (format_value(bound),), count))
+                samples.append((f'{self.name}_sum', self.labelnames, key, total))
+                samples.append((f'{self.name}_count', self.labelnames, key, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    The metrics of a process, rendered in the Prometheus text format by the /metrics endpoint.
+    The crawler processes ship what they count to the parent process with take() and merge().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric: Metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f'Metric {metric.name} is already registered.')
+            self.metrics[metric.name] = metric
+
+    def reset(self):
+        """
+        Forgets every value, e.g. the ones a forked process inherited from its parent.
+        """
+        self.lock = threading.Lock()
+        for metric in list(self.metrics.values()):
+            metric.reset()
+
+    def take(self) -> List[Tuple[str, Tuple[str, ...], object]]:
+        """
+        Returns the counter and histogram values accumulated since the last take, as (name, label values,
+        value) tuples that can be pickled, and starts over from zero.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return [(metric.name, key, value) for metric in metrics for key, value in metric.take().items()]
+
+    def merge(self, values: List[Tuple[str, Tuple[str, ...], object]]):
+        """
+        Adds the values returned by take(), usually in another process.
+        """
+        for name, key, value in values:
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric.add(tuple(key), value)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labelnames, labelvalues, value in metric.samples():
+                lines.append(f'{name}{format_labels(labelnames, labelvalues)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def get_status_class(status: int) -> str:
+    """
+    :return: The class of an HTTP status, e.g. 2xx.
+    """
+    return f'{status // 100}xx'
+
+
+# The metrics of the crawler processes, shipped to the parent process.
+RESPONSES = Counter('crawler_responses_total', 'Responses downloaded by the spiders, by HTTP status class.',
+                    ['status_class'])
+DOWNLOADED_BYTES = Counter('crawler_downloaded_bytes_total', 'Bytes of the bodies downloaded by the spiders.')
+PAGES_FETCHED = Counter('crawler_pages_fetched_total', 'Pages scraped by the spiders.')
+DOWNLOAD_LATENCY = Histogram('crawler_download_latency_seconds', 'Download latency of the responses, by host.',
+                             ['host'])
+PARSE_TIME = Histogram('crawler_parse_seconds', 'Time to extract the text and links of a page.')
+# The metrics of the parent process.
+ITEM_QUEUE_DEPTH = Gauge('crawler_item_queue_depth', 'Events waiting in the queue of the crawler processes.')
+PENDING_SITES = Gauge('crawler_pending_sites', 'Websites of the current run whose crawl is not done.')
+SITE_PAGES = Counter('site_scraper_pages_total', 'Pages handled by the site scraper, by outcome.', ['outcome'])
+LAWS = Counter('bing_driver_laws_total', 'Laws handled by the Bing driver, by outcome.', ['outcome'])
+PENDING_LAWS = Gauge('bing_driver_pending_laws', 'Laws of the current run left to search for or download.',
+                     ['stage'])
+BING_REQUESTS = Counter('bing_requests_total', 'Calls to the Bing Search API, by endpoint and outcome.',
+                        ['endpoint', 'outcome'])
+BING_CACHE_LOOKUPS = Counter('bing_cache_lookups_total', 'Lookups of the Bing searches in the cache, by result.',
+                             ['result'])
+BING_LATENCY = Histogram('bing_request_seconds', 'Latency of the calls to the Bing Search API.', ['endpoint'])
+FILE_CACHE_LOOKUPS = Counter('file_cache_lookups_total', 'Reads of remote files revalidated against the local cache, '
+                             'by result.', ['result'])
+FILE_WRITES = Counter('file_writes_total', 'Files written, by storage.', ['storage'])
+FILE_WRITTEN_BYTES = Counter('file_written_bytes_total', 'Bytes of the files written, by storage.', ['storage'])
+S3_PUTS = Counter('s3_put_total', 'PUT requests to S3, by outcome.', ['outcome'])
+S3_PUT_LATENCY = Histogram('s3_put_seconds', 'Latency of the PUT requests to S3.')
@@ -0,0 +1,203 @@
+import gzip
+import json
+import re
+import tempfile
+import time
+import uuid
+from typing import IO, Dict, Iterator, List, NamedTuple, Optional
+
+from drivers.utilities.file import File
+
+try:
+    import zstandard
+except ImportError:
+    # The shards are compressed with gzip when zstandard is not installed.
+    zstandard = None
+
+# The default size of the (compressed) shards. A shard is uploaded once it reaches it.
+DEFAULT_SHARD_TARGET_BYTES = 64 * 1024 * 1024
+ZSTD_LEVEL = 3
+ZSTD_EXTENSION = '.jsonl.zst'
+GZIP_EXTENSION = '.jsonl.gz'
+# The sidecar index of a shard is named after it, e.g. part-1.jsonl.zst.index.jsonl.
+INDEX_EXTENSION = '.index.jsonl'
+BULK_READ_CHUNK_SIZE = 1024 * 1024
+
+RECORD_URL_PATTERN = re.compile(r'^(?P<shard_url>.+)#(?P<offset>\d+)-(?P<length>\d+)$')
+
+
+class ShardLocation(NamedTuple):
+    """
+    The location of a record in a shard.
+    """
+    shard_url: str
+    offset: int
+    length: int
+
+    def to_url(self) -> str:
+        # The URL of the record, e.g. s3://bucket/site/shards/part-1.jsonl.zst#1024-512.
+        return f'{self.shard_url}#{self.offset}-{self.length}'
+
+
+def parse_record_url(record_url: str) -> Optional[ShardLocation]:
+    """
+    :param record_url: The URL of a record, as returned by ShardLocation.to_url().
+    :return: The location of the record, or None if the URL is not the URL of a record.
+    """
+    match = RECORD_URL_PATTERN.match(record_url)
+    if match is None or not is_shard(match.group('shard_url')):
+        return None
+    return ShardLocation(match.group('shard_url'), int(match.group('offset')), int(match.group('length')))
+
+
+def is_shard(file_name: str) -> bool:
+    return file_name.endswith(ZSTD_EXTENSION) or file_name.endswith(GZIP_EXTENSION)
+
+
+def compress(data: bytes, extension: str) -> bytes:
+    # Every record is compressed on its own, as a zstd frame or a gzip member. Both formats allow them to be
+    # concatenated, so that a whole shard decompresses as a single stream.
+    if extension == ZSTD_EXTENSION:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data)
+
+
+def decompress(data: bytes, shard_url: str) -> bytes:
+    if is_zstd(shard_url):
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def open_decompressed(in_file: IO[bytes], shard_url: str) -> IO[bytes]:
+    if is_zstd(shard_url):
+        return zstandard.ZstdDecompressor().stream_reader(in_file, read_across_frames=True)
+    return gzip.GzipFile(fileobj=in_file, mode='rb')
+
+
+def is_zstd(shard_url: str) -> bool:
+    if not shard_url.endswith(ZSTD_EXTENSION):
+        return False
+    if zstandard is None:
+        raise Exception(f'zstandard is required to read {shard_url}.')
+    return True
+
+
+class ShardWriter:
+    """
+    This class packs the pages of a website into compressed JSONL shards in a directory, instead of writing
+    every page to a file of its own. Each record is compressed on its own (zstd, or gzip without zstandard),
+    so that a shard can be read as a whole in a single stream, and any record can be read on its own with a
+    ranged read of its bytes. A shard is uploaded once it reaches @target_bytes, together with a sidecar
+    index that maps the URL of each record to its (shard, offset, length).
+    It is not safe to use from several threads.
+    """
+
+    def __init__(self, file: File, directory: str, target_bytes: int = DEFAULT_SHARD_TARGET_BYTES):
+        """
+        :param file: The File the shards are written with.
+        :param directory: The directory of the shards.
+        :param target_bytes: The size of the shards.
+        """
+        self.file = file
+        self.directory = directory
+        self.target_bytes = max(1, target_bytes)
+        self.extension = ZSTD_EXTENSION if zstandard is not None else GZIP_EXTENSION
+        self.buffer = None
+        self.shard_url = None
+        self.index = []
+
+    def add(self, record: dict) -> ShardLocation:
+        """
+        Appends a record to the current shard. The record can only be read once the shard is flushed.
+        :param record: The record, with its url.
+        :return: The location of the record.
+        """
+        if self.buffer is None:
+            shard_name = f'part-{time.strftime("%Y%m%d%H%M%S")}-{uuid.uuid4().hex[:8]}{self.extension}'
+            self.shard_url = f'{self.directory}/{shard_name}'
+            self.buffer = tempfile.TemporaryFile()
+        data = compress((json.dumps(record) + '\n').encode('utf-8'), self.extension)
+        location = ShardLocation(self.shard_url, self.buffer.tell(), len(data))
+        self.buffer.write(data)
+        self.index.append({'url': record['url'], 'shard': self.shard_url.rsplit('/', 1)[-1],
+                           'offset': location.offset, 'length': location.length})
+        return location
+
+    def is_full(self) -> bool:
+        return self.buffer is not None and self.buffer.tell() >= self.target_bytes
+
+    def flush(self) -> None:
+        """
+        Uploads the current shard and its sidecar index, if any record was added to it. The next record
+        starts a new shard, even if the upload failed.
+        """
+        if self.buffer is None:
+            return
+        buffer, shard_url, index = self.buffer, self.shard_url, self.index
+        self.buffer, self.shard_url, self.index = None, None, []
+        with buffer:
+            buffer.seek(0)
+            failed = self.file.write_many([
+                (shard_url, buffer),
+                (shard_url + INDEX_EXTENSION, ''.join(json.dumps(entry) + '\n' for entry in index))])
+        if len(failed) > 0:
+            raise next(iter(failed.values()))
+
+
+def read_record(file: File, record_url: str) -> dict:
+    """
+    Reads a single record of a shard with a ranged read.
+    :param file: The File to read with.
+    :param record_url: The URL of the record, as returned by ShardLocation.to_url().
+    :return: The record.
+    """
+    location = parse_record_url(record_url)
+    if location is None:
+        raise Exception(f'{record_url} is not the URL of a record of a shard.')
+    data = file.read_range(location.shard_url, location.offset, location.length)
+    return json.loads(decompress(data, location.shard_url).decode('utf-8'))
+
+
+def read_index(file: File, shard_url: str) -> Dict[str, ShardLocation]:
+    """
+    Reads the sidecar index of a shard.
+    :return: The locations of the records of the shard, keyed by their URL.
+    """
+    index = {}
+    for line in file.read(shard_url + INDEX_EXTENSION).splitlines():
+        if line.strip():
+            entry = json.loads(line)
+            index[entry['url']] = ShardLocation(shard_url, entry['offset'], entry['length'])
+    return index
+
+
+def iter_shard(file: File, shard_url: str) -> Iterator[dict]:
+    """
+    Reads all the records of a shard, streaming and decompressing it as a whole.
+    """
+    with file.open(shard_url) as in_file:
+        with open_decompressed(in_file, shard_url) as reader:
+            pending = b''
+            while True:
+                chunk = reader.read(BULK_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    if line:
+                        yield json.loads(line.decode('utf-8'))
+            if pending:
+                yield json.loads(pending.decode('utf-8'))
+
+
+def iter_records(file: File, directory: str) -> Iterator[dict]:
+    """
+    Reads all the records of the shards in a directory, e.g. the pages of a website.
+    """
+    for file_name in list_shards(file, directory):
+        yield from iter_shard(file, f'{directory}/{file_name}')
+
+
+def list_shards(file: File, directory: str) -> List[str]:
+    return sorted(file_name for file_name in file.list_directory(directory) if is_shard(file_name))
@@ -0,0 +1,60 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter shared by several threads. Tokens are added at @rate per second, up to
+    @capacity, and every call takes one, waiting for it if the bucket is empty. This allows bursts of
+    @capacity calls while keeping the long-run rate at @rate.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        :param rate: The number of calls per second. 0 or less disables the limit.
+        :param capacity: The maximum burst of calls.
+        """
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, blocking until one is available.
+        """
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            # Reserve the token now, even if it has not been added yet, so that waiting threads queue up
+            # behind each other instead of all waking up at once.
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HostLimiter:
+    """
+    Bounds the number of concurrent calls to each host, across several threads. Use limit(host) as a
+    context manager around a call.
+    """
+
+    def __init__(self, max_per_host: int):
+        self.max_per_host = max(1, max_per_host)
+        self.lock = threading.Lock()
+        self.semaphores = {}
+
+    @contextmanager
+    def limit(self, host: str):
+        with self.lock:
+            semaphore = self.semaphores.get(host)
+            if semaphore is None:
+                semaphore = self.semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+        with semaphore:
+            yield
@@ -1,12 +1,82 @@
 import os
-from typing import Tuple
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import IO, Iterator, List, NamedTuple, Optional, Tuple
 
 import boto3
 import logging
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 from urllib.parse import urlparse, unquote
 
 from drivers.utilities.config import S3Config
+from drivers.utilities.metrics import S3_PUT_LATENCY, S3_PUTS
+
+# Files larger than this are uploaded in parts of this size, several at once, so that the upload of a large
+# file is parallel and only ever holds a few parts in memory.
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+MULTIPART_CONCURRENCY = 4
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=MULTIPART_CHUNK_SIZE, multipart_chunksize=MULTIPART_CHUNK_SIZE,
+                                 max_concurrency=MULTIPART_CONCURRENCY)
+# The size of the connection pool of the shared client. Pages, PDFs and their parts are uploaded by several
+# threads at once, and a request that finds the pool exhausted waits for a connection.
+MAX_POOL_CONNECTIONS = 50
+# The files read from S3 are streamed in chunks of this size into an anonymous temporary file.
+READ_CHUNK_SIZE = 1024 * 1024
+# The number of sibling directories that walk() lists at once, and the number of listed pages (of up to 1000
+# keys each) it buffers ahead of the caller.
+LISTING_CONCURRENCY = 8
+WALK_QUEUE_SIZE = 16
+
+s3_client_lock = threading.Lock()
+# The boto3 client shared by every S3Client of the process, with the pid it was created in.
+shared_s3_client = None
+
+
+def get_shared_s3_client(s3_config: S3Config):
+    """
+    Returns the boto3 S3 client of the process. boto3 clients are thread-safe, so one client (and its pool of
+    connections) is shared rather than creating a client or a resource for every call. A process forked from
+    the one the client was created in gets its own.
+    """
+    global shared_s3_client
+    with s3_client_lock:
+        if shared_s3_client is None or shared_s3_client[0] != os.getpid():
+            client = boto3.client('s3',
+                                  region_name=s3_config.region_name,
+                                  aws_access_key_id=s3_config.aws_access_key_id,
+                                  aws_secret_access_key=s3_config.aws_secret_access_key,
+                                  config=Config(max_pool_connections=MAX_POOL_CONNECTIONS))
+            shared_s3_client = (os.getpid(), client)
+        return shared_s3_client[1]
+
+
+class S3Object(NamedTuple):
+    """
+    A file listed in S3.
+    """
+    # The s3:// URL of the file.
+    url: str
+    key: str
+    size: int
+    etag: str
+    last_modified: datetime
+
+
+def to_s3_object(bucket_name: str, content: dict) -> S3Object:
+    # Converts an entry of the Contents of a list_objects_v2 response.
+    return S3Object(url=f's3://{bucket_name}/{content["Key"]}', key=content['Key'], size=content.get('Size', 0),
+                    etag=content.get('ETag', '').strip('"'), last_modified=content.get('LastModified'))
+
+
+def get_directory_prefix(key: str, delimiter: str = '/') -> str:
+    # The prefix of the keys in a directory, e.g. a/b/ for a/b. The root of the bucket has the empty prefix.
+    return key.rstrip(delimiter) + delimiter if key.strip(delimiter) else ''
 
 
 def extract_file_name_from_s3_url(s3_url: str) -> str:
@@ -36,50 +106,63 @@ class S3Client:
 
     def __init__(self):
         self.s3_config = S3Config()
-        self.s3 = boto3.client('s3',
-                               region_name=self.s3_config.region_name,
-                               aws_access_key_id=self.s3_config.aws_access_key_id,
-                               aws_secret_access_key=self.s3_config.aws_secret_access_key)
+        self.s3 = get_shared_s3_client(self.s3_config)
 
     def upload_file(self, src_file_path: str, target_file_path: str):
         logging.info(f'Uploading {src_file_path} to {target_file_path}')
+        # S3 has no directories, the keys are listed by prefix, so no directory markers are created.
         bucket_name, file_key = extract_bucket_and_key_from_s3_url(target_file_path)
+        self.__put(self.s3.upload_file, src_file_path, bucket_name, file_key, Config=TRANSFER_CONFIG)
 
-        # Extract the directory path from the file key
-        directory_path = os.path.dirname(file_key)
-
-        # Create S3 resource
-        s3_resource = boto3.resource('s3',
-                                     region_name=self.s3_config.region_name,
-                                     aws_access_key_id=self.s3_config.aws_access_key_id,
-                                     aws_secret_access_key=self.s3_config.aws_secret_access_key)
-
-        # Create S3 bucket object
-        bucket = s3_resource.Bucket(bucket_name)
-
-        # Create directories in S3 recursively
-        for path_part in directory_path.split('/'):
-            if path_part:
-                prefix = file_key[:file_key.index(path_part) + len(path_part)]
-                bucket.put_object(Key=prefix + '/')
-
-        # Upload the file to S3
-        bucket.upload_file(src_file_path, file_key)
+    def upload_fileobj(self, file_obj: IO[bytes], target_file_path: str):
+        """
+        Uploads the contents of a binary file object to S3, reading it in chunks. Large files are uploaded in
+        parts (multipart upload).
+        :param file_obj: The file object, read from its current position.
+        :param target_file_path: The s3:// URL to upload to.
+        """
+        logging.info(f'Uploading a stream to {target_file_path}')
+        bucket_name, file_key = extract_bucket_and_key_from_s3_url(target_file_path)
+        self.__put(self.s3.upload_fileobj, file_obj, bucket_name, file_key, Config=TRANSFER_CONFIG)
 
     def put_file(self, src_file_name: str, target_file_name: str) -> str:
         logging.info(f'Uploading {src_file_name} to {target_file_name}')
-        self.s3.upload_file(src_file_name, self.s3_config.bucket_name, target_file_name)
+        self.__put(self.s3.upload_file, src_file_name, self.s3_config.bucket_name, target_file_name)
         url = self.s3.generate_presigned_url('get_object',
                                              Params={'Bucket': self.s3_config.bucket_name,
                                                      'Key': target_file_name},
                                              ExpiresIn=self.s3_config.file_signed_url_expiration_seconds)
         return url
 
-    def get_file(self, file_name: str) -> str:
+    @staticmethod
+    def __put(put, *args, **kwargs):
+        # Makes a PUT request to S3, counting it and its latency.
+        try:
+            with S3_PUT_LATENCY.time():
+                result = put(*args, **kwargs)
+        except Exception:
+            S3_PUTS.inc(outcome='error')
+            raise
+        S3_PUTS.inc(outcome='ok')
+        return result
+
+    def open_file(self, file_name: str) -> IO[bytes]:
         """
-        Downloads the file from S3 and returns the name of the downloaded file.
-        :param file_name: The name of the file to download.
-        :return: A temporary file name where the file is downloaded.
+        Streams the file from S3 into an anonymous temporary file of its own, so that it is safe to call from
+        several threads at once. (A SpooledTemporaryFile is not used: before Python 3.11 it is not a full
+        io.IOBase, e.g. it cannot be wrapped in an io.TextIOWrapper.)
+        :param file_name: The s3:// URL of the file, or its key in the default bucket.
+        :return: A binary file object positioned at the start of the file, which the caller closes.
+        """
+        return self.open_file_if_modified(file_name)[0]
+
+    def open_file_if_modified(self, file_name: str,
+                              etag: Optional[str] = None) -> Optional[Tuple[IO[bytes], Optional[str]]]:
+        """
+        Streams the file from S3 like open_file, unless its ETag is still @etag (a conditional GET).
+        :param file_name: The s3:// URL of the file, or its key in the default bucket.
+        :param etag: The ETag of a copy of the file, if any.
+        :return: The file object and the ETag of the file, or None if the file was not modified.
         """
         logging.info(f'Downloading {file_name} from S3')
 
@@ -89,50 +172,187 @@ class S3Client:
             bucket = self.s3_config.bucket_name
             file_key = file_name
 
-        file_extension = os.path.splitext(file_key)[1]
-
-        # Create a temp file name.
-        tmp_file_name = f'temp{file_extension}'
         logging.info(f'Downloading {file_key} from S3 bucket {bucket}')
-        self.s3.download_file(bucket, file_key, tmp_file_name)
-        return tmp_file_name
+        kwargs = {'Bucket': bucket, 'Key': file_key}
+        if etag is not None:
+            kwargs['IfNoneMatch'] = f'"{etag}"'
+        try:
+            response = self.s3.get_object(**kwargs)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                return None
+            raise
+        buffer = tempfile.TemporaryFile()
+        try:
+            for chunk in response['Body'].iter_chunks(READ_CHUNK_SIZE):
+                buffer.write(chunk)
+        except Exception:
+            buffer.close()
+            raise
+        finally:
+            response['Body'].close()
+        buffer.seek(0)
+        return buffer, response.get('ETag', '').strip('"') or None
+
+    def delete_file(self, s3_url: str) -> None:
+        """
+        Deletes a file from S3. Nothing happens if it does not exist.
+        :param s3_url: The s3:// URL of the file.
+        """
+        logging.info(f'Deleting {s3_url}')
+        bucket_name, file_key = extract_bucket_and_key_from_s3_url(s3_url)
+        self.s3.delete_object(Bucket=bucket_name, Key=file_key)
+
+    def read_range(self, s3_url: str, offset: int, length: int) -> bytes:
+        """
+        Reads a range of the bytes of a file in S3 (a ranged GET).
+        :param s3_url: The s3:// URL of the file.
+        :param offset: The offset of the first byte.
+        :param length: The number of bytes.
+        :return: The bytes.
+        """
+        bucket_name, file_key = extract_bucket_and_key_from_s3_url(s3_url)
+        response = self.s3.get_object(Bucket=bucket_name, Key=file_key, Range=f'bytes={offset}-{offset + length - 1}')
+        with response['Body'] as body:
+            return body.read()
 
-    def list_files(self, s3_path: str) -> list:
+    def list_files(self, s3_path: str) -> Iterator[str]:
         """
-        List all files in the given S3 path.
+        Lists all the files under the given S3 path, page by page.
         :param s3_path: The path of the directory on S3.
-        :return: The list of file names.
-        """
-        parsed_url = urlparse(s3_path)
-        bucket_name = parsed_url.netloc
-        prefix = parsed_url.path.lstrip('/')
-        result = self.s3.list_objects(Bucket=bucket_name, Prefix=prefix)
-
-        # Check if the prefix is a directory.
-        # If it is, remove the directory name from the file names.
-        files = []
-        if result.get('Contents'):
-            for file in result.get('Contents'):
-                file_name = file.get('Key')
-                if file_name != prefix:  # Exclude the directory name
-                    # Remove the directory name from the file name
-                    file_name = file_name.replace(prefix, '', 1).lstrip('/')
-                    files.append(file_name)
-
-        return files
+        :return: An iterator of the file names, relative to the directory.
+        """
+        _, prefix = extract_bucket_and_key_from_s3_url(s3_path)
+        for s3_object in self.iter_objects(s3_path):
+            # Remove the directory name from the file name
+            file_name = s3_object.key.replace(prefix, '', 1).lstrip('/')
+            if file_name:  # Exclude the directory name
+                yield file_name
+
+    def list_directory(self, s3_directory: str) -> Iterator[str]:
+        """
+        Lists the names of the files directly in the S3 directory, page by page, without the files of its
+        subdirectories.
+        :param s3_directory: The s3:// URL of the directory.
+        :return: An iterator of the file names.
+        """
+        _, prefix = extract_bucket_and_key_from_s3_url(s3_directory)
+        prefix = get_directory_prefix(prefix)
+        for s3_object in self.iter_objects(s3_directory, delimiter='/'):
+            file_name = s3_object.key[len(prefix):]
+            if file_name:  # Exclude the directory marker
+                yield file_name
+
+    def iter_objects(self, s3_path: str, delimiter: Optional[str] = None) -> Iterator[S3Object]:
+        """
+        Lists the files whose key starts with the key of the S3 path, one page (of up to 1000 keys) at a time,
+        so that listings of any size take constant memory.
+        :param s3_path: The s3:// URL of the prefix, e.g. of a directory.
+        :param delimiter: If set (usually to /), the path is a directory and the files in its subdirectories
+                          are left out.
+        :return: An iterator of the files, in the order of their keys.
+        """
+        for page in self.__iter_pages(s3_path, delimiter):
+            yield from page[0]
+
+    def list_prefixes(self, s3_path: str, delimiter: str = '/') -> Iterator[str]:
+        """
+        Lists the "subdirectories" of an S3 directory.
+        :param s3_path: The s3:// URL of the directory.
+        :param delimiter: The delimiter of the directories in the keys.
+        :return: An iterator of the s3:// URLs of the subdirectories, ending with the delimiter.
+        """
+        bucket_name, _ = extract_bucket_and_key_from_s3_url(s3_path)
+        for page in self.__iter_pages(s3_path, delimiter):
+            for prefix in page[1]:
+                yield f's3://{bucket_name}/{prefix}'
+
+    def walk(self, s3_path: str, max_concurrency: int = LISTING_CONCURRENCY) -> Iterator[S3Object]:
+        """
+        Lists all the files under an S3 directory, like iter_objects, but walks its subdirectories and lists
+        @max_concurrency sibling directories at once, which is much faster for trees with many directories
+        (e.g. jurisdiction/category/site). The memory used is bounded by WALK_QUEUE_SIZE pages.
+        :param s3_path: The s3:// URL of the directory.
+        :param max_concurrency: The maximum number of directories listed at once.
+        :return: An iterator of the files, in no particular order.
+        """
+        bucket_name, prefix = extract_bucket_and_key_from_s3_url(s3_path)
+        # The listed pages of files, and the errors of the workers. None marks the end of the walk.
+        pages = queue.Queue(maxsize=WALK_QUEUE_SIZE)
+        stopped = threading.Event()
+        lock = threading.Lock()
+        # The number of directories submitted and not fully listed yet.
+        pending = [1]
+        executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+
+        def put(item) -> bool:
+            # Waits for room in the queue, unless the caller stopped iterating.
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def list_directory(directory_url: str):
+            try:
+                for objects, prefixes in self.__iter_pages(directory_url, '/'):
+                    if stopped.is_set():
+                        return
+                    with lock:
+                        pending[0] += len(prefixes)
+                    for sub_prefix in prefixes:
+                        executor.submit(list_directory, f's3://{bucket_name}/{sub_prefix}')
+                    # Leave out the directory markers.
+                    objects = [s3_object for s3_object in objects if not s3_object.key.endswith('/')]
+                    if len(objects) > 0 and not put(objects):
+                        return
+            except Exception as exc:
+                put(exc)
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    done = pending[0] == 0
+                if done:
+                    put(None)
+
+        executor.submit(list_directory, f's3://{bucket_name}/{get_directory_prefix(prefix)}')
+        try:
+            while True:
+                item = pages.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield from item
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False)
+
+    def __iter_pages(self, s3_path: str, delimiter: Optional[str]) -> Iterator[Tuple[List[S3Object], List[str]]]:
+        # Yields the files and the common prefixes (subdirectories) of each page of a list_objects_v2 listing.
+        bucket_name, prefix = extract_bucket_and_key_from_s3_url(s3_path)
+        if delimiter is not None:
+            prefix = get_directory_prefix(prefix, delimiter)
+        kwargs = {'Bucket': bucket_name, 'Prefix': prefix}
+        if delimiter is not None:
+            kwargs['Delimiter'] = delimiter
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**kwargs):
+            yield ([to_s3_object(bucket_name, content) for content in page.get('Contents', [])],
+                   [common_prefix['Prefix'] for common_prefix in page.get('CommonPrefixes', [])])
 
     def exists(self, s3_location: str) -> bool:
         try:
-            s3 = boto3.resource('s3')
             # Extract S3 bucket and key from file_location
             bucket_name, key = extract_bucket_and_key_from_s3_url(s3_location)
-            # Check if the bucket exists.
-            if not s3.Bucket(bucket_name) in s3.buckets.all():
-                logging.warning(f"Bucket {bucket_name} does not exist.")
-                return False
-            bucket = s3.Bucket(bucket_name)
-            objs = list(bucket.objects.filter(Prefix=key))
-            return len(objs) > 0 and objs[0].key == key
+            self.s3.head_object(Bucket=bucket_name, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                logging.error(f"Error while checking if file exists: {e}")
+            return False
         except Exception as e:
             logging.error(f"Error while checking if file exists: {e}")
             return False
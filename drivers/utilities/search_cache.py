@@ -0,0 +1,89 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+# The default time the results of a query are reused for, and the shorter one of the queries without results.
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_NEGATIVE_TTL_SECONDS = 24 * 60 * 60
+# The default maximum number of cached queries. The least recently used ones are evicted beyond it.
+DEFAULT_MAX_ENTRIES = 100000
+
+
+class SearchCache:
+    """
+    This class persists the results of the Bing searches between runs, keyed by endpoint, query and market,
+    so that the queries that were answered recently are not paid for again. Results expire after @ttl_seconds,
+    empty results (negative caching) after @negative_ttl_seconds, and the least recently used queries are
+    evicted once there are more than @max_entries.
+    It is backed by SQLite and is safe to use from several threads.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 negative_ttl_seconds: float = DEFAULT_NEGATIVE_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                                    'endpoint TEXT, query TEXT, market TEXT, results TEXT, fetched_at REAL, '
+                                    'accessed_at REAL, PRIMARY KEY (endpoint, query, market))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_by_access ON results (accessed_at)')
+            self.size = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def get(self, endpoint: str, query: str, market: str) -> Optional[List[dict]]:
+        """
+        Returns the cached results of the query.
+        :param endpoint: The Bing endpoint, e.g. web or news.
+        :param query: The query.
+        :param market: The market of the query, e.g. en-US.
+        :return: The results, an empty list for a cached query without results, or None if the query is not
+                 cached or expired.
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT results, fetched_at FROM results WHERE endpoint = ? AND query = ? AND market = ?',
+                (endpoint, query, market)).fetchone()
+            if row is None:
+                return None
+            results = json.loads(row[0])
+            ttl = self.ttl_seconds if len(results) > 0 else self.negative_ttl_seconds
+            if now - row[1] > ttl:
+                return None
+            self.connection.execute(
+                'UPDATE results SET accessed_at = ? WHERE endpoint = ? AND query = ? AND market = ?',
+                (now, endpoint, query, market))
+        return results
+
+    def put(self, endpoint: str, query: str, market: str, results: List[dict]) -> None:
+        """
+        Caches the results of the query, evicting the least recently used queries if the cache is full.
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            updated = self.connection.execute(
+                'UPDATE results SET results = ?, fetched_at = ?, accessed_at = ? '
+                'WHERE endpoint = ? AND query = ? AND market = ?',
+                (json.dumps(results), now, now, endpoint, query, market)).rowcount
+            if updated > 0:
+                return
+            self.connection.execute('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                                    (endpoint, query, market, json.dumps(results), now, now))
+            self.size += 1
+            if self.size > self.max_entries:
+                self.size -= self.connection.execute(
+                    'DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY accessed_at LIMIT ?)',
+                    (self.size - self.max_entries,)).rowcount
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+
+def get_validators(headers) -> dict:
+    """
+    Extracts the HTTP validators from the headers of a response.
+    :param headers: A mapping of the response headers (str or bytes values).
+    :return: A dictionary of etag, last_modified and content_length (None when missing).
+    """
+    def header(name):
+        value = headers.get(name)
+        if isinstance(value, bytes):
+            value = value.decode('latin-1')
+        return value
+
+    content_length = header('Content-Length')
+    return {
+        'etag': header('ETag'),
+        'last_modified': header('Last-Modified'),
+        'content_length': int(content_length) if content_length and content_length.isdigit() else None
+    }
+
+
+class ValidatorStore:
+    """
+    This class persists the HTTP validators (ETag, Last-Modified and Content-Length) of every URL that was
+    fetched, so that the next run can issue conditional requests and skip unchanged pages on a 304.
+    The outbound links of each page are stored too, so that a crawl can keep following them when the
+    page itself was not modified.
+    It is backed by SQLite and is safe to use from several threads and processes.
+    """
+
+    def __init__(self, db_path: str):
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS validators ('
+                                    'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                                    'content_length INTEGER, links TEXT, fetched_at REAL)')
+
+    def get(self, url: str) -> Optional[dict]:
+        """
+        Returns the validators stored for the URL.
+        :param url: The URL of the page.
+        :return: A dictionary of etag, last_modified, content_length, links and fetched_at or None.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT etag, last_modified, content_length, links, fetched_at FROM validators WHERE url = ?',
+                (url,)).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, content_length, links, fetched_at = row
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_length': content_length,
+            'links': json.loads(links) if links else [],
+            'fetched_at': fetched_at
+        }
+
+    def put(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+            content_length: Optional[int] = None, links: Optional[List[str]] = None) -> None:
+        """
+        Stores the validators of the URL. URLs without any validator are forgotten, since they cannot
+        be requested conditionally.
+        """
+        with self.lock, self.connection:
+            if etag is None and last_modified is None:
+                self.connection.execute('DELETE FROM validators WHERE url = ?', (url,))
+                return
+            self.connection.execute(
+                'INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?, ?)',
+                (url, etag, last_modified, content_length, json.dumps(links or []), time.time()))
+
+    def conditional_headers(self, url: str, validators: Optional[dict] = None) -> dict:
+        """
+        Returns the If-None-Match / If-Modified-Since headers for the URL.
+        :param url: The URL of the page.
+        :param validators: The validators of the URL, if they were already looked up.
+        :return: The headers, empty if nothing is known about the URL.
+        """
+        validators = validators if validators is not None else self.get(url)
+        headers = {}
+        if validators is None:
+            return headers
+        if validators['etag']:
+            headers['If-None-Match'] = validators['etag']
+        if validators['last_modified']:
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
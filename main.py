@@ -6,7 +6,7 @@ import time
 from logging.config import dictConfig
 
 import requests
-from flask import jsonify, render_template, Flask, request
+from flask import jsonify, render_template, Flask, Response, request
 
 from db.crawler_run import CrawlerRun
 from db.crawler_run_driver import CrawlerRunDriver
@@ -14,6 +14,7 @@ from db.database import db
 from db.law_elem import LawElemModel
 from db.law_elem_driver import LawElemDriver
 from drivers.runners.root_driver import RootDriver
+from drivers.utilities import metrics
 from drivers.utilities.remove_prefix_middleware import RemovePrefixMiddleware
 
 # CONFIGURATION PARAMETERS
@@ -23,12 +24,41 @@ MAX_PAGES_PER_DOMAIN = 1000
 MAX_LAWS = -1
 # Maximum number of websites to crawl
 MAX_WEBSITES = -1
-# Number of threads to use for the site scraper
+# Number of websites that each crawler process crawls concurrently
 MAX_PARALLELISM_SITE_SCRAPER = 10
+# Number of long-lived crawler processes used by the site scraper. Defaults to one per core.
+MAX_CRAWLER_PROCESSES = int(os.environ.get('MAX_CRAWLER_PROCESSES', os.cpu_count() or 1))
+# The maximum number of concurrent requests of each crawled website. A crawler process makes at most
+# MAX_PARALLELISM_SITE_SCRAPER times as many requests at once.
+MAX_CONCURRENT_REQUESTS_PER_SITE = 16
+# The maximum number of concurrent requests to a single host. Each host starts low and is ramped up to this
+# cap while it answers fast, and backed off when it slows down or answers with 429/503.
+MAX_CONCURRENT_REQUESTS_PER_HOST = 8
+# The number of laws searched for on Bing at once, and the maximum rate of the calls to Bing. Set the rate to the
+# transactions per second of the Bing tier of the subscription key.
+BING_SEARCH_CONCURRENCY = 8
+BING_REQUESTS_PER_SECOND = float(os.environ.get('BING_REQUESTS_PER_SECOND', 3))
+# The time the results of a Bing search are reused for between runs, and the time a search without results is.
+BING_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+BING_CACHE_NEGATIVE_TTL_SECONDS = 24 * 60 * 60
+# The number of PDFs of laws downloaded at once, and from a single host.
+LAW_DOWNLOAD_CONCURRENCY = 8
+MAX_LAW_DOWNLOADS_PER_HOST = 2
+# The number of crawled pages uploaded at once, and the number of pages uploaded together in a batch.
+MAX_CONCURRENT_PAGE_WRITES = 16
+PAGE_WRITE_BATCH_SIZE = 100
+# The maximum size of the local copies of the input files read from S3, kept in the crawl state directory.
+FILE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# How the crawled pages are stored: files (a .txt file per page) or shards (compressed shards per website, of about
+# SHARD_TARGET_BYTES each).
+SITE_OUTPUT_FORMAT = os.environ.get('SITE_OUTPUT_FORMAT', 'files')
+SHARD_TARGET_BYTES = 64 * 1024 * 1024
 # The time to sleep between runs of the root driver in seconds. Currently set to 1 hour (i.e. 3600 seconds).
 TIME_SLEEP_SECONDS = 60 * 60
 # The base directory where all the files will be stored.
 BASE_DIR = os.environ.get('BASE_DIR', "s3://decoverlaws")
+# The local directory where the crawl state (HTTP validators etc.) is kept between runs.
+CRAWL_STATE_DIR = os.environ.get('CRAWL_STATE_DIR', 'crawl_state')
 # The path to the metadata file for the laws
 LAWS_METADATA_FILE_PATH = f'{BASE_DIR}/metadata/laws_input.csv'
 SITE_SCRAPER_METADATA_FILE_PATH = f'{BASE_DIR}/metadata/site_scraper_input.csv'
@@ -79,6 +109,21 @@ def trigger_run(scrape_laws: bool = True, scrape_websites: bool = True):
         max_laws=max_laws,
         max_websites=max_websites,
         site_scraper_parallelism=MAX_PARALLELISM_SITE_SCRAPER,
+        crawler_processes=MAX_CRAWLER_PROCESSES,
+        state_dir=CRAWL_STATE_DIR,
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS_PER_SITE,
+        max_concurrent_requests_per_host=MAX_CONCURRENT_REQUESTS_PER_HOST,
+        bing_search_concurrency=BING_SEARCH_CONCURRENCY,
+        bing_requests_per_second=BING_REQUESTS_PER_SECOND,
+        bing_cache_ttl_seconds=BING_CACHE_TTL_SECONDS,
+        bing_cache_negative_ttl_seconds=BING_CACHE_NEGATIVE_TTL_SECONDS,
+        law_download_concurrency=LAW_DOWNLOAD_CONCURRENCY,
+        max_law_downloads_per_host=MAX_LAW_DOWNLOADS_PER_HOST,
+        max_concurrent_page_writes=MAX_CONCURRENT_PAGE_WRITES,
+        page_write_batch_size=PAGE_WRITE_BATCH_SIZE,
+        file_cache_max_bytes=FILE_CACHE_MAX_BYTES,
+        site_output_format=SITE_OUTPUT_FORMAT,
+        shard_target_bytes=SHARD_TARGET_BYTES,
         laws_metadata_file_path=LAWS_METADATA_FILE_PATH,
         site_scraper_metadata_file_path=SITE_SCRAPER_METADATA_FILE_PATH).run()
     logging.info(
@@ -146,7 +191,17 @@ def handle_laws_status():
 def handle_status():
     # Renders the status page to indicate the build-status of the laws and websites
     crawler_runs = CrawlerRun.query.order_by(CrawlerRun.id.desc()).all()
-    return render_template('status.html', crawler_runs=crawler_runs)
+    cache_hits = int(metrics.BING_CACHE_LOOKUPS.get(result='hit'))
+    cache_misses = int(metrics.BING_CACHE_LOOKUPS.get(result='miss'))
+    cache_hit_rate = cache_hits / (cache_hits + cache_misses) if cache_hits + cache_misses > 0 else None
+    return render_template('status.html', crawler_runs=crawler_runs, cache_hits=cache_hits,
+                           cache_misses=cache_misses, cache_hit_rate=cache_hit_rate)
+
+
+@app.route('/metrics')
+def handle_metrics():
+    # Exports the live counters and histograms of the crawl in the Prometheus text format.
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route('/api/v1/index')
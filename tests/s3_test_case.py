@@ -0,0 +1,37 @@
+import os
+import unittest
+from unittest import mock
+
+from moto import mock_aws
+
+from drivers.utilities import s3_client
+
+TEST_BUCKET = 'test-bucket'
+
+
+class S3TestCase(unittest.TestCase):
+    """
+    A test case backed by a moto S3, with an empty TEST_BUCKET. The shared boto3 client is created in the mock.
+    """
+
+    def setUp(self):
+        self.environment = mock.patch.dict(os.environ, {'S3_DEFAULT_REGION': 'us-east-1',
+                                                        'AWS_ACCESS_KEY_ID': 'testing',
+                                                        'AWS_SECRET_ACCESS_KEY': 'testing'})
+        self.environment.start()
+        self.mock = mock_aws()
+        self.mock.start()
+        s3_client.shared_s3_client = None
+        self.s3 = s3_client.get_shared_s3_client(s3_client.S3Config())
+        self.s3.create_bucket(Bucket=TEST_BUCKET)
+
+    def tearDown(self):
+        s3_client.shared_s3_client = None
+        self.mock.stop()
+        self.environment.stop()
+
+    def put_object(self, key: str, body: bytes):
+        self.s3.put_object(Bucket=TEST_BUCKET, Key=key, Body=body)
+
+    def get_object(self, key: str) -> bytes:
+        return self.s3.get_object(Bucket=TEST_BUCKET, Key=key)['Body'].read()
@@ -0,0 +1,78 @@
+import unittest
+from types import SimpleNamespace
+
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+from drivers.crawler.adaptive_throttle import AdaptiveThrottle
+
+SETTINGS = {'ADAPTIVE_THROTTLE_ENABLED': True, 'ADAPTIVE_THROTTLE_TARGET_LATENCY': 1.0,
+            'ADAPTIVE_THROTTLE_START_CONCURRENCY': 4, 'ADAPTIVE_THROTTLE_MAX_DELAY': 30.0,
+            'CONCURRENT_REQUESTS_PER_DOMAIN': 8, 'DOWNLOAD_DELAY': 0.25}
+
+
+class AdaptiveThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.crawler = get_crawler(settings_dict=SETTINGS)
+        self.crawler.stats.open_spider(None)
+        self.slot = Slot(concurrency=8, delay=0.25, randomize_delay=False)
+        self.crawler.engine = SimpleNamespace(downloader=SimpleNamespace(slots={'www.example.gov': self.slot}))
+        self.throttle = AdaptiveThrottle.from_crawler(self.crawler)
+        self.request = Request('https://www.example.gov/a', meta={'download_slot': 'www.example.gov'})
+        self.throttle.request_reached_downloader(self.request, None)
+
+    def respond(self, status: int, latency: float = 0.1, headers=None) -> None:
+        self.request.meta['download_latency'] = latency
+        response = Response(self.request.url, status=status, headers=headers, request=self.request)
+        self.assertIs(self.throttle.process_response(self.request, response, None), response)
+
+    def test_disabled(self):
+        with self.assertRaises(NotConfigured):
+            AdaptiveThrottle.from_crawler(get_crawler(settings_dict={'ADAPTIVE_THROTTLE_ENABLED': False}))
+
+    def test_start_concurrency(self):
+        self.assertEqual(self.slot.concurrency, 4)
+
+    def test_back_off_on_429_and_503(self):
+        self.respond(429)
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (2, 1.0))
+        self.respond(503)
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (1, 2.0))
+        self.respond(503)
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (1, 4.0))
+        self.assertEqual(self.crawler.stats.get_value('adaptive_throttle/backoffs'), 3)
+
+    def test_back_off_to_retry_after(self):
+        self.respond(429, headers={'Retry-After': '10'})
+        self.assertEqual(self.slot.delay, 10.0)
+        # The delay never exceeds the maximum, and a Retry-After date is ignored.
+        self.respond(429, headers={'Retry-After': '120'})
+        self.assertEqual(self.slot.delay, 30.0)
+        self.respond(503, headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        self.assertEqual(self.slot.delay, 30.0)
+
+    def test_recover_after_back_off(self):
+        self.respond(429)
+        self.assertEqual(self.slot.delay, 1.0)
+        # Fast responses halve the delay down to DOWNLOAD_DELAY, and grow the concurrency of a saturated slot.
+        self.slot.active.update(Request(f'https://www.example.gov/{i}') for i in range(8))
+        for _ in range(4):
+            self.respond(200)
+        self.assertEqual(self.slot.delay, 0.25)
+        self.assertEqual(self.slot.concurrency, 6)
+
+    def test_slow_responses_shrink_concurrency(self):
+        for _ in range(2):
+            self.respond(200, latency=5.0)
+        self.assertEqual(self.slot.concurrency, 2)
+
+    def test_exceptions_shrink_concurrency(self):
+        self.throttle.process_exception(self.request, IOError(), None)
+        self.assertEqual(self.slot.concurrency, 3)
+        self.assertEqual(self.crawler.stats.get_value('adaptive_throttle/errors'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from drivers.utilities.bing_client import BingClient, extract_news_info, extract_webpage_info
+from drivers.utilities.search_cache import SearchCache
+
+
+class FakeResponse:
+    def __init__(self, data: dict):
+        self.data = data
+        self.status_code = 200
+        self.headers = {}
+
+    def json(self) -> dict:
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    # Answers every call with the same response, and counts the calls.
+    def __init__(self, data: dict):
+        self.data = data
+        self.calls = 0
+
+    def get(self, url, **kwargs) -> FakeResponse:
+        self.calls += 1
+        return FakeResponse(self.data)
+
+
+class BingClientTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SearchCache(os.path.join(self.directory.name, 'bing_cache.db'))
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_extract_without_results(self):
+        # Bing leaves webPages (and the value of news) out when a query has no results.
+        self.assertEqual(extract_webpage_info({'_type': 'SearchResponse', 'queryContext': {}}), [])
+        self.assertEqual(extract_news_info({'_type': 'News'}), [])
+
+    def test_search_without_results_is_cached(self):
+        client = BingClient(requests_per_second=0, cache=self.cache)
+        client.session = FakeSession({'_type': 'SearchResponse', 'queryContext': {'originalQuery': 'no such law'}})
+        self.assertEqual(client.search('no such law', 'India'), [])
+        self.assertEqual(client.search('no such law', 'India'), [])
+        self.assertEqual(client.session.calls, 1)
+        self.assertEqual(self.cache.get('web', 'no such law', 'en-IN'), [])
+
+    def test_search_with_results(self):
+        client = BingClient(requests_per_second=0, cache=self.cache)
+        client.session = FakeSession({'webPages': {'value': [
+            {'name': 'The Act', 'url': 'https://example.gov/act.pdf', 'snippet': 'An act.'}]}})
+        results = client.search('the act', 'United States')
+        self.assertEqual([(page.name, page.url) for page in results], [('The Act', 'https://example.gov/act.pdf')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+
+from drivers.common.parsed_object import ParsedObject
+from drivers.utilities.content_index import ContentIndex
+
+
+def parsed_object(source_url: str, file_url: str, content_hash: str) -> ParsedObject:
+    return ParsedObject(file_url=file_url, jurisdiction='usa', source_url=source_url, category='site',
+                        hash=content_hash, title='example.gov')
+
+
+class ContentIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.content_index = ContentIndex(os.path.join(self.directory.name, 'content_index.db'))
+
+    def tearDown(self):
+        self.content_index.close()
+        self.directory.cleanup()
+
+    def test_count_sources(self):
+        self.content_index.put(parsed_object('example.gov/a', 's3://bucket/site/1.txt', '1'))
+        self.content_index.put(parsed_object('example.gov/b', 's3://bucket/site/1.txt', '1'))
+        self.assertEqual(self.content_index.count_sources('s3://bucket/site/1.txt'), 2)
+        # The content of a page changed.
+        self.content_index.put(parsed_object('example.gov/a', 's3://bucket/site/2.txt', '2'))
+        self.assertEqual(self.content_index.count_sources('s3://bucket/site/1.txt'), 1)
+        self.content_index.put(parsed_object('example.gov/b', 's3://bucket/site/2.txt', '2'))
+        self.assertEqual(self.content_index.count_sources('s3://bucket/site/1.txt'), 0)
+        self.assertEqual(self.content_index.find_file('s3://bucket/site', '2'), 's3://bucket/site/2.txt')
+
+
+if __name__ == '__main__':
+    unittest.main()
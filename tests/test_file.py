@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+from drivers.utilities.file import File
+from tests.s3_test_case import S3TestCase, TEST_BUCKET
+
+CONTENTS = b'<html><body>An act.</body></html>' * 100
+
+
+def spooled_file(contents: bytes) -> tempfile.SpooledTemporaryFile:
+    in_file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    in_file.write(contents)
+    in_file.seek(0)
+    return in_file
+
+
+class FileWriteTest(S3TestCase):
+    def test_write_spooled_file_locally(self):
+        with tempfile.TemporaryDirectory() as directory, spooled_file(CONTENTS) as in_file:
+            file_path = os.path.join(directory, 'site', 'page.txt')
+            File().write(in_file, file_path)
+            with open(file_path, 'rb') as f:
+                self.assertEqual(f.read(), CONTENTS)
+
+    def test_write_spooled_file_to_s3(self):
+        with spooled_file(CONTENTS) as in_file:
+            File().write(in_file, f's3://{TEST_BUCKET}/site/page.txt')
+        self.assertEqual(self.get_object('site/page.txt'), CONTENTS)
+
+    def test_write_many_spooled_files_to_s3(self):
+        with spooled_file(CONTENTS) as first, spooled_file(b'{}') as second:
+            failed = File().write_many([(f's3://{TEST_BUCKET}/site/first.txt', first),
+                                        (f's3://{TEST_BUCKET}/site/second.json', second)])
+        self.assertEqual(failed, {})
+        self.assertEqual(self.get_object('site/first.txt'), CONTENTS)
+        self.assertEqual(self.get_object('site/second.json'), b'{}')
+
+
+class FileDeleteTest(S3TestCase):
+    def test_delete_from_s3(self):
+        file = File()
+        file.write('An act.', f's3://{TEST_BUCKET}/site/page.txt')
+        self.assertTrue(file.exists(f's3://{TEST_BUCKET}/site/page.txt'))
+        file.delete(f's3://{TEST_BUCKET}/site/page.txt')
+        self.assertFalse(file.exists(f's3://{TEST_BUCKET}/site/page.txt'))
+        self.assertEqual(self.s3.list_objects_v2(Bucket=TEST_BUCKET).get('KeyCount'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+from drivers.crawler.frontier import NEW_URL_PRIORITY, BloomFilter, Frontier
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_add(self):
+        bloom_filter = BloomFilter(capacity=1000)
+        self.assertTrue(bloom_filter.add('https://www.example.gov/a'))
+        self.assertFalse(bloom_filter.add('https://www.example.gov/a'))
+        self.assertIn('https://www.example.gov/a', bloom_filter)
+        self.assertNotIn('https://www.example.gov/b', bloom_filter)
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bloom_filter = BloomFilter(os.path.join(directory, 'seen.bloom'), capacity=1000)
+            bloom_filter.add('https://www.example.gov/a')
+            bloom_filter.close()
+            bloom_filter = BloomFilter(os.path.join(directory, 'seen.bloom'), capacity=1000)
+            self.assertIn('https://www.example.gov/a', bloom_filter)
+            bloom_filter.close()
+
+
+class FrontierTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.frontier = Frontier(self.directory.name)
+
+    def tearDown(self):
+        self.frontier.close()
+        self.directory.cleanup()
+
+    def reopen(self):
+        self.frontier.close()
+        self.frontier = Frontier(self.directory.name)
+
+    def test_add_deduplicates_canonical_urls(self):
+        added = self.frontier.add(['https://www.example.gov/a/', 'HTTPS://WWW.EXAMPLE.GOV/a#section-1',
+                                   'https://www.example.gov/a?utm_source=mail', 'https://www.example.gov/b'])
+        self.assertEqual(added, [('https://www.example.gov/a/', NEW_URL_PRIORITY),
+                                 ('https://www.example.gov/b', NEW_URL_PRIORITY)])
+        self.assertEqual(self.frontier.add(['https://www.example.gov/b']), [])
+
+    def test_resume(self):
+        self.frontier.add(['https://www.example.gov/a', 'https://www.example.gov/b', 'https://www.example.gov/c'])
+        self.frontier.done('https://www.example.gov/a')
+        self.frontier.set_state('pages_crawled', 1)
+        # The crawl is interrupted, and resumed by the next run.
+        self.reopen()
+        self.assertEqual(sorted(url for url, _ in self.frontier.pending()),
+                         ['https://www.example.gov/b', 'https://www.example.gov/c'])
+        self.assertEqual(self.frontier.get_state('pages_crawled'), '1')
+        self.assertEqual(self.frontier.add(['https://www.example.gov/a', 'https://www.example.gov/b']), [])
+
+    def test_reset(self):
+        self.frontier.add(['https://www.example.gov/a', 'https://www.example.gov/b'])
+        self.frontier.done('https://www.example.gov/a')
+        self.frontier.done('https://www.example.gov/b', crawled=False)
+        self.frontier.set_state('pages_crawled', 1)
+        # The crawl finished, the next one starts over but prefers the URLs that were never crawled.
+        self.frontier.reset()
+        self.reopen()
+        self.assertEqual(self.frontier.pending(), [])
+        self.assertIsNone(self.frontier.get_state('pages_crawled'))
+        self.assertEqual(self.frontier.add(['https://www.example.gov/a', 'https://www.example.gov/b']),
+                         [('https://www.example.gov/a', 0), ('https://www.example.gov/b', NEW_URL_PRIORITY)])
+        self.assertEqual(self.frontier.pending()[0], ('https://www.example.gov/b', NEW_URL_PRIORITY))
+
+    def test_in_memory(self):
+        frontier = Frontier()
+        self.assertEqual(frontier.add(['https://www.example.gov/a', 'https://www.example.gov/a/']),
+                         [('https://www.example.gov/a', 0)])
+        self.assertEqual(frontier.add(['https://www.example.gov/b'], priority=5), [('https://www.example.gov/b', 5)])
+        frontier.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import unittest
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.legal_pages import generate_legal_page
+from drivers.crawler.utils.helper_methods import get_text_from_html
+from drivers.crawler.utils.html_extractor import extract_page
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'statute_page.html')
+
+
+class ExtractPageTest(unittest.TestCase):
+    def assert_same_as_previous_extraction(self, response: HtmlResponse):
+        # The text and links that DecoverSpider.parse extracted before extract_page.
+        page = extract_page(response.text, response.url)
+        self.assertEqual(page.text, get_text_from_html(response.xpath('//body').get()))
+        self.assertEqual(page.links, [response.urljoin(link.extract()) for link in response.xpath('//a/@href')])
+
+    def test_fixture_page(self):
+        with open(FIXTURE_PATH, 'rb') as f:
+            response = HtmlResponse(url='https://www.statutes.gov/chapter-12/index.html', body=f.read(),
+                                    encoding='utf-8')
+        self.assert_same_as_previous_extraction(response)
+        page = extract_page(response.text, response.url, pdf_filter='act-')
+        self.assertIn('Unfair trade practice', page.text)
+        self.assertNotIn('trackSection', page.text)
+        self.assertEqual(page.pdf_links, ['https://www.statutes.gov/documents/act-12.pdf?download=1'])
+
+    def test_generated_pages(self):
+        for page_id in range(5):
+            html = generate_legal_page(page_id, num_sections=10)
+            self.assert_same_as_previous_extraction(
+                HtmlResponse(url=f'https://www.statutes.gov/title-{page_id}.html', body=html.encode(),
+                             encoding='utf-8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from unittest import mock
+
+from drivers.content_indexer.indexer import Indexer
+from drivers.utilities.file import File
+from drivers.utilities.page_shards import INDEX_EXTENSION, ShardWriter, is_shard, read_record
+from tests.s3_test_case import S3TestCase, TEST_BUCKET
+
+SOURCE_DIR = f's3://{TEST_BUCKET}/usa/federal'
+
+
+class IndexerTest(S3TestCase):
+    def test_index_shards(self):
+        pages = {f'https://www.example.gov/page-{i}': f'The text of page {i}.' for i in range(5)}
+        # Two shards of the pages, and a page stored in a file of its own.
+        writer = ShardWriter(File(), f'{SOURCE_DIR}/example.gov/shards')
+        for i, (url, content) in enumerate(pages.items()):
+            writer.add({'url': url, 'hash': str(i), 'content': content})
+            if i == 2:
+                writer.flush()
+        writer.flush()
+        self.put_object('usa/federal/other.gov/0123.txt', b'The text of another page.')
+
+        indexer = Indexer(SOURCE_DIR, es_end_point='', cache_dir=None)
+        with mock.patch('drivers.content_indexer.indexer.MAX_DOCUMENTS_TO_INDEX', 100):
+            indexer.run()
+
+        documents = indexer.file_to_contents()
+        self.assertEqual(len(documents), len(pages) + 1)
+        self.assertEqual(documents['other.gov/0123.txt'], 'The text of another page.')
+        self.assertFalse(any(document.endswith(INDEX_EXTENSION) or is_shard(document) for document in documents))
+        # Every page of the shards can be read back on its own from its key.
+        records = [read_record(File(), f'{SOURCE_DIR}/{document}') for document in documents if '#' in document]
+        self.assertEqual({record['url']: record['content'] for record in records}, pages)
+        self.assertEqual({documents[document] for document in documents if '#' in document}, set(pages.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
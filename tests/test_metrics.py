@@ -0,0 +1,79 @@
+import pickle
+import unittest
+
+from drivers.utilities.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def create_metrics(registry: MetricsRegistry):
+    return (Counter('pages_total', 'Pages.', ['outcome'], registry=registry),
+            Histogram('latency_seconds', 'Latency.', ['host'], buckets=(0.1, 1.0), registry=registry),
+            Gauge('queue_depth', 'Queue depth.', registry=registry))
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def setUp(self):
+        # The same metrics in a crawler process and in the parent process.
+        self.child = MetricsRegistry()
+        self.child_pages, self.child_latency, self.child_queue_depth = create_metrics(self.child)
+        self.parent = MetricsRegistry()
+        self.pages, self.latency, self.queue_depth = create_metrics(self.parent)
+
+    def test_take_merge_round_trip(self):
+        self.child_pages.inc(outcome='written')
+        self.child_pages.inc(2, outcome='written')
+        self.child_pages.inc(outcome='failed')
+        self.child_latency.observe(0.05, host='a.gov')
+        self.child_latency.observe(0.5, host='a.gov')
+        self.child_latency.observe(5.0, host='b.gov')
+        self.child_queue_depth.set(7)
+
+        values = pickle.loads(pickle.dumps(self.child.take()))
+        self.parent.merge(values)
+        self.assertEqual(self.pages.get(outcome='written'), 3)
+        self.assertEqual(self.pages.get(outcome='failed'), 1)
+        rendered = self.parent.render()
+        self.assertIn('latency_seconds_bucket{host="a.gov",le="0.1"} 1.0', rendered)
+        self.assertIn('latency_seconds_bucket{host="a.gov",le="1.0"} 2.0', rendered)
+        self.assertIn('latency_seconds_bucket{host="a.gov",le="+Inf"} 2.0', rendered)
+        self.assertIn('latency_seconds_sum{host="a.gov"} 0.55', rendered)
+        self.assertIn('latency_seconds_count{host="b.gov"} 1.0', rendered)
+        # Gauges are not shipped.
+        self.assertNotIn('\nqueue_depth ', rendered)
+
+        # The values are taken once, and the next take only has what was counted since.
+        self.assertEqual(self.child.take(), [])
+        self.child_pages.inc(outcome='written')
+        self.child_latency.observe(0.05, host='a.gov')
+        self.parent.merge(self.child.take())
+        self.assertEqual(self.pages.get(outcome='written'), 4)
+        self.assertIn('latency_seconds_count{host="a.gov"} 3.0', self.parent.render())
+
+    def test_merge_ignores_unknown_metrics(self):
+        self.parent.merge([('unknown_total', (), 1.0)])
+        self.assertNotIn('unknown_total', self.parent.render())
+
+    def test_reset(self):
+        self.child_pages.inc(outcome='written')
+        self.child.reset()
+        self.assertEqual(self.child.take(), [])
+
+    def test_labels(self):
+        with self.assertRaises(ValueError):
+            self.pages.inc(status='200')
+        with self.assertRaises(ValueError):
+            Counter('pages_total', 'Pages.', registry=self.parent)
+
+    def test_render(self):
+        self.pages.inc(outcome='a "quoted"\nvalue')
+        self.queue_depth.set(3)
+        self.assertEqual(self.parent.render().splitlines()[:5], [
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            '# HELP pages_total Pages.',
+            '# TYPE pages_total counter',
+            'pages_total{outcome="a \\"quoted\\"\\nvalue"} 1.0'])
+        self.assertIn('queue_depth 3.0', self.parent.render())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from drivers.utilities.rate_limiter import HostLimiter, TokenBucket
+
+
+class FakeClock:
+    """
+    A monotonic clock that only moves when slept on.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('drivers.utilities.rate_limiter.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rate(self):
+        bucket = TokenBucket(rate=4)
+        start = self.clock.now
+        for _ in range(9):
+            bucket.acquire()
+        # The first call takes the initial token, the next ones one every 1/4 second.
+        self.assertAlmostEqual(self.clock.now - start, 2.0)
+        self.assertEqual(len(self.clock.sleeps), 8)
+
+    def test_burst(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+        # An idle bucket refills up to its capacity only.
+        self.clock.now += 60
+        for _ in range(4):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+    def test_disabled(self):
+        bucket = TokenBucket(rate=0)
+        for _ in range(100):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+
+class TokenBucketThreadsTest(unittest.TestCase):
+    def test_rate_across_threads(self):
+        bucket = TokenBucket(rate=50)
+        start = time.monotonic()
+        threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)]) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 25 calls at 50 per second, the first one without waiting.
+        self.assertGreaterEqual(time.monotonic() - start, 24 / 50 - 0.01)
+
+
+class HostLimiterTest(unittest.TestCase):
+    def test_limit(self):
+        limiter = HostLimiter(max_per_host=2)
+        active, max_active = {}, {}
+        lock = threading.Lock()
+        barrier = threading.Barrier(6)
+
+        def call(host):
+            barrier.wait()
+            with limiter.limit(host):
+                with lock:
+                    active[host] = active.get(host, 0) + 1
+                    max_active[host] = max(max_active.get(host, 0), active[host])
+                time.sleep(0.05)
+                with lock:
+                    active[host] -= 1
+
+        threads = [threading.Thread(target=call, args=(host,)) for host in ['a.gov'] * 4 + ['b.gov'] * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(max_active['a.gov'], 2)
+        self.assertLessEqual(max_active['b.gov'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+from drivers.utilities.file import File
+from drivers.utilities.s3_client import S3Client
+from tests.s3_test_case import S3TestCase, TEST_BUCKET
+
+
+class S3ClientTest(S3TestCase):
+    def test_read_text_file(self):
+        contents = 'url,jurisdiction,category\r\nwww.example.gov,usa,site\r\n'
+        self.put_object('metadata/site_scraper_input.csv', contents.encode('utf-8'))
+        self.assertEqual(File().read(f's3://{TEST_BUCKET}/metadata/site_scraper_input.csv'),
+                         contents.replace('\r\n', '\n'))
+
+    def test_open_file_if_modified(self):
+        self.put_object('laws/act.txt', b'An act.')
+        client = S3Client()
+        in_file, etag = client.open_file_if_modified(f's3://{TEST_BUCKET}/laws/act.txt')
+        with in_file:
+            self.assertEqual(in_file.read(), b'An act.')
+        self.assertIsNone(client.open_file_if_modified(f's3://{TEST_BUCKET}/laws/act.txt', etag))
+
+
+if __name__ == '__main__':
+    unittest.main()
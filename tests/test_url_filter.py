@@ -0,0 +1,63 @@
+import unittest
+
+from drivers.crawler.url_filter import (FILTERED, OFFSITE, TRAP_DEPTH, TRAP_QUERY_PARAMETERS, TRAP_QUERY_VARIANTS,
+                                        TRAP_REPEATED_SEGMENT, UrlFilter)
+from drivers.crawler.utils.helper_methods import get_canonical_url
+
+
+class CanonicalUrlTest(unittest.TestCase):
+    def test_canonical_url(self):
+        cases = {
+            'HTTPS://WWW.Example.GOV/Statutes/': 'https://www.example.gov/Statutes',
+            'http://www.example.gov:80/a': 'http://www.example.gov/a',
+            'https://www.example.gov:443/a': 'https://www.example.gov/a',
+            'https://www.example.gov:8443/a': 'https://www.example.gov:8443/a',
+            'https://www.example.gov/a#section-1': 'https://www.example.gov/a',
+            'https://www.example.gov//title-1///section-2': 'https://www.example.gov/title-1/section-2',
+            'https://www.example.gov': 'https://www.example.gov/',
+            'https://www.example.gov/a;jsessionid=0A1B2C': 'https://www.example.gov/a',
+            'https://www.example.gov/a?b=2&a=1': 'https://www.example.gov/a?a=1&b=2',
+            'https://www.example.gov/a?utm_source=mail&page=2&gclid=x&PHPSESSID=1':
+                'https://www.example.gov/a?page=2',
+            'https://www.example.gov/a?q=': 'https://www.example.gov/a?q=',
+            '  https://www.example.gov/a  ': 'https://www.example.gov/a',
+        }
+        for url, canonical_url in cases.items():
+            with self.subTest(url=url):
+                self.assertEqual(get_canonical_url(url), canonical_url)
+                self.assertEqual(get_canonical_url(canonical_url), canonical_url)
+
+
+class UrlFilterTest(unittest.TestCase):
+    def test_hosts(self):
+        url_filter = UrlFilter(['example.gov', ' .Courts.gov '])
+        self.assertIsNone(url_filter.check('https://example.gov/a'))
+        self.assertIsNone(url_filter.check('https://www.EXAMPLE.gov/a'))
+        self.assertIsNone(url_filter.check('https://supreme.courts.gov/a'))
+        self.assertEqual(url_filter.check('https://badexample.gov/a'), OFFSITE)
+        self.assertEqual(url_filter.check('https://example.gov.evil.com/a'), OFFSITE)
+        self.assertIsNone(UrlFilter().check('https://anything.com/a'))
+
+    def test_filter(self):
+        url_filter = UrlFilter(['example.gov'], url_filter='/statutes/')
+        self.assertIsNone(url_filter.check('https://www.example.gov/statutes/title-1'))
+        self.assertEqual(url_filter.check('https://www.example.gov/cases/1'), FILTERED)
+
+    def test_traps(self):
+        url_filter = UrlFilter(max_path_depth=4, max_segment_repeats=2, max_query_parameters=3,
+                               max_query_variants_per_path=2)
+        self.assertIsNone(url_filter.check('https://www.example.gov/a/b/c/d'))
+        self.assertEqual(url_filter.check('https://www.example.gov/a/b/c/d/e'), TRAP_DEPTH)
+        self.assertIsNone(url_filter.check('https://www.example.gov/a/b/a'))
+        self.assertEqual(url_filter.check('https://www.example.gov/a/a/a'), TRAP_REPEATED_SEGMENT)
+        self.assertIsNone(url_filter.check('https://www.example.gov/search?a=1&b=2&c=3'))
+        self.assertEqual(url_filter.check('https://www.example.gov/search?a=1&b=2&c=3&d=4'), TRAP_QUERY_PARAMETERS)
+        self.assertIsNone(url_filter.check('https://www.example.gov/calendar?month=1'))
+        self.assertIsNone(url_filter.check('https://www.example.gov/calendar?month=2'))
+        # A query that was already followed is not a new variant, even spelled differently.
+        self.assertIsNone(url_filter.check('https://www.example.gov/calendar?month=1&utm_source=mail'))
+        self.assertEqual(url_filter.check('https://www.example.gov/calendar?month=3'), TRAP_QUERY_VARIANTS)
+
+
+if __name__ == '__main__':
+    unittest.main()